@@ -0,0 +1,120 @@
+"""Compare the record + codec serialization path with plain dicts and pretty-printed json.
+
+Encodes and decodes the emails and action entries of a synthetic mailbox.
+The baseline is the original path: dicts written with json.dumps(indent=4)
+and read back with json.loads. It is compared with EmailRecord and
+ActionRecord through every codec in src.codec that is installed. Reports
+throughput, encoded size, and the memory the decoded objects keep alive,
+per 10k emails. Run from the repository root:
+
+    python -m benchmarks.bench_codec
+    python -m benchmarks.bench_codec --count 50000 --body-size 4000
+"""
+import gc
+import json
+import time
+import argparse
+import tracemalloc
+
+from benchmarks.fake_google import action_entry, make_message
+from src import codec
+from src.gmail_api import parse_message
+from src.records import ActionRecord, EmailRecord
+
+PER = 10_000
+
+
+class DictJson:
+    """The original path: plain dicts, pretty-printed by the standard library."""
+
+    name = "dict + json indent=4"
+
+    def encode(self, emails, actions):
+        return json.dumps({"emails": emails, "actions": actions}, indent=4).encode("utf-8")
+
+    def decode(self, data):
+        document = json.loads(data)
+        return document["emails"], document["actions"]
+
+    def convert(self, emails, actions):
+        return [dict(email) for email in emails], [dict(entry) for entry in actions]
+
+
+class RecordCodec:
+    """EmailRecord and ActionRecord through one of src.codec's codecs."""
+
+    def __init__(self, codec_name):
+        self.codec = codec.CODECS[codec_name]()
+        self.name = f"records + {codec_name}"
+
+    def encode(self, emails, actions):
+        return self.codec.dumpb({"emails": emails, "actions": actions})
+
+    def decode(self, data):
+        document = self.codec.loads(data)
+        return (
+            [EmailRecord.from_dict(email) for email in document["emails"]],
+            [ActionRecord.from_dict(entry) for entry in document["actions"]],
+        )
+
+    def convert(self, emails, actions):
+        return emails, actions
+
+
+def paths():
+    found = [DictJson()]
+    for name in codec.CODECS:
+        try:
+            found.append(RecordCodec(name))
+        except ImportError:
+            print(f"({name} is not installed; skipped)")
+    return found
+
+
+def best_of(repeat, func):
+    """The fastest of repeat timed calls, and the last result."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def retained(func):
+    """Bytes still allocated once func() has returned, holding its result; and its peak."""
+    gc.collect()
+    tracemalloc.start()
+    result = func()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return current, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=PER, help="synthetic emails to encode")
+    parser.add_argument("--body-size", type=int, default=2000, help="characters per synthetic email body")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per measurement; the fastest counts")
+    args = parser.parse_args()
+
+    emails = [parse_message(make_message(f"msg{index:06d}", index, args.body_size)) for index in range(args.count)]
+    actions = [ActionRecord.from_dict(action_entry(email["id"])) for email in emails]
+    scale = PER / args.count
+
+    print(f"{args.count} emails, figures per {PER}")
+    print(f"{'path':<22} {'encode ms':>10} {'decode ms':>10} {'size MB':>8} {'kept MB':>8} {'peak MB':>8}")
+    for path in paths():
+        source_emails, source_actions = path.convert(emails, actions)
+        encode_seconds, data = best_of(args.repeat, lambda: path.encode(source_emails, source_actions))
+        decode_seconds, _ = best_of(args.repeat, lambda: path.decode(data))
+        kept, peak = retained(lambda: path.decode(data))
+        print(
+            f"{path.name:<22} {encode_seconds * 1000 * scale:>10.1f} {decode_seconds * 1000 * scale:>10.1f} "
+            f"{len(data) / 2 ** 20 * scale:>8.2f} {kept / 2 ** 20 * scale:>8.2f} {peak / 2 ** 20 * scale:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Compare sequential and batched Gmail message fetches against a fake Gmail service.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_gmail_fetch
+"""
+import argparse
+import time
+from unittest.mock import patch
+
+from benchmarks.fake_google import FakeGmailService
+from src import rate_limit
+from src.gmail_api import fetch_unread_emails, list_message_ids, parse_message
+
+
+def fetch_sequential(service, max_results):
+    """The original fetch loop: one get round trip per message."""
+    emails = []
+    for message_id in list_message_ids(service, "", max_results=max_results):
+        msg = service.users().messages().get(userId="me", id=message_id).execute()
+        emails.append(parse_message(msg))
+    return emails
+
+
+def fetch_batched(service, max_results):
+    """The batched path, with concurrent batches (the fake needs no real connection)."""
+    return fetch_unread_emails(service, max_results=max_results, http_factory=object)
+
+
+def run(label, fetch, count, latency):
+    service = FakeGmailService(count, latency=latency)
+    start = time.perf_counter()
+    emails = fetch(service, count)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{label:<10} {count:>6} emails  {elapsed:8.3f}s  "
+        f"{len(emails) / elapsed:10.1f} emails/s  {service.round_trips:>5} round trips"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--latency", type=float, default=0.02, help="simulated round trip in seconds")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    args = parser.parse_args()
+
+    # Client-side quotas would throttle only the batched path, which goes through src/rate_limit.py
+    with patch.object(rate_limit, "API_LIMITS", dict.fromkeys(rate_limit.API_LIMITS)), patch.object(rate_limit, "_buckets", {}):
+        for count in args.sizes:
+            run("sequential", fetch_sequential, count, args.latency)
+            run("batched", fetch_batched, count, args.latency)
+
+
+if __name__ == "__main__":
+    main()
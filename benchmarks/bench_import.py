@@ -0,0 +1,87 @@
+"""Measure the cold-start import time of the app with python -X importtime.
+
+Imports main in a fresh interpreter per run, and reports the median total
+import time, the slowest top-level imports, and any SDK from
+src.config.HEAVY_MODULES that was imported eagerly. Run from the repository
+root:
+
+    python -m benchmarks.bench_import
+    python -m benchmarks.bench_import --json import.json
+    python -m benchmarks.bench_import --baseline import.json  # exits 1 on a regression
+"""
+import re
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+from src.config import HEAVY_MODULES
+
+# "import time: self [us] | cumulative | imported package", indented by nesting depth
+LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$")
+
+
+def import_once(module):
+    """Import module in a fresh interpreter; returns (its cumulative us, {direct import: us}, every module loaded)."""
+    code = f"import sys, {module}; print(' '.join(sorted(sys.modules)))"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True, check=True,
+    )
+    # Lines come in post-order: a module's imports are listed just before it, one level deeper
+    children = {}
+    for line in result.stderr.splitlines():
+        match = LINE.match(line)
+        if not match:
+            continue
+        name, cumulative, depth = match.group(4), int(match.group(2)), len(match.group(3)) // 2
+        if depth == 1:
+            children[name] = cumulative
+        elif depth == 0:
+            if name == module:
+                return cumulative, children, set(result.stdout.split())
+            children = {}
+    raise RuntimeError(f"python -X importtime did not report {module}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main", help="module to import")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters to time")
+    parser.add_argument("--top", type=int, default=10, help="slowest direct imports to list")
+    parser.add_argument("--json", help="write the result to this file")
+    parser.add_argument("--baseline", help="compare against a result written earlier with --json")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression against the baseline")
+    args = parser.parse_args()
+
+    # The first run warms the bytecode cache and is not counted
+    import_once(args.module)
+    runs = [import_once(args.module) for _ in range(args.runs)]
+    total_ms = statistics.median(total for total, _, _ in runs) / 1000
+
+    print(f"import {args.module}: {total_ms:.1f} ms (median of {args.runs})")
+    _, children, loaded = runs[-1]
+    for name, us in sorted(children.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"  {us / 1000:9.1f} ms  {name}")
+
+    eager = [name for name in HEAVY_MODULES if name in loaded]
+    for name in eager:
+        print(f"EAGER {name} is imported at start-up; it should load on first use")
+
+    failed = bool(eager)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as json_file:
+            json.dump({"module": args.module, "import_ms": total_ms}, json_file, indent=4)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as json_file:
+            before = json.load(json_file)["import_ms"]
+        if total_ms > before * (1 + args.tolerance):
+            print(f"REGRESSION import {args.module}: {before:.1f} -> {total_ms:.1f} ms")
+            failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+"""End-to-end benchmarks of the organizer against in-process fakes of Google and Gemini.
+
+Drives get_unread_emails_logic, organize, get_tasks, update_calendar and the
+FastAPI routes in main.py over a synthetic mailbox, without any network
+access or accounts, and reports throughput, p50/p99 latency and peak memory
+per scenario. Run from the repository root:
+
+    python -m benchmarks.bench_organizer
+    python -m benchmarks.bench_organizer --sizes 10 100 1000 10000 --concurrency 8
+    python -m benchmarks.bench_organizer --json results.json
+    python -m benchmarks.bench_organizer --baseline results.json  # exits 1 on a regression
+"""
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import tempfile
+import tracemalloc
+from collections import OrderedDict
+from contextlib import ExitStack, contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import google.generativeai as genai
+from fastapi.testclient import TestClient
+
+import main as server
+from benchmarks.fake_google import FakeCalendarService, FakeGmailService, FakeTasksService, fake_gemini
+from src import gemini, metrics, rate_limit, storage, topic_cache
+from src.calendars import update_calendar
+from src.gemini import organize
+from src.gmail_api import MAX_EMAILS, get_unread_emails_logic
+from src.preferences_api import topics
+from src.tasks import get_tasks
+
+USER = "bench"
+# Social media ranks last, so the synthetic digests are settled locally
+GENERAL_PREFERENCES = {topic: rank for rank, topic in enumerate(topics, 1)}
+SPECIFIC_PREFERENCES = {f"Specific topic {number}": number for number in range(1, 11)}
+# Modules whose get_service / http_factory are swapped for the fakes
+SERVICE_MODULES = ["src.gmail_api", "src.gmail_watch", "src.tasks", "src.calendars", "src.pipeline"]
+HTTP_MODULES = ["src.gmail_api", "src.pipeline"]
+
+
+@contextmanager
+def fake_backends(count, args):
+    """Point every Google and Gemini client at fakes, and storage at a throwaway directory."""
+    with tempfile.TemporaryDirectory() as directory, ExitStack() as stack:
+        google = dict(latency=args.google_latency, error_rate=args.google_error_rate)
+        services = {
+            "gmail": FakeGmailService(count, page_size=500, body_size=args.body_size, thread_size=args.thread_size, **google),
+            "tasks": FakeTasksService(**google),
+            "calendar": FakeCalendarService(**google),
+        }
+        model = fake_gemini(
+            latency=args.gemini_latency,
+            chunk_latency=args.gemini_chunk_latency,
+            error_rate=args.gemini_error_rate,
+            reply_size=args.reply_size,
+        )
+
+        def get_service(api, version, user_id=None):
+            return services[api]
+
+        for module in SERVICE_MODULES:
+            stack.enter_context(patch(f"{module}.get_service", get_service))
+        for module in HTTP_MODULES:
+            # The fakes ignore the connection, so any object will do
+            stack.enter_context(patch(f"{module}.http_factory", lambda user_id=None: object))
+        stack.enter_context(patch.object(genai, "GenerativeModel", model))
+        stack.enter_context(patch.object(storage, "DATABASE_FILE", os.path.join(directory, "organize.db")))
+        # Suggestions remembered in memory belong to the previous size's database
+        stack.enter_context(patch.object(topic_cache, "_memory", OrderedDict()))
+        stack.enter_context(patch.object(storage, "LEGACY_FILES", {
+            key: os.path.join(directory, "missing") for key in storage.LEGACY_FILES
+        }))
+        # Fresh buckets and breakers per size; the real quotas would mostly measure sleeping
+        limits = dict(rate_limit.API_LIMITS) if args.real_quotas else dict.fromkeys(rate_limit.API_LIMITS)
+        stack.enter_context(patch.object(rate_limit, "API_LIMITS", limits))
+        stack.enter_context(patch.object(rate_limit, "_buckets", {}))
+        stack.enter_context(patch.object(rate_limit, "_breakers", {}))
+        stack.enter_context(patch.object(rate_limit, "BASE_DELAY", args.backoff))
+        # Models configured in earlier sizes belong to another fake
+        stack.enter_context(patch.object(gemini, "_contexts", {}))
+        metrics.reset()
+        yield SimpleNamespace(services=services, model=model)
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+def measure(name, count, run, repeat=1, track_memory=True):
+    """Time run() repeat times; run returns (items processed, per-request latencies or None)."""
+    if track_memory:
+        tracemalloc.start()
+    latencies = []
+    items = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        began = time.perf_counter()
+        processed, request_latencies = run()
+        items += processed
+        latencies.extend(request_latencies or [time.perf_counter() - began])
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] if track_memory else 0
+    if track_memory:
+        tracemalloc.stop()
+    return {
+        "scenario": name,
+        "emails": count,
+        "requests": len(latencies),
+        "throughput": items / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "peak_mb": peak / 2 ** 20,
+    }
+
+
+def once(func, items):
+    """Adapt a call for measure(): it processes items emails and has no per-request latencies."""
+    def run():
+        func()
+        return items, None
+    return run
+
+
+def concurrently(concurrency, requests, call):
+    """Issue requests calls from concurrency threads; returns per-call latencies."""
+    def timed(index):
+        began = time.perf_counter()
+        call(index)
+        return time.perf_counter() - began
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(timed, range(requests)))
+
+
+def checked(response):
+    if response.status_code >= 400:
+        raise RuntimeError(f"{response.request.method} {response.request.url} returned {response.status_code}: {response.text[:200]}")
+    return response
+
+
+def run_size(count, args):
+    """Run every scenario against a fresh fake mailbox of count emails."""
+    results = []
+    options = dict(track_memory=not args.no_memory)
+    users = [f"{USER}-{index}" for index in range(args.concurrency)]
+    with fake_backends(count, args) as env:
+        for user in [USER] + users:
+            storage.save_preferences(user, "general", GENERAL_PREFERENCES)
+            storage.save_preferences(user, "specific", SPECIFIC_PREFERENCES)
+
+        results.append(measure("get_unread_emails_logic", count, once(
+            lambda: get_unread_emails_logic(user_id=USER, max_results=count), count
+        ), repeat=args.repeat, **options))
+        results.append(measure("organize (cold cache)", count, once(lambda: organize(USER), count), **options))
+        results.append(measure("organize (warm cache)", count, once(lambda: organize(USER), count), repeat=args.repeat, **options))
+        results.append(measure("get_tasks", count, once(lambda: get_tasks(USER), count), repeat=args.repeat, **options))
+        results.append(measure("update_calendar", count, once(lambda: update_calendar(USER), count), repeat=args.repeat, **options))
+
+        # The routes keep the app's own cap on emails per fetch
+        routed = min(count, MAX_EMAILS)
+        with TestClient(server.app) as client:
+            results.append(measure("GET /emails", count, lambda: (
+                routed * args.concurrency,
+                concurrently(args.concurrency, args.concurrency, lambda index: checked(
+                    client.get("/emails", params={"user_id": users[index]})
+                )),
+            ), **options))
+            results.append(measure("GET /organizer", count, lambda: (
+                routed * args.concurrency,
+                concurrently(args.concurrency, args.concurrency, lambda index: checked(
+                    client.get("/organizer", params={"user_id": users[index]})
+                )),
+            ), **options))
+            requests = args.concurrency * 25
+            results.append(measure("POST /specific-topics", count, lambda: (
+                requests,
+                concurrently(args.concurrency, requests, lambda index: checked(
+                    client.post("/specific-topics", json={"top_preferences": topics[index % 3:index % 3 + 5]})
+                )),
+            ), **options))
+            results.append(measure("GET /metrics", count, lambda: (
+                requests,
+                concurrently(args.concurrency, requests, lambda index: checked(client.get("/metrics"))),
+            ), **options))
+
+        errors = sum(service.errors for service in env.services.values()) + env.model.errors
+        if errors:
+            retries = sum(value for (name, _), value in metrics._counters.items() if name == "retries_total")
+            print(f"  ({errors} simulated errors injected, {retries} retries, {env.model.calls} Gemini calls)")
+    return results
+
+
+def report(results):
+    print(f"{'scenario':<26} {'emails':>6} {'reqs':>5} {'throughput/s':>13} {'p50 ms':>9} {'p99 ms':>9} {'peak MB':>8}")
+    for result in results:
+        print(
+            f"{result['scenario']:<26} {result['emails']:>6} {result['requests']:>5} {result['throughput']:>13.1f} "
+            f"{result['p50_ms']:>9.1f} {result['p99_ms']:>9.1f} {result['peak_mb']:>8.1f}"
+        )
+
+
+def regressions(results, baseline, tolerance):
+    """Scenarios whose throughput fell or p99 latency rose by more than tolerance against the baseline."""
+    previous = {(result["scenario"], result["emails"]): result for result in baseline}
+    found = []
+    for result in results:
+        before = previous.get((result["scenario"], result["emails"]))
+        if before is None:
+            continue
+        if result["throughput"] < before["throughput"] * (1 - tolerance):
+            found.append(f"{result['scenario']} @ {result['emails']}: throughput {before['throughput']:.1f} -> {result['throughput']:.1f}/s")
+        if result["p99_ms"] > before["p99_ms"] * (1 + tolerance):
+            found.append(f"{result['scenario']} @ {result['emails']}: p99 {before['p99_ms']:.1f} -> {result['p99_ms']:.1f} ms")
+    return found
+
+
+def silence_consoles():
+    # Per-email progress lines would dominate the timings
+    for name, module in list(sys.modules.items()):
+        console = getattr(module, "console", None)
+        if name.startswith("src.") and console is not None:
+            console.quiet = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000], help="mailbox sizes to run")
+    parser.add_argument("--concurrency", type=int, default=4, help="parallel clients for the route scenarios")
+    parser.add_argument("--repeat", type=int, default=3, help="runs of the repeatable scenarios")
+    parser.add_argument("--google-latency", type=float, default=0.005, help="simulated Google round trip in seconds")
+    parser.add_argument("--google-error-rate", type=float, default=0.0, help="share of Google calls failing with 503")
+    parser.add_argument("--gemini-latency", type=float, default=0.05, help="simulated Gemini time to first token in seconds")
+    parser.add_argument("--gemini-chunk-latency", type=float, default=0.001, help="simulated time per streamed chunk")
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0, help="share of Gemini calls that fail")
+    parser.add_argument("--real-quotas", action="store_true", help="keep the client-side API quotas of src/rate_limit.py")
+    parser.add_argument("--backoff", type=float, default=0.01, help="base retry delay in seconds after a simulated error")
+    parser.add_argument("--body-size", type=int, default=2000, help="characters per synthetic email body")
+    parser.add_argument("--thread-size", type=int, default=1, help="consecutive synthetic messages per thread")
+    parser.add_argument("--reply-size", type=int, default=80, help="characters per suggested reply in Gemini answers")
+    parser.add_argument("--no-memory", action="store_true", help="skip tracemalloc, which slows large runs")
+    parser.add_argument("--verbose", action="store_true", help="keep the application's console output")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="compare against results written earlier with --json")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression against the baseline")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        silence_consoles()
+    results = []
+    for count in args.sizes:
+        print(f"\n{count} emails")
+        size_results = run_size(count, args)
+        report(size_results)
+        results.extend(size_results)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as json_file:
+            json.dump(results, json_file, indent=4)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as json_file:
+            found = regressions(results, json.load(json_file), args.tolerance)
+        for line in found:
+            print(f"REGRESSION {line}")
+        if found:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Measure how many Gemini calls the local pre-classifier removes.
+
+Runs the pre-classifier over the sample mailbox in docs/emails.json and over
+a synthetic corpus with a realistic mix of bulk and personal mail, and
+reports the fraction of emails and of chunked LLM requests it takes off the
+model. Run from the repository root:
+
+    python -m benchmarks.bench_preclassifier
+"""
+import argparse
+import json
+import random
+import time
+
+from src.gemini import chunk_emails
+from src.preclassifier import preclassify
+from src.preferences_api import topics
+
+# (share of the corpus, sender, subject, body, bulk headers)
+TEMPLATES = [
+    (0.22, "Quora Digest <digest-noreply@quora.com>", "Top stories for you: {n} answers", "Question: What happened to ... Read more", True),
+    (0.12, "Instagram <no-reply@mail.instagram.com>", "alex and {n} others liked your post", "See what your friends are up to", True),
+    (0.14, "Amazon.in <store-news@amazon.in>", "Up to {n}% off on headphones - deal of the day", "Shop the sale before it ends", True),
+    (0.06, "Myntra <updates@myntra.com>", "Your cart misses you: {n}% off", "Complete your order today", True),
+    (0.08, "FitLife <newsletter@fitlife.example>", "{n} workouts for a stronger core", "Your weekly fitness and health digest", True),
+    (0.10, "LinkedIn Job Alerts <jobalerts-noreply@linkedin.com>", "{n} new jobs: Software Engineer Intern", "Apply now to these positions", True),
+    (0.06, "Tech Weekly <newsletter@techweekly.example>", "AI release roundup #{n}", "This week's software launches", True),
+    (0.08, "Priya Sharma <priya@company.example>", "Meeting invite: design review #{n}", "Can we meet Thursday at 3pm? Please reply.", False),
+    (0.07, "Prof. Rao <rao@university.example>", "Assignment {n} deadline approaching", "Submit before Friday midnight.", False),
+    (0.07, "Sam <sam@gmail.com>", "Lunch on Saturday?", "Are you free for lunch, catch up after {n} weeks?", False),
+]
+
+def synthetic_corpus(count, seed=7):
+    """Generate emails following the TEMPLATES mix."""
+    rng = random.Random(seed)
+    weights = [template[0] for template in TEMPLATES]
+    corpus = []
+    for index in range(count):
+        _, sender, subject, body, bulk = rng.choices(TEMPLATES, weights=weights)[0]
+        n = rng.randint(2, 90)
+        corpus.append({
+            "id": f"synthetic{index:06d}",
+            "sender": sender,
+            "subject": subject.format(n=n),
+            "body": body.format(n=n),
+            "list_unsubscribe": bulk,
+            "precedence": "bulk" if bulk and rng.random() < 0.5 else "",
+        })
+    return corpus
+
+def report(label, emails, general_preferences, specific_preferences):
+    start = time.perf_counter()
+    local_actions, remaining = preclassify(emails, general_preferences, specific_preferences)
+    elapsed = time.perf_counter() - start
+    calls_before = len(chunk_emails(emails))
+    calls_after = len(chunk_emails(remaining)) if remaining else 0
+    print(
+        f"{label:<34} {len(emails):>6} emails  "
+        f"{len(local_actions) / len(emails):6.1%} settled locally  "
+        f"LLM calls {calls_before:>4} -> {calls_after:<4} ({1 - calls_after / calls_before:6.1%} fewer)  "
+        f"{elapsed / len(emails) * 1e6:7.1f} us/email"
+    )
+
+def load(path):
+    with open(path, "r", encoding="utf-8") as json_file:
+        return json.load(json_file)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=5000, help="size of the synthetic corpus")
+    args = parser.parse_args()
+
+    general = load("docs/general_preferences.json")
+    specific = load("docs/specific_preferences.json")
+    # A user who cares least about shopping and social media
+    ranking = [topic for topic in topics if topic not in ("Online shopping", "Social Media Notifications")]
+    shopping_last = {topic: rank for rank, topic in enumerate(ranking + ["Social Media Notifications", "Online shopping"], 1)}
+
+    report("sample mailbox, saved preferences", load("docs/emails.json"), general, specific)
+    report("synthetic, saved preferences", synthetic_corpus(args.count), general, specific)
+    report("synthetic, shopping/social last", synthetic_corpus(args.count), shopping_last, specific)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Measure push-driven processing: from new mail arriving to its tasks and events being written.
+
+Registers a Gmail watch through POST /gmail/watch against the in-process
+fakes, then delivers bursts of new mail. A stand-in Pub/Sub publisher POSTs
+each notification to /gmail/push, like a push subscription would. Reports
+the delivery-to-done latency per burst, the Gmail round trips it took,
+and the daily quota of staying current by push versus polling an idle
+mailbox. Run from the repository root:
+
+    python -m benchmarks.bench_push
+    python -m benchmarks.bench_push --bursts 50 --burst-size 5 --duplicate-rate 0.2
+"""
+import os
+import time
+import argparse
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+import main as server
+from benchmarks.bench_organizer import (
+    GENERAL_PREFERENCES,
+    SPECIFIC_PREFERENCES,
+    USER,
+    fake_backends,
+    percentile,
+    silence_consoles,
+)
+from src import gmail_watch, storage
+from src.gmail_api import LIST_COST, PROFILE_COST
+
+TOPIC = "projects/bench/topics/gmail"
+PUSH_TOKEN = "bench-secret"
+# How often a job's status is checked while waiting for it
+POLL_SECONDS = 0.002
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+def wait_for(client, job_ids):
+    """Wait until every job has finished; raises if one failed."""
+    for job_id in job_ids:
+        while True:
+            job = client.get(f"/organizer/jobs/{job_id}").json()
+            if job["status"] == "failed":
+                raise RuntimeError(f"Job {job_id} failed: {job['error']}")
+            if job["status"] == "succeeded":
+                break
+            time.sleep(POLL_SECONDS)
+
+
+def organized_ids(user_id):
+    with storage.transaction() as connection:
+        return {row[0] for row in connection.execute("SELECT email_id FROM classifications WHERE user_id = ?", (user_id,))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mailbox", type=int, default=100, help="emails already in the mailbox when the watch starts")
+    parser.add_argument("--bursts", type=int, default=20, help="bursts of new mail to deliver")
+    parser.add_argument("--burst-size", type=int, default=3, help="emails per burst")
+    parser.add_argument("--gap", type=float, default=0.05, help="idle seconds between bursts")
+    parser.add_argument("--duplicate-rate", type=float, default=0.1, help="share of notifications Pub/Sub delivers twice")
+    parser.add_argument("--poll-interval", type=float, default=60, help="seconds between polls in the polling comparison")
+    parser.add_argument("--google-latency", type=float, default=0.005, help="simulated Google round trip in seconds")
+    parser.add_argument("--gemini-latency", type=float, default=0.05, help="simulated Gemini time to first token in seconds")
+    parser.add_argument("--verbose", action="store_true", help="keep the application's console output")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        silence_consoles()
+    # The settings bench_organizer's fakes need, at its defaults
+    backend_args = SimpleNamespace(
+        google_latency=args.google_latency, google_error_rate=0.0,
+        gemini_latency=args.gemini_latency, gemini_chunk_latency=0.001, gemini_error_rate=0.0,
+        real_quotas=False, backoff=0.01, body_size=2000, thread_size=1, reply_size=80,
+    )
+    with fake_backends(args.mailbox, backend_args) as env, patch.dict(os.environ, {"GMAIL_PUBSUB_TOPIC": TOPIC, "PUSH_TOKEN": PUSH_TOKEN}):
+        storage.save_preferences(USER, "general", GENERAL_PREFERENCES)
+        storage.save_preferences(USER, "specific", SPECIFIC_PREFERENCES)
+        gmail = env.services["gmail"]
+
+        with TestClient(server.app) as client:
+            client.post("/gmail/watch", params={"user_id": USER}).raise_for_status()
+
+            def push(envelope):
+                response = client.post("/gmail/push", params={"token": PUSH_TOKEN}, json=envelope)
+                response.raise_for_status()
+                return response.json().get("job_id") if response.status_code == 200 else None
+
+            gmail.publisher.push = push
+            gmail.publisher.duplicate_rate = args.duplicate_rate
+            round_trips = gmail.round_trips
+            latencies = []
+            delivered = []
+            for _ in range(args.bursts):
+                time.sleep(args.gap)
+                start = time.perf_counter()
+                responses = len(gmail.publisher.responses)
+                delivered.extend(gmail.deliver(args.burst_size))
+                job_ids = {job_id for job_id in gmail.publisher.responses[responses:] if job_id}
+                wait_for(client, job_ids)
+                latencies.append(time.perf_counter() - start)
+            round_trips = gmail.round_trips - round_trips
+
+        missing = set(delivered) - organized_ids(USER)
+        backlog = {f"msg{index:06d}" for index in range(args.mailbox)} & organized_ids(USER)
+
+    print(f"{len(delivered)} emails in {args.bursts} bursts, {gmail.publisher.published} notifications")
+    print(f"  delivery to done    p50 {percentile(latencies, 50) * 1000:8.1f} ms   p99 {percentile(latencies, 99) * 1000:8.1f} ms")
+    print(f"  Gmail round trips   {round_trips / args.bursts:8.1f} per burst")
+    if missing:
+        print(f"  MISSING {len(missing)} delivered emails were never organized")
+    if backlog:
+        print(f"  UNEXPECTED {len(backlog)} emails from before the watch were organized")
+
+    # An idle mailbox costs a polled app at least one list call per poll, and a watched one a daily renewal
+    polling = SECONDS_PER_DAY / args.poll_interval * LIST_COST
+    watching = gmail_watch.WATCH_COST + PROFILE_COST
+    print(f"  idle mailbox quota  {polling:8.0f} units/day polling every {args.poll_interval:g}s, {watching} units/day watching")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,401 @@
+"""In-process stand-ins for the Google API discovery clients and the Gemini model used by src/."""
+import re
+import json
+import time
+import base64
+import random
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+
+# The address of every fake mailbox
+EMAIL_ADDRESS = "me@example.com"
+
+
+class FakeRequest:
+    """A prepared API call; execute() pays one simulated round trip."""
+
+    def __init__(self, service, handler):
+        self.service = service
+        self.handler = handler
+
+    def execute(self, http=None):
+        self.service.round_trips += 1
+        time.sleep(self.service.latency)
+        self.service.maybe_fail()
+        return self.handler()
+
+
+class FakeBatch:
+    """Mimics googleapiclient's BatchHttpRequest: many calls, one round trip."""
+
+    def __init__(self, service, callback):
+        self.service = service
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        self.requests.append((request_id or str(len(self.requests)), request, callback))
+
+    def execute(self, http=None):
+        self.service.round_trips += 1
+        time.sleep(self.service.latency + self.service.batch_item_latency * len(self.requests))
+        for request_id, request, callback in self.requests:
+            callback = callback or self.callback
+            try:
+                self.service.maybe_fail()
+                response, exception = request.handler(), None
+            except Exception as e:
+                response, exception = None, e
+            callback(request_id, response, exception)
+
+
+class FakeService:
+    """Shared latency and error injection of the fake Google services."""
+
+    def __init__(self, latency=0.02, batch_item_latency=0.0005, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.batch_item_latency = batch_item_latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.round_trips = 0
+        self.errors = 0
+
+    def maybe_fail(self):
+        """Raise a 503 HttpError for a random error_rate share of calls."""
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.errors += 1
+            raise HttpError(httplib2.Response({"status": "503"}), b"Simulated backend error")
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatch(self, callback)
+
+
+class FakeGmailService(FakeService):
+    """Serves a synthetic mailbox through the users().messages() surface."""
+
+    def __init__(self, count, latency=0.02, batch_item_latency=0.0005, page_size=100, body_size=2000, error_rate=0.0, seed=0, thread_size=1):
+        super().__init__(latency, batch_item_latency, error_rate, seed)
+        self.page_size = page_size
+        self.body_size = body_size
+        self.thread_size = thread_size
+        self.mailbox = {
+            f"msg{i:06d}": make_message(f"msg{i:06d}", i, body_size, thread_size) for i in range(count)
+        }
+        self.ids = list(self.mailbox)
+        # Every delivered message bumps the mailbox history, oldest first
+        self.history_id = count
+        self.history_log = [(i + 1, message_id) for i, message_id in enumerate(self.ids)]
+        # Set by watch(); deliver() then publishes a notification per new message
+        self.publisher = None
+
+    def deliver(self, count=1):
+        """Simulate new mail arriving; returns the new message ids."""
+        new_ids = []
+        for _ in range(count):
+            index = len(self.ids)
+            message_id = f"msg{index:06d}"
+            self.mailbox[message_id] = make_message(message_id, index, self.body_size, self.thread_size)
+            self.ids.insert(0, message_id)
+            self.history_id += 1
+            self.history_log.append((self.history_id, message_id))
+            new_ids.append(message_id)
+            if self.publisher is not None:
+                self.publisher.publish({"emailAddress": EMAIL_ADDRESS, "historyId": self.history_id})
+        return new_ids
+
+    def users(self):
+        return self
+
+    def getProfile(self, userId):
+        return FakeRequest(self, lambda: {"emailAddress": EMAIL_ADDRESS, "historyId": str(self.history_id)})
+
+    def watch(self, userId, body):
+        def handler():
+            self.publisher = self.publisher or FakePublisher(body["topicName"])
+            return {"historyId": str(self.history_id), "expiration": str(int((time.time() + 7 * 24 * 60 * 60) * 1000))}
+        return FakeRequest(self, handler)
+
+    def stop(self, userId):
+        def handler():
+            self.publisher = None
+            return ""
+        return FakeRequest(self, handler)
+
+    def history(self):
+        return FakeHistory(self)
+
+    def messages(self):
+        return self
+
+    def list(self, userId, q=None, pageToken=None, maxResults=None):
+        start = int(pageToken or 0)
+        end = start + min(maxResults or self.page_size, self.page_size)
+
+        def handler():
+            page = {"messages": [
+                {"id": message_id, "threadId": self.mailbox[message_id]["threadId"]} for message_id in self.ids[start:end]
+            ]}
+            if end < len(self.ids):
+                page["nextPageToken"] = str(end)
+            return page
+
+        return FakeRequest(self, handler)
+
+    def get(self, userId, id, **kwargs):
+        return FakeRequest(self, lambda: self.mailbox[id])
+
+
+class FakePublisher:
+    """A local stand-in for a Pub/Sub topic with one push subscription.
+
+    Wraps each published message in the envelope Pub/Sub POSTs to a push
+    endpoint and hands it to push (for example a TestClient post);
+    duplicate_rate of the messages are delivered twice, as Pub/Sub may.
+    """
+
+    def __init__(self, topic, push=None, duplicate_rate=0.0, seed=0):
+        self.topic = topic
+        self.push = push
+        self.duplicate_rate = duplicate_rate
+        self.random = random.Random(seed)
+        self.published = 0
+        self.responses = []
+
+    def publish(self, data):
+        self.published += 1
+        envelope = {
+            "message": {
+                "data": base64.b64encode(json.dumps(data).encode("utf-8")).decode("ascii"),
+                "messageId": str(self.published),
+                "publishTime": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            },
+            "subscription": self.topic.replace("/topics/", "/subscriptions/") + "-push",
+        }
+        if self.push is None:
+            return
+        self.responses.append(self.push(envelope))
+        if self.duplicate_rate and self.random.random() < self.duplicate_rate:
+            self.responses.append(self.push(envelope))
+
+
+class FakeHistory:
+    """The users().history() surface of FakeGmailService."""
+
+    def __init__(self, service):
+        self.service = service
+
+    def list(self, userId, startHistoryId, historyTypes=None, pageToken=None, **kwargs):
+        service = self.service
+
+        def handler():
+            start = int(startHistoryId)
+            records = [
+                {"id": str(history_id), "messagesAdded": [{"message": {"id": message_id}}]}
+                for history_id, message_id in service.history_log
+                if history_id > start
+            ]
+            return {"history": records, "historyId": str(service.history_id)}
+
+        return FakeRequest(service, handler)
+
+
+def make_message(message_id, index, body_size=2000, thread_size=1):
+    """Build a Gmail API message resource with a multipart body.
+
+    Every fourth message is a social-media digest with bulk-mail headers, so
+    the local pre-classifier has something to settle. Consecutive messages
+    share a thread in runs of thread_size.
+    """
+    body = (f"Hello, this is synthetic email number {index}. " * (body_size // 40 + 1))[:body_size]
+    data = base64.urlsafe_b64encode(body.encode("utf-8")).decode("ascii")
+    if index % 4 == 3:
+        headers = [
+            {"name": "Subject", "value": f"Someone liked your post {index}"},
+            {"name": "From", "value": "Quora Digest <digest@quora.com>"},
+            {"name": "List-Unsubscribe", "value": "<mailto:unsubscribe@quora.com>"},
+        ]
+    else:
+        headers = [
+            {"name": "Subject", "value": f"Synthetic subject {index}"},
+            {"name": "From", "value": f"Sender {index % 37} <sender{index % 37}@example.com>"},
+        ]
+    return {
+        "id": message_id,
+        "threadId": f"thread{index // thread_size:06d}",
+        "internalDate": str(1_700_000_000_000 + index * 60_000),
+        "labelIds": ["UNREAD", "CATEGORY_PERSONAL", "INBOX"],
+        "payload": {
+            "headers": headers,
+            "body": {},
+            "parts": [{"mimeType": "text/plain", "body": {"data": data}}],
+        },
+    }
+
+
+class FakeTasksService(FakeService):
+    """Records inserted tasks through the tasks() surface."""
+
+    def __init__(self, latency=0.02, batch_item_latency=0.0005, error_rate=0.0, seed=0):
+        super().__init__(latency, batch_item_latency, error_rate, seed)
+        self.items = {}
+
+    def tasks(self):
+        return self
+
+    def insert(self, tasklist, body):
+        return FakeRequest(self, lambda: self._store(body))
+
+    def patch(self, tasklist, task, body):
+        return FakeRequest(self, lambda: self._update(task, body))
+
+    def _store(self, body):
+        item = dict(body, id=f"item{len(self.items):06d}")
+        self.items[item["id"]] = item
+        return item
+
+    def _update(self, item_id, body):
+        self.items[item_id].update(body)
+        return self.items[item_id]
+
+
+class FakeCalendarService(FakeTasksService):
+    """Records inserted events through the events() surface."""
+
+    def events(self):
+        return self
+
+    def insert(self, calendarId, body):
+        return FakeRequest(self, lambda: self._store(body))
+
+    def patch(self, calendarId, eventId, body):
+        return FakeRequest(self, lambda: self._update(eventId, body))
+
+    def freebusy(self):
+        return FakeFreeBusy(self)
+
+
+class FakeFreeBusy:
+    """Answers freebusy().query() with the stored events of the primary calendar as busy time."""
+
+    def __init__(self, service):
+        self.service = service
+
+    def query(self, body):
+        def handler():
+            busy = [
+                {"start": event["start"]["dateTime"], "end": event["end"]["dateTime"]}
+                for event in self.service.items.values()
+            ]
+            return {"calendars": {"primary": {"busy": busy}}}
+        return FakeRequest(self.service, handler)
+
+
+class FakeUsage:
+    def __init__(self, prompt_token_count, candidates_token_count):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+
+
+class FakeResponse:
+    """A Gemini response; iterating it yields the streamed parts, paying chunk_latency per part."""
+
+    def __init__(self, text, prompt, chunk_chars=0, chunk_latency=0.0):
+        self.text = text
+        self.usage_metadata = FakeUsage(len(prompt) // 4 + 1, len(text) // 4 + 1)
+        self.chunk_chars = chunk_chars or len(text) or 1
+        self.chunk_latency = chunk_latency
+
+    def __iter__(self):
+        for start in range(0, len(self.text), self.chunk_chars):
+            time.sleep(self.chunk_latency)
+            yield FakePart(self.text[start:start + self.chunk_chars])
+
+
+class FakePart:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGeminiError(Exception):
+    """Like google.api_core's ServiceUnavailable, carries the HTTP status as .code."""
+
+    code = 503
+
+
+class FakeGenerativeModel:
+    """Stands in for genai.GenerativeModel; configure with fake_gemini() before patching it in.
+
+    Answers every synthetic message id found in the prompt with a plausible
+    action entry, or a JSON array of topic names when the prompt asks for
+    categories.
+    """
+
+    latency = 0.2
+    chunk_chars = 64
+    chunk_latency = 0.005
+    error_rate = 0.0
+    reply_size = 80
+    random = random.Random(0)
+    calls = 0
+    errors = 0
+
+    def __init__(self, model_name=None, generation_config=None, **kwargs):
+        self.model_name = model_name
+
+    def start_chat(self, history=None):
+        return self
+
+    def send_message(self, prompt, stream=False):
+        cls = type(self)
+        cls.calls += 1
+        time.sleep(cls.latency)
+        if cls.error_rate and cls.random.random() < cls.error_rate:
+            cls.errors += 1
+            raise FakeGeminiError("Simulated Gemini error")
+        response = FakeResponse(self.answer(prompt), prompt, cls.chunk_chars if stream else 0, cls.chunk_latency)
+        if not stream:
+            # A non-streamed answer still takes the whole generation time
+            time.sleep(cls.chunk_latency * max(1, len(response.text) // cls.chunk_chars))
+        return response
+
+    def answer(self, prompt):
+        message_ids = list(dict.fromkeys(re.findall(r"\bmsg\d{6}\b", prompt)))
+        if not message_ids:
+            return json.dumps([f"Specific topic {number}" for number in range(1, 11)])
+        return json.dumps([action_entry(message_id, self.reply_size) for message_id in message_ids])
+
+
+def fake_gemini(**settings):
+    """A FakeGenerativeModel subclass with its own settings and counters."""
+    settings.setdefault("random", random.Random(settings.pop("seed", 0)))
+    settings.setdefault("calls", 0)
+    settings.setdefault("errors", 0)
+    return type("ConfiguredFakeGenerativeModel", (FakeGenerativeModel,), settings)
+
+
+def action_entry(message_id, reply_size=80):
+    """A deterministic action entry for a synthetic message: a task, a calendar event or nothing."""
+    index = int(message_id[3:])
+    details = {"task": f"Follow up on message {index}", "reply_needed": False}
+    if index % 3 == 0:
+        action_type, importance = "task", "important"
+        details.update(reply_needed=True, reply_message=("Thanks, will do. " * (reply_size // 17 + 1))[:reply_size])
+    elif index % 3 == 1:
+        action_type, importance = "calendar", "most important"
+        day = 1 + index % 28
+        details.update(
+            event_date=f"2030-01-{day:02d}T{9 + index % 8:02d}:00:00+05:30",
+            event_end_date=f"2030-01-{day:02d}T{10 + index % 8:02d}:00:00+05:30",
+            timezone="Asia/Kolkata",
+        )
+    else:
+        action_type, importance = "none", "normal"
+    return {
+        "email_id": message_id,
+        "importance": importance,
+        "subject": f"Synthetic subject {index}",
+        "action_type": action_type,
+        "action_details": details,
+    }
@@ -1,7 +1,8 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import List, Dict
-import os, uvicorn
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+from fastapi import Body, FastAPI, HTTPException, Response, status
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 # Importing functions and classes from the separate modules
 from src.preferences_api import (
     get_general_topics,
@@ -14,11 +15,27 @@ from src.preferences_api import (
 )
 
 from src.gmail_api import get_unread_emails_logic
-from src.gemini import organize
-from src.tasks import get_tasks
-from src.calendars import update_calendar
+from src.google_auth import NotAuthorizedError
+from src import codec, config, gmail_watch, metrics
+from src.jobs import job_queue
+from src.storage import DEFAULT_USER
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app):
+    """Configure the process once at start-up, and load the heavy SDKs without delaying it."""
+    config.configure()
+    threading.Thread(target=config.warm_up, name="warm-up", daemon=True).start()
+    renewals = asyncio.create_task(gmail_watch.keep_watches())
+    yield
+    renewals.cancel()
+
+class CodecResponse(JSONResponse):
+    """JSON responses rendered by src.codec, the fastest JSON library installed."""
+
+    def render(self, content):
+        return codec.dumpb(content)
+
+app = FastAPI(lifespan=lifespan, default_response_class=CodecResponse)
 
 # Routes for Gemini AI functionality
 
@@ -28,9 +45,9 @@ def get_general_topics_():
     return get_general_topics()
 
 @app.post("/general-preferences")
-def submit_general_preferences_(input: GeneralPreferencesInput):
+def submit_general_preferences_(input: GeneralPreferencesInput, user_id: str = DEFAULT_USER):
     """Submit user rankings for general topics and get top preferences."""
-    return submit_general_preferences(input)
+    return submit_general_preferences(input, user_id)
 
 @app.post("/specific-topics")
 def get_specific_topics_(input: TopPreferencesInput):
@@ -38,23 +55,93 @@ def get_specific_topics_(input: TopPreferencesInput):
     return get_specific_topics(input)
 
 @app.post("/specific-preferences")
-def submit_specific_preferences_(input: SpecificPreferencesInput):
+def submit_specific_preferences_(input: SpecificPreferencesInput, user_id: str = DEFAULT_USER):
     """Submit user rankings for specific topics."""
-    return submit_specific_preferences(input)
+    return submit_specific_preferences(input, user_id)
 
 
 
 
 @app.get("/emails")
-def get_unread_emails():
-    """Fetch unread primary emails from the last 2 days."""
-    print("reading emails")
-    return get_unread_emails_logic()
+def get_unread_emails(incremental: bool = False, user_id: str = DEFAULT_USER):
+    """Fetch unread primary emails from the last 2 days, or only new ones when incremental."""
+    # Email records go straight to the codec rather than through FastAPI's generic encoder
+    return CodecResponse(get_unread_emails_logic(incremental=incremental, user_id=user_id))
 
 @app.get("/organizer")
-def get_unread_emails():
-    """Fetch unread primary emails from the last 2 days."""
-    organize()
-    get_tasks()
-    update_calendar()
+async def organize_unread_emails(user_id: str = DEFAULT_USER):
+    """Fetch, classify and turn unread primary emails from the last 2 days into tasks and events."""
+    job = await job_queue.wait(job_queue.submit(user_id)["job_id"])
+    if job["status"] == "failed":
+        raise HTTPException(status_code=500, detail=job["error"])
     return "success"
+
+@app.get("/organizer/stream")
+async def stream_organized_emails(user_id: str = DEFAULT_USER):
+    """Organize unread emails, streaming each classified action as one NDJSON line as soon as it is known."""
+    async def lines():
+        try:
+            async for entry in job_queue.stream(user_id):
+                yield codec.dumps(entry) + "\n"
+        except RuntimeError as e:
+            yield codec.dumps({"error": str(e)}) + "\n"
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@app.post("/organizer/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def submit_organizer_job(user_id: str = DEFAULT_USER):
+    """Queue an organizer run and return its job id without waiting for it."""
+    job = job_queue.submit(user_id)
+    return {"job_id": job["job_id"], "status": job["status"]}
+
+@app.get("/organizer/jobs/{job_id}")
+async def get_organizer_job(job_id: str):
+    """Report the status, per-stage progress and timings of an organizer run."""
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job
+
+@app.post("/gmail/watch")
+def start_gmail_watch(user_id: str = DEFAULT_USER):
+    """Have Gmail push a user's new mail to GMAIL_PUBSUB_TOPIC, so it is organized as it arrives."""
+    try:
+        return gmail_watch.start_watch(user_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except NotAuthorizedError as e:
+        raise HTTPException(status_code=401, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+@app.delete("/gmail/watch", status_code=status.HTTP_204_NO_CONTENT)
+def stop_gmail_watch(user_id: str = DEFAULT_USER):
+    """Stop push notifications for a user's mailbox."""
+    try:
+        gmail_watch.stop_watch(user_id)
+    except NotAuthorizedError as e:
+        raise HTTPException(status_code=401, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+@app.post("/gmail/push")
+async def receive_gmail_push(envelope: dict = Body(...), token: str = None):
+    """Pub/Sub push endpoint: queue an incremental organizer run for the mailbox a notification is about.
+
+    Every well-formed delivery is acknowledged, even when it is ignored,
+    so Pub/Sub does not redeliver it.
+    """
+    if not gmail_watch.verify_token(token):
+        raise HTTPException(status_code=403, detail="Invalid push token.")
+    try:
+        user_id = await asyncio.to_thread(gmail_watch.notified_user, envelope)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if user_id is None:
+        return Response(status_code=status.HTTP_204_NO_CONTENT)
+    job = job_queue.submit(user_id, incremental=True)
+    return {"job_id": job["job_id"], "status": job["status"]}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Expose call counts, retries, tokens, cache hits and latency histograms for Prometheus."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
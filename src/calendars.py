@@ -1,33 +1,23 @@
-import os
-import json
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
-from rich.console import Console
+from src.config import Console
+from src import conflicts, metrics, storage, sync_index
+from src.google_auth import get_service
+from src.google_batch import execute_in_batches
+from src.storage import DEFAULT_USER
+from src.tasks import authenticate_google_tasks, sync_tasks
 
 # Initialize the console for styled output
 console = Console()
 
-# Google Calendar API Scopes
-SCOPES = ['https://www.googleapis.com/auth/calendar']
-
-def authenticate_google_calendar():
+def authenticate_google_calendar(user_id=DEFAULT_USER):
     """Authenticate and return the Google Calendar API service."""
-    creds = None
-    if os.path.exists('auth/token.json'):
-        creds = Credentials.from_authorized_user_file('auth/token.json', SCOPES)
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file('auth/credentials.json', SCOPES)
-            creds = flow.run_local_server(port=8080)
-        with open('auth/token.json', "w") as token:
-            token.write(creds.to_json())
-    return build("calendar", "v3", credentials=creds)
-def add_event(service, event_data):
-    """Add a single event to Google Calendar."""
+    try:
+        return get_service("calendar", "v3", user_id)
+    except Exception as e:
+        console.print(f"[bold red]Error building Google Calendar service:[/bold red] {e}")
+        return None
+
+def build_event_body(event_data):
+    """Build the Google Calendar event resource for an action entry."""
     action_details = event_data.get("action_details", {})
 
     # Extract relevant fields from action_details
@@ -35,7 +25,7 @@ def add_event(service, event_data):
     event_end_date = action_details.get("event_end_date", "2024-11-22T11:00:00")
     timezone = action_details.get("timezone", "UTC")
 
-    event_body = {
+    return {
         "summary": event_data.get("subject", "No Subject"),
         "description": action_details.get("task", "No Task Description Provided"),
         "start": {
@@ -48,36 +38,141 @@ def add_event(service, event_data):
         }
     }
 
+@metrics.timed("sync_events")
+def sync_events(service, entries, http_factory=None, user_id=DEFAULT_USER):
+    """Create or update calendar events for action entries without ever duplicating them.
+
+    Works like tasks.sync_tasks: the local sync index decides between
+    skipping, patching and inserting, and writes go through the Calendar
+    batch endpoint. New events that would overlap the calendar or a more
+    preferred new event are not inserted (see find_conflicts). Returns one
+    {"summary", "status", "ok", "id", "error"} result per entry; held back
+    events have status "conflict" and a "reschedule" task entry to sync.
+    """
+    event_bodies = [build_event_body(entry) for entry in entries]
+    plans = sync_index.plan(entries, event_bodies, user_id)
+    reschedule = find_conflicts(service, entries, plans, user_id)
+
+    requests = []
+    for index, (event_body, (action, event_id)) in enumerate(zip(event_bodies, plans)):
+        if action == "insert" and index not in reschedule:
+            requests.append((str(index), service.events().insert(calendarId="primary", body=event_body)))
+        elif action == "patch":
+            requests.append((str(index), service.events().patch(calendarId="primary", eventId=event_id, body=event_body)))
+    metrics.increment("api_calls_total", len(requests), api="calendar")
+    outcomes = {
+        int(result["id"]): result
+        for result in execute_in_batches(service, requests, http_factory=http_factory, api="calendar", user_id=user_id)
+    }
+
+    results = []
+    synced = []
+    for index, (entry, event_body, (action, event_id)) in enumerate(zip(entries, event_bodies, plans)):
+        if action == "duplicate":
+            # Written once for the earlier entry; this one is not a success of its own
+            results.append({
+                "summary": event_body["summary"],
+                "status": "duplicate",
+                "ok": False,
+                "id": None,
+                "error": "Same event as an earlier entry of this batch.",
+            })
+            continue
+        if action == "unchanged":
+            results.append({"summary": event_body["summary"], "status": "unchanged", "ok": True, "id": event_id, "error": None})
+            continue
+        if index in reschedule:
+            results.append({
+                "summary": event_body["summary"],
+                "status": "conflict",
+                "ok": True,
+                "id": None,
+                "error": None,
+                "reschedule": reschedule[index],
+            })
+            console.print(f"[bold yellow]Event conflicts, to reschedule:[/bold yellow] {event_body['summary']}")
+            continue
+        outcome = outcomes[index]
+        event_id = (outcome["response"] or {}).get("id", event_id)
+        status = "inserted" if action == "insert" else "updated"
+        results.append({
+            "summary": event_body["summary"],
+            "status": status,
+            "ok": outcome["ok"],
+            "id": event_id,
+            "error": outcome["error"],
+        })
+        if outcome["ok"]:
+            synced.append((entry, event_body, event_id))
+            console.print(f"[bold green]Event {status}:[/bold green] {event_body['summary']}")
+        else:
+            metrics.increment("api_errors_total", api="calendar")
+            console.print(f"[bold red]Failed to add event:[/bold red] {event_body['summary']} - {outcome['error']}")
+    sync_index.record(synced, user_id)
+    return results
+
+def find_conflicts(service, entries, plans, user_id=DEFAULT_USER):
+    """Reschedule tasks for the entries planned as inserts that cannot be scheduled, by entry index.
+
+    One freebusy query covers the span of all new events; they are then
+    checked against it and each other locally, the user's preferred topics
+    first. Events synced on earlier runs are part of the busy time already.
+    If the calendar's busy time cannot be read, nothing is held back.
+    """
+    candidates = [index for index, (action, _) in enumerate(plans) if action == "insert"]
+    intervals = [interval for interval in map(conflicts.event_interval, (entries[index] for index in candidates)) if interval]
+    if not intervals:
+        return {}
     try:
-        # Insert the event into the user's primary calendar
-        print(event_body)
-        service.events().insert(calendarId="primary", body=event_body).execute()
-        console.print(f"[bold green]Event added:[/bold green] {event_body['summary']}")
+        busy = conflicts.busy_intervals(
+            service, min(start for start, _ in intervals), max(end for _, end in intervals), user_id
+        )
     except Exception as e:
-        console.print(f"[bold red]Failed to add event:[/bold red] {event_body['summary']} - {e}")
+        metrics.increment("api_errors_total", api="calendar")
+        console.print(f"[bold red]Could not check calendar conflicts:[/bold red] {e}")
+        return {}
+    general_preferences = storage.get_preferences(user_id, "general")
+    rejected = conflicts.resolve([entries[index] for index in candidates], busy, general_preferences)
+    return {
+        candidates[position]: conflicts.reschedule_task(entries[candidates[position]], blocker)
+        for position, blocker in rejected.items()
+    }
 
-def update_calendar():
-    # Path to the JSON file
-    json_file = "docs/categorized_emails_and_tasks.json"
+def reschedule_tasks(results):
+    """The reschedule task entries of sync_events results."""
+    return [result["reschedule"] for result in results if result.get("reschedule")]
 
-    # Load the JSON data
-    try:
-        with open(json_file, "r", encoding="utf-8") as file:
-            data = json.load(file)
-    except FileNotFoundError:
-        console.print(f"[bold red]Error:[/bold red] The file '{json_file}' was not found.")
-        return
-    except json.JSONDecodeError as e:
-        console.print(f"[bold red]Error parsing JSON file:[/bold red] {e}")
-        return
+def update_calendar(user_id=DEFAULT_USER):
+    # Load the user's latest actions
+    data = storage.get_latest_actions(user_id)
 
     # Authenticate with Google Calendar API
-    service = authenticate_google_calendar()
-    print("ucgvhb")
+    service = authenticate_google_calendar(user_id)
+    if service is None:
+        console.print("[bold red]Failed to authenticate with Google Calendar API.[/bold red]")
+        return
 
     # Process only calendar events
-    for entry in data:
-        if entry.get("action_type") == "calendar":
-            add_event(service, entry)
+    results = sync_events(service, [entry for entry in data if is_calendar_entry(entry)], user_id=user_id)
+    counts = {
+        status: sum(result["ok"] and result["status"] == status for result in results)
+        for status in ("inserted", "updated", "unchanged", "conflict")
+    }
+    console.print(
+        f"[bold green]Events: {counts['inserted']} added, {counts['updated']} updated, {counts['unchanged']} unchanged, "
+        f"{counts['conflict']} to reschedule of {len(results)}.[/bold green]"
+    )
+
+    # Overlapping events become tasks asking the user to pick another time
+    reschedule = reschedule_tasks(results)
+    if reschedule:
+        tasks_service = authenticate_google_tasks(user_id)
+        if tasks_service is not None:
+            sync_tasks(tasks_service, reschedule, user_id=user_id)
+    return results
+
+def is_calendar_entry(entry):
+    """Whether an action entry should become a Google Calendar event."""
+    return entry.get("action_type") == "calendar"
 
 # update_calendar()
\ No newline at end of file
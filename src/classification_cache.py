@@ -0,0 +1,102 @@
+import json
+import time
+import hashlib
+from src import codec
+from src.config import Console
+from src.prompt_builder import PROMPT_VERSION, clean_body
+from src.records import ActionRecord
+from src.storage import DEFAULT_USER, get_sync_state, set_sync_state, transaction
+
+console = Console()
+
+# Cached classifications older than this are dropped
+MAX_AGE_SECONDS = 7 * 24 * 60 * 60
+# Upper bound on cached emails per user; the oldest are evicted first
+MAX_ENTRIES = 5000
+
+def preferences_version(general_preferences, specific_preferences):
+    """Fingerprint of the user's preferences; changes whenever either file changes."""
+    payload = json.dumps([general_preferences, specific_preferences], sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+def cache_key(email, prefs_version, model_name):
+    """Content address of one email's classification."""
+    payload = json.dumps(
+        [
+            email.get("id"),
+            email.get("subject"),
+            # The prompt only ever sees the cleaned body
+            clean_body(email.get("body") or ""),
+            prefs_version,
+            model_name,
+            PROMPT_VERSION,
+        ]
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def load_cache(prefs_version, user_id=DEFAULT_USER):
+    """Open a user's cache, discarding their entries if the preferences changed since they were written.
+
+    Entries are read from the database one key at a time; new ones are held
+    in memory until save_cache.
+    """
+    if get_sync_state(user_id, "preferences_version") != prefs_version:
+        with transaction() as connection:
+            deleted = connection.execute(
+                "DELETE FROM classification_cache WHERE user_id = ?", (user_id,)
+            ).rowcount
+        if deleted:
+            console.print("[bold yellow]Preferences changed, invalidating classification cache.[/bold yellow]")
+        set_sync_state(user_id, "preferences_version", prefs_version)
+    return {"user_id": user_id, "preferences_version": prefs_version, "entries": {}}
+
+def save_cache(cache):
+    """Upsert new entries, then evict the user's expired and excess ones."""
+    user_id = cache["user_id"]
+    with transaction() as connection:
+        connection.executemany(
+            """
+            INSERT INTO classification_cache (user_id, cache_key, actions, created_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT (user_id, cache_key) DO UPDATE SET
+                actions = excluded.actions,
+                created_at = excluded.created_at
+            """,
+            [
+                (user_id, key, codec.dumps(value["actions"]), value["created"])
+                for key, value in cache["entries"].items()
+            ],
+        )
+        connection.execute(
+            "DELETE FROM classification_cache WHERE user_id = ? AND created_at < ?",
+            (user_id, time.time() - MAX_AGE_SECONDS),
+        )
+        connection.execute(
+            """
+            DELETE FROM classification_cache WHERE user_id = ? AND cache_key NOT IN (
+                SELECT cache_key FROM classification_cache WHERE user_id = ?
+                ORDER BY created_at DESC LIMIT ?
+            )
+            """,
+            (user_id, user_id, MAX_ENTRIES),
+        )
+    cache["entries"] = {}
+
+def lookup(cache, key):
+    """Return the cached action entries for a key, or None on a miss or expired entry."""
+    value = cache["entries"].get(key)
+    if value is None:
+        with transaction() as connection:
+            row = connection.execute(
+                "SELECT actions, created_at FROM classification_cache WHERE user_id = ? AND cache_key = ?",
+                (cache["user_id"], key),
+            ).fetchone()
+        if row is None:
+            return None
+        value = {"created": row[1], "actions": [ActionRecord.from_dict(entry) for entry in codec.loads(row[0])]}
+    if time.time() - value["created"] > MAX_AGE_SECONDS:
+        return None
+    return value["actions"]
+
+def store(cache, key, actions):
+    """Remember the action entries produced for one email until the next save_cache."""
+    cache["entries"][key] = {"created": time.time(), "actions": actions}
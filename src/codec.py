@@ -0,0 +1,86 @@
+import os
+import json
+from collections.abc import Mapping
+from src import config
+
+# Codecs tried in order when JSON_CODEC does not name one; the first that imports is used
+PREFERRED_CODECS = ["orjson", "json"]
+
+def to_json(value):
+    """Fallback for values JSON has no type for: records encode as the objects they stand for."""
+    if isinstance(value, Mapping):
+        return dict(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+class JsonCodec:
+    """The standard library's json, writing compact UTF-8."""
+
+    name = "json"
+
+    def dumps(self, value):
+        return json.dumps(value, default=to_json, ensure_ascii=False, separators=(",", ":"))
+
+    def dumpb(self, value):
+        return self.dumps(value).encode("utf-8")
+
+    def loads(self, data):
+        return json.loads(data)
+
+class OrjsonCodec:
+    """orjson, several times faster than json at both ends; raises ImportError if it is not installed."""
+
+    name = "orjson"
+
+    def __init__(self):
+        import orjson
+        self.orjson = orjson
+
+    def dumps(self, value):
+        return self.dumpb(value).decode("utf-8")
+
+    def dumpb(self, value):
+        return self.orjson.dumps(value, default=to_json, option=self.orjson.OPT_NON_STR_KEYS)
+
+    def loads(self, data):
+        return self.orjson.loads(data)
+
+# Name -> factory of every known codec; register() adds more
+CODECS = {"json": JsonCodec, "orjson": OrjsonCodec}
+
+_codec = None
+
+def register(name, factory):
+    """Make a codec available to use() and JSON_CODEC; factory raises ImportError if its library is missing."""
+    CODECS[name] = factory
+
+def use(name=None):
+    """Switch every caller to the named codec, or to the first of PREFERRED_CODECS that imports; returns it."""
+    global _codec
+    for candidate in [name] if name else PREFERRED_CODECS:
+        try:
+            _codec = CODECS[candidate]()
+            return _codec
+        except ImportError:
+            if name:
+                raise
+    _codec = JsonCodec()
+    return _codec
+
+def codec():
+    """The codec in use, chosen on first use from JSON_CODEC in the environment."""
+    if _codec is None:
+        config.configure()
+        use(os.getenv("JSON_CODEC"))
+    return _codec
+
+def dumps(value):
+    """Encode value as a compact JSON string; records and other mappings encode as objects."""
+    return codec().dumps(value)
+
+def dumpb(value):
+    """Encode value as compact UTF-8 JSON bytes."""
+    return codec().dumpb(value)
+
+def loads(data):
+    """Decode a JSON string or bytes; raises ValueError if it is not valid JSON."""
+    return codec().loads(data)
@@ -0,0 +1,63 @@
+import os
+import importlib
+import threading
+
+# SDKs that are slow to import and only needed once a request uses them; warm_up() loads them early
+HEAVY_MODULES = [
+    "google.generativeai",
+    "googleapiclient.discovery",
+    "google_auth_oauthlib.flow",
+    "google_auth_httplib2",
+    "rich.console",
+]
+
+_lock = threading.Lock()
+_configured = False
+_genai = None
+
+def configure():
+    """Load .env into the environment; runs once per process, from the app's lifespan hook or on first use."""
+    global _configured
+    with _lock:
+        if _configured:
+            return
+        from dotenv import load_dotenv
+        load_dotenv()
+        _configured = True
+
+def genai():
+    """The google.generativeai module, imported and configured with API_KEY on first use."""
+    global _genai
+    if _genai is None:
+        configure()
+        with _lock:
+            if _genai is None:
+                import google.generativeai
+                google.generativeai.configure(api_key=os.getenv("API_KEY"))
+                _genai = google.generativeai
+    return _genai
+
+def warm_up():
+    """Import the heavy SDKs ahead of the first request that needs them."""
+    genai()
+    for name in HEAVY_MODULES:
+        importlib.import_module(name)
+
+class Console:
+    """A rich Console that only imports rich when something is first printed or configured."""
+
+    def __init__(self, **options):
+        object.__setattr__(self, "_options", options)
+        object.__setattr__(self, "_console", None)
+
+    def _get(self):
+        if self._console is None:
+            from rich.console import Console as RichConsole
+            object.__setattr__(self, "_console", RichConsole(**self._options))
+        return self._console
+
+    def __getattr__(self, name):
+        return getattr(self._get(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._get(), name, value)
@@ -0,0 +1,195 @@
+import random
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from src import metrics, rate_limit
+from src.preclassifier import best_topic
+from src.response_parser import IMPORTANCE_LEVELS
+from src.storage import DEFAULT_USER
+
+# Abbreviations the model uses for timezones, mapped to IANA names
+TIMEZONE_ALIASES = {"IST": "Asia/Kolkata", "UTC": "UTC", "GMT": "UTC"}
+
+class IntervalTree:
+    """Half-open [start, end) intervals with an owner each, in a treap keyed by start.
+
+    Every node also keeps the latest end in its subtree, so insert and the
+    search for an overlapping interval take O(log n) expected time.
+    """
+
+    class Node:
+        __slots__ = ("start", "end", "owner", "priority", "max_end", "left", "right")
+
+        def __init__(self, start, end, owner):
+            self.start = start
+            self.end = end
+            self.owner = owner
+            self.priority = random.random()
+            self.max_end = end
+            self.left = None
+            self.right = None
+
+    def __init__(self, intervals=()):
+        self.root = None
+        self.size = 0
+        for start, end, owner in intervals:
+            self.insert(start, end, owner)
+
+    def __len__(self):
+        return self.size
+
+    def insert(self, start, end, owner=None):
+        self.root = self._insert(self.root, self.Node(start, end, owner))
+        self.size += 1
+
+    def _insert(self, node, new):
+        if node is None:
+            return new
+        if new.start < node.start:
+            node.left = self._insert(node.left, new)
+            if node.left.priority > node.priority:
+                node = self._rotate_right(node)
+        else:
+            node.right = self._insert(node.right, new)
+            if node.right.priority > node.priority:
+                node = self._rotate_left(node)
+        self._update(node)
+        return node
+
+    def _rotate_right(self, node):
+        child = node.left
+        node.left, child.right = child.right, node
+        self._update(node)
+        self._update(child)
+        return child
+
+    def _rotate_left(self, node):
+        child = node.right
+        node.right, child.left = child.left, node
+        self._update(node)
+        self._update(child)
+        return child
+
+    @staticmethod
+    def _update(node):
+        node.max_end = max(
+            node.end,
+            node.left.max_end if node.left else node.end,
+            node.right.max_end if node.right else node.end,
+        )
+
+    def overlap(self, start, end):
+        """Some stored (start, end, owner) overlapping [start, end), or None."""
+        node = self.root
+        while node is not None:
+            if node.start < end and start < node.end:
+                return node.start, node.end, node.owner
+            # Only the left subtree can hold an overlap if anything there ends after start
+            if node.left is not None and node.left.max_end > start:
+                node = node.left
+            else:
+                node = node.right
+        return None
+
+def parse_time(value, timezone_name=None):
+    """Seconds since the epoch of an ISO 8601 date-time, read in timezone_name when it has no offset; None if invalid."""
+    if not value:
+        return None
+    try:
+        moment = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if moment.tzinfo is None:
+        name = TIMEZONE_ALIASES.get((timezone_name or "").upper(), timezone_name or "UTC")
+        try:
+            moment = moment.replace(tzinfo=ZoneInfo(name))
+        except (ZoneInfoNotFoundError, ValueError):
+            moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+def event_interval(entry):
+    """The (start, end) seconds of a calendar entry, or None if its dates cannot be read."""
+    details = entry.get("action_details") or {}
+    start = parse_time(details.get("event_date"), details.get("timezone"))
+    end = parse_time(details.get("event_end_date"), details.get("timezone"))
+    if start is None:
+        return None
+    # The prompt asks for one hour when no end is given
+    if end is None or end <= start:
+        end = start + 60 * 60
+    return start, end
+
+def busy_intervals(service, start, end, user_id=DEFAULT_USER):
+    """The user's busy (start, end) intervals on their primary calendar between start and end, in one freebusy query."""
+    body = {
+        "timeMin": datetime.fromtimestamp(start, timezone.utc).isoformat(),
+        "timeMax": datetime.fromtimestamp(end, timezone.utc).isoformat(),
+        "items": [{"id": "primary"}],
+    }
+    metrics.increment("api_calls_total", api="calendar")
+    response = rate_limit.execute("calendar", service.freebusy().query(body=body), user_id)
+    intervals = []
+    for busy in response.get("calendars", {}).get("primary", {}).get("busy", []):
+        interval = (parse_time(busy.get("start")), parse_time(busy.get("end")))
+        if None not in interval:
+            intervals.append(interval)
+    return intervals
+
+def preference_rank(entry, general_preferences):
+    """Rank of the general topic an entry is about; unrecognized topics rank in the middle."""
+    details = entry.get("action_details") or {}
+    text = f"{entry.get('subject') or ''}\n{details.get('task') or ''}".lower()
+    topic = best_topic({}, text)
+    if topic in (general_preferences or {}):
+        return general_preferences[topic]
+    return (len(general_preferences or {}) + 1) / 2
+
+def priority(entry, general_preferences):
+    """Sort key putting the entries the user cares most about first."""
+    importance = entry.get("importance")
+    return (
+        preference_rank(entry, general_preferences),
+        IMPORTANCE_LEVELS.index(importance) if importance in IMPORTANCE_LEVELS else len(IMPORTANCE_LEVELS),
+    )
+
+def resolve(entries, busy, general_preferences):
+    """Find the proposed calendar entries that cannot be scheduled as they are.
+
+    Entries are considered from the user's most to least preferred topic,
+    then by importance; each one that overlaps nothing is accepted and
+    blocks its slot. The calendar's existing busy time always stands, and
+    entries whose dates cannot be read are never rejected. Returns
+    {index: blocker} for each rejected entry, where blocker is the accepted
+    entry it overlaps, or None for an existing event.
+    """
+    tree = IntervalTree((start, end, None) for start, end in busy)
+    rejected = {}
+    for index in sorted(range(len(entries)), key=lambda index: priority(entries[index], general_preferences)):
+        interval = event_interval(entries[index])
+        if interval is None:
+            continue
+        overlap = tree.overlap(*interval)
+        if overlap is None:
+            tree.insert(interval[0], interval[1], entries[index])
+        else:
+            rejected[index] = overlap[2]
+    metrics.increment("calendar_conflicts_total", len(rejected))
+    return rejected
+
+def reschedule_task(entry, other):
+    """A task asking the user to find another time for an event that lost a conflict."""
+    details = entry.get("action_details") or {}
+    subject = entry.get("subject", "No Subject")
+    blocker = f'"{other.get("subject", "No Subject")}"' if other else "an existing event"
+    return {
+        "email_id": entry.get("email_id"),
+        "thread_id": entry.get("thread_id"),
+        # The event's ordinal tells apart the reschedule tasks of one thread's events
+        "ordinal": entry.get("ordinal") or 0,
+        "importance": entry.get("importance", "normal"),
+        "subject": f"Reschedule: {subject}",
+        "action_type": "task",
+        "action_details": {
+            "task": f"{subject} ({details.get('event_date')}) overlaps {blocker}. Find another time.",
+            "reply_needed": False,
+        },
+    }
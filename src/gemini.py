@@ -1,176 +1,393 @@
-import os
-import json
-import google.generativeai as genai
-from rich.console import Console
-from datetime import datetime
-from dotenv import load_dotenv
-import os
-
-# Load the .env file
-load_dotenv()
-
-# Access the API key
-api_key = os.getenv("API_KEY")
-genai.configure(api_key=api_key)  # Replace with your API key
+import time
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from src.config import Console, genai
+from src import classification_cache, metrics, rate_limit, storage
+from src.storage import DEFAULT_USER
+from src.preclassifier import preclassify
+from src.prompt_builder import PROMPT_VERSION, count_tokens, email_block, email_tokens, prompt_prefix
+from src.threads import collapse_threads, member_actions
+from src.records import ActionRecord
+from src.response_parser import ACTION_LIST_SCHEMA, JsonArrayStream, parse_action_entries, validate_action_entry
+
 console = Console()  # Initialize Rich console for rendering
 
-def read_email_data(file_path):
-    """Reads the email data from a JSON file."""
-    try:
-        with open(file_path, "r") as json_file:
-            email_data = json.load(json_file)
-        return email_data
-    except FileNotFoundError:
-        console.print(f"[bold red]Error:[/bold red] The file '{file_path}' was not found.")
-    except json.JSONDecodeError:
-        console.print(f"[bold red]Error:[/bold red] The file '{file_path}' is not a valid JSON file.")
-    return None
-
-def read_user_preferences(preference_file):
-    """Reads user preferences from a JSON file."""
-    try:
-        with open(preference_file, "r", encoding="utf-8") as json_file:
-            preferences = json.load(json_file)
-        return preferences
-    except FileNotFoundError:
-        console.print(f"[bold red]Error:[/bold red] The file '{preference_file}' was not found.")
-    except json.JSONDecodeError:
-        console.print(f"[bold red]Error:[/bold red] The file '{preference_file}' is not a valid JSON file.")
-    return {}
-
-def generate_prompt(email_data, general_preferences, specific_preferences):
-    """Generate a structured prompt based on the email data and user preferences."""
-    # Add user preferences to the prompt
-    prompt = (
-        "You are an intelligent email assistant. Analyze the following categories in a ranked order given by the user."
-        "The top 3 are the most important for the user. The next five are normal and the other 2 are the least preferred to the user.\n\n"
-    )
-    prompt += "User Preferences:\n"
-    prompt += "General Preferences:\n" + json.dumps(general_preferences, indent=4) + "\n"
-    prompt += "Specific Preferences:\n" + json.dumps(specific_preferences, indent=4) + "\n\n"
+MODEL_NAME = "gemini-1.5-flash-8b"
+# Budget of email tokens per request; the instructions and preferences come on top
+CHUNK_TOKEN_BUDGET = 4000
+# Each email can produce several action entries, so cap emails per request to keep the output short
+MAX_EMAILS_PER_CHUNK = 20
+# Number of Gemini requests in flight at once
+CLASSIFY_CONCURRENCY = 4
+# How many times a chunk whose response could not be parsed is re-sent
+MAX_CHUNK_RETRIES = 2
+# user_id -> (context version, configured model)
+_contexts = {}
+_contexts_lock = threading.Lock()
 
-    # Add email data to the prompt
+@metrics.timed("generate_prompt")
+def generate_prompt(email_data):
+    """The per-request prompt: just this request's emails, since instructions and preferences live in the model's context."""
+    return email_block(email_data)
+
+def record_tokens(response, prompt, text):
+    """Count the tokens of one Gemini exchange, from usage metadata when the response has it."""
+    usage = getattr(response, "usage_metadata", None)
+    metrics.increment("tokens_total", getattr(usage, "prompt_token_count", 0) or count_tokens(prompt), direction="sent")
+    metrics.increment("tokens_total", getattr(usage, "candidates_token_count", 0) or count_tokens(text), direction="received")
+
+def chunk_emails(email_data, token_budget=CHUNK_TOKEN_BUDGET, max_emails=MAX_EMAILS_PER_CHUNK):
+    """Split emails into consecutive chunks that fit the per-request token budget."""
+    chunks = []
+    chunk = []
+    chunk_tokens = 0
     for email in email_data:
-        email_id = email.get('id', 'Unknown ID')
-        sender = email.get('sender', 'Unknown Sender')
-        subject = email.get('subject', 'No Subject')
-        body = email.get('body', 'No Body')[:200]  # Truncate body for clarity
-
-        prompt += (
-            f"**Email ID:** {email_id}\n"
-            f"**Sender:** {sender}\n"
-            f"**Subject:** {subject}\n"
-            f"**Body:** {body}...\n"
-            "---\n"
-        )
+        tokens = email_tokens(email)
+        if chunk and (chunk_tokens + tokens > token_budget or len(chunk) >= max_emails):
+            chunks.append(chunk)
+            chunk = []
+            chunk_tokens = 0
+        chunk.append(email)
+        chunk_tokens += tokens
+    if chunk:
+        chunks.append(chunk)
+    return chunks
 
-    # Add the rest of the prompt as before
-    prompt += (
-        "\nBased on the emails and user preferences:\n"
-        "1. Categorize each email as most important, important, normal, or least important.\n"
-        "2. Identify if the email requires one or more actionable tasks, follow-ups, or a reply.\n"
-        "3. For emails with deadlines, include two entries: one for setting the task and another for scheduling the deadline in the calendar.\n"
-        "4. If a reply is required, include it in the action details as part of the task.\n"
-        "5. For example, if there are two meetings scheduled at the same time, then the most preferred category meeting should be scheduled and the other one should be tried to reschedule.\n"
-        "6. If there are situations where there are some meeting invites and also there is a reply required for that same mail, then there should be one task added to reply and one calendar event should be added to join the meeting. REMEMBER to do this for such scenarios"
-        "7. REPLY NEEDED mails should be added into tasks and also into calendar if necessary (like for meeting invites) as a separate document in the json output"
-        "8. Respond in JSON format as specified below:\n\n"
-        "Example JSON Output:\n"
-        "[\n"
-        "    {\n"
-        "        \"email_id\": \"string\",        // Unique identifier or sender of the email\n"
-        "        \"importance\": \"string\",     // One of: 'most important', 'important', 'normal', 'least important'\n"
-        "        \"subject\": \"string\",        // The subject line of the email\n"
-        "        \"action_type\": \"string\",    // Either 'task', 'calendar'\n"
-        "        \"action_details\": {           // Details about the action to be taken\n"
-        "            \"task\": \"string\",       // Task description, if applicable\n"
-        "            \"reply_needed\": true,    // Whether a reply is required (true/false), if this is for a calender event then create a separate task for the same as a task category\n"
-        "            \"reply_message\": \"string\", // Suggested reply message\n"
-        f"            \"event_date\": \"string\", // Start date/time for calendar events . REMEMBER to USE correct date format used in Google Calendar API YYYY-MM-DDTHH:mm:ss±hh:mm  use this current date for references{datetime.now()}\n"
-        "            \"event_end_date\": \"string\", // End date/time for calendar events .REMEMBER to USE  correct date format used in Google Calendar API YYYY-MM-DDTHH:mm:ss±hh:mm. If not mentioned set the duration as 1 hour\n"
-        "            \"timezone\": \"string\"    // Timezone for calendar events use IST \n"
-        "        }\n"
-        "    }\n"
-        "]\n"
+def generation_config():
+    """JSON mode, constrained to the action entry schema."""
+    return genai().GenerationConfig(
+        response_mime_type="application/json",
+        response_schema=ACTION_LIST_SCHEMA,
     )
-    return prompt
 
-def clean_response_string(response_text):
-    """Skips the first and last lines of the response string and parses it as JSON."""
-    try:
-        # Split the response into lines
-        lines = response_text.split("\n")
+def classification_model(general_preferences, specific_preferences, user_id=DEFAULT_USER):
+    """The user's Gemini model, with the instructions and their preferences as its system instruction.
 
-        # Skip the first and last lines
-        if len(lines) > 2:
-            cleaned_lines = lines[1:-1]
-        else:
-            console.print("[bold red]Error:[/bold red] Response does not have enough lines to clean.")
-            return None
+    Built once per user and reused until the preferences (or the prompt)
+    change, so each request's prompt carries only its emails. Gemini still
+    receives the system instruction with every request; the prefix is far
+    too short for its server-side context caching.
+    """
+    version = f"{classification_cache.preferences_version(general_preferences, specific_preferences)}-{PROMPT_VERSION}"
+    # Building a model is local and quick, so the lock only makes concurrent chunks share one
+    with _contexts_lock:
+        known = _contexts.get(user_id)
+        if known and known[0] == version:
+            metrics.increment("cache_requests_total", cache="gemini_context", result="hit")
+            return known[1]
+        metrics.increment("cache_requests_total", cache="gemini_context", result="miss")
 
-        # Join the cleaned lines and parse as JSON
-        cleaned_json_text = "\n".join(cleaned_lines)
-        cleaned_data = json.loads(cleaned_json_text)  # Parse to verify it's valid JSON
+        model = genai().GenerativeModel(
+            model_name=MODEL_NAME,
+            system_instruction=prompt_prefix(general_preferences, specific_preferences),
+            generation_config=generation_config(),
+        )
+        _contexts[user_id] = (version, model)
+        return model
 
-        return cleaned_data
-    except json.JSONDecodeError as e:
-        console.print(f"[bold red]Error parsing response string as JSON:[/bold red] {e}")
-        return None
+def classify_chunk(chunk, general_preferences, specific_preferences, user_id=DEFAULT_USER):
+    """Send one chunk of emails to Gemini and return the valid action entries, or None on an API error."""
+    prompt = generate_prompt(chunk)
+    try:
+        chat_session = classification_model(general_preferences, specific_preferences, user_id).start_chat(history=[])
+
+        # Send the message to the Gemini API
+        metrics.increment("api_calls_total", api="gemini")
+        with metrics.span("gemini_send_message"):
+            response = rate_limit.call("gemini", lambda: chat_session.send_message(prompt))
     except Exception as e:
-        console.print(f"[bold red]Unexpected error cleaning response string:[/bold red] {e}")
+        metrics.increment("api_errors_total", api="gemini")
+        console.print(f"[bold red]Error communicating with Gemini API:[/bold red] {e}")
         return None
+    record_tokens(response, prompt, response.text)
 
-def process_emails_with_preferences(email_data, general_preferences, specific_preferences):
-    """Pass email data and user preferences to Gemini API for processing."""
-    if not email_data:
-        console.print("[bold red]No email data to process.[/bold red]")
-        return
+    # Print the raw response for debugging
+    console.print(f"[bold yellow]Raw Response:[/bold yellow]\n{response.text}")
 
-    # Generate the prompt
-    prompt = generate_prompt(email_data, general_preferences, specific_preferences)
+    # Keep every entry that validates, even if the rest of the array is broken
+    entries, rejected = parse_action_entries(response.text)
+    if rejected:
+        console.print(f"[bold yellow]Dropped {rejected} invalid action entr{'y' if rejected == 1 else 'ies'}.[/bold yellow]")
+    return entries
 
+def stream_chunk(chunk, general_preferences, specific_preferences, user_id=DEFAULT_USER):
+    """Stream one chunk's classification from Gemini, yielding each valid action entry as its object closes.
+
+    An API error ends the stream early; entries already yielded stand.
+    """
+    prompt = generate_prompt(chunk)
+    parser = JsonArrayStream()
+    rejected = 0
+    received = []
+    metrics.increment("api_calls_total", api="gemini")
     try:
-        # Initialize the model
-        model = genai.GenerativeModel(model_name="gemini-1.5-flash-8b")
+        # The span covers the whole generation, not the time spent by consumers between entries
+        start = time.perf_counter()
+        waited = 0.0
+        chat_session = classification_model(general_preferences, specific_preferences, user_id).start_chat(history=[])
+        response = rate_limit.call("gemini", lambda: chat_session.send_message(prompt, stream=True))
+        for part in response:
+            received.append(part.text)
+            for item in parser.feed(part.text):
+                entry = validate_action_entry(item)
+                if entry is None:
+                    rejected += 1
+                else:
+                    yielded_at = time.perf_counter()
+                    yield entry
+                    waited += time.perf_counter() - yielded_at
+        metrics.observe("span_seconds", time.perf_counter() - start - waited, span="gemini_send_message")
+        record_tokens(response, prompt, "".join(received))
+    except Exception as e:
+        metrics.increment("api_errors_total", api="gemini")
+        console.print(f"[bold red]Error communicating with Gemini API:[/bold red] {e}")
+    if rejected:
+        console.print(f"[bold yellow]Dropped {rejected} invalid action entr{'y' if rejected == 1 else 'ies'}.[/bold yellow]")
 
-        # Start a chat session
-        chat_session = model.start_chat(history=[])
+def classify_chunks(chunks, general_preferences, specific_preferences, max_concurrency=CLASSIFY_CONCURRENCY, max_retries=MAX_CHUNK_RETRIES, user_id=DEFAULT_USER):
+    """Classify chunks concurrently, re-asking only for the emails that got no valid answer.
 
-        # Send the message to the Gemini API
-        response = chat_session.send_message(prompt)
+    Returns a list of action entries per chunk, in order. Emails still
+    unanswered after max_retries simply have no entries.
+    """
+    results = [[] for _ in chunks]
+    # (chunk index, emails of that chunk still waiting for an answer)
+    pending = list(enumerate(chunks))
 
-        # Print the raw response for debugging
-        console.print(f"[bold yellow]Raw Response:[/bold yellow]\n{response.text}")
+    with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as executor:
+        for attempt in range(max_retries + 1):
+            if not pending:
+                break
+            if attempt:
+                waiting = sum(len(emails) for _, emails in pending)
+                metrics.increment("retries_total", len(pending), api="gemini")
+                console.print(f"[bold yellow]Re-asking for {waiting} unanswered email(s) (attempt {attempt + 1}).[/bold yellow]")
+            outcomes = executor.map(
+                lambda item: classify_chunk(item[1], general_preferences, specific_preferences, user_id),
+                pending,
+            )
+            still_pending = []
+            for (index, emails), entries in zip(pending, list(outcomes)):
+                entries = entries or []
+                results[index].extend(entries)
+                answered = {entry["email_id"] for entry in entries}
+                missing = [email for email in emails if email.get("id") not in answered]
+                if missing:
+                    still_pending.append((index, missing))
+            pending = still_pending
 
-        # Clean and parse the response
-        clean_response = clean_response_string(response.text)
-        if not clean_response:
-            console.print("[bold red]Failed to clean and parse the response.[/bold red]")
-            return
+    if pending:
+        console.print(f"[bold red]{sum(len(emails) for _, emails in pending)} email(s) could not be classified.[/bold red]")
+    return results
 
-        # Save the structured actionable data to a JSON file
-        json_file = os.path.join("docs", "categorized_emails_and_tasks.json")
-        with open(json_file, "w", encoding="utf-8") as file:
-            json.dump(clean_response, file, indent=4)
-        console.print(f"[bold green]Structured actions saved to {json_file}[/bold green]")
-        return json.dump(clean_response)
+def record_lookups(local, hits, misses):
+    """Report how many emails were settled locally, served from the cache or left for Gemini."""
+    metrics.increment("cache_requests_total", local, cache="preclassifier", result="hit")
+    metrics.increment("cache_requests_total", hits, cache="classification", result="hit")
+    metrics.increment("cache_requests_total", misses, cache="classification", result="miss")
+    console.print(
+        f"[bold green]Pre-classified {local} email(s) locally; classification cache: "
+        f"{hits} hit(s), {misses} miss(es).[/bold green]"
+    )
 
-    except Exception as e:
-        console.print(f"[bold red]Error communicating with Gemini API:[/bold red] {e}")
+def record_collapsed(emails, threads):
+    """Report how many emails were folded into their thread's latest message."""
+    metrics.increment("collapsed_emails_total", emails - threads)
+    if emails > threads:
+        console.print(f"[bold green]Collapsed {emails} email(s) into {threads} thread(s).[/bold green]")
+
+def label_actions(entries, email_data):
+    """Yield entries as ActionRecords carrying their email's thread, numbered in order within each thread and action type.
+
+    Rewording an entry keeps its ordinal, so sync_index can tell a thread's
+    tasks apart and still patch them when a new classification rewords
+    them, even once a later reply has become the thread's representative.
+    """
+    thread_ids = {email.get("id"): email.get("thread_id") for email in email_data}
+    counts = {}
+    for entry in entries:
+        thread_id = thread_ids.get(entry.get("email_id")) or entry.get("thread_id")
+        key = (thread_id or entry.get("email_id"), entry.get("action_type"))
+        ordinal = counts.get(key, 0)
+        counts[key] = ordinal + 1
+        yield ActionRecord.from_dict({**entry, "thread_id": thread_id, "ordinal": ordinal})
+
+def classify_emails(email_data, general_preferences, specific_preferences, cache, max_concurrency=CLASSIFY_CONCURRENCY):
+    """Classify emails, consulting and filling the classification cache.
 
-def organize():
-    """Main function to process email data with preferences."""
-    # Specify the paths to the JSON files
-    email_file = os.path.join("docs", "emails.json")
-    general_pref_file = os.path.join("docs", "general_preferences.json")
-    specific_pref_file = os.path.join("docs", "specific_preferences.json")
+    Each thread is classified once, through its latest message; the other
+    messages of the thread get an entry of the same importance and no
+    action. Returns the action entries in email order, or None if nothing could be
+    classified. The cache is updated in memory; the caller saves it.
+    """
+    # Settle obviously low-value mail locally and fold each thread into its latest message
+    local_actions, remaining = preclassify(email_data, general_preferences, specific_preferences)
+    representatives, members = collapse_threads(remaining)
+    record_collapsed(len(remaining), len(representatives))
 
+    # Look the thread representatives up in the classification cache
+    prefs_version = cache["preferences_version"]
+    keys = {email.get("id"): classification_cache.cache_key(email, prefs_version, MODEL_NAME) for email in representatives}
+    answers = dict(local_actions)
+    misses = []
+    for email in representatives:
+        actions = classification_cache.lookup(cache, keys[email.get("id")])
+        if actions is None:
+            misses.append(email)
+        else:
+            answers[email.get("id")] = actions
+    record_lookups(len(local_actions), len(representatives) - len(misses), len(misses))
+
+    # Split the cache misses into token-budgeted chunks and classify them concurrently
+    unmatched = []
+    if misses:
+        chunks = chunk_emails(misses)
+        console.print(f"[bold green]Classifying {len(misses)} emails in {len(chunks)} chunk(s).[/bold green]")
+        results = classify_chunks(
+            chunks, general_preferences, specific_preferences, max_concurrency=max_concurrency, user_id=cache["user_id"]
+        )
+
+        # Unanswered emails stay out of the cache so the next run asks again
+        fresh = {}
+        for chunk, result in zip(chunks, results):
+            chunk_ids = {email.get("id") for email in chunk}
+            for entry in result:
+                if entry.get("email_id") in chunk_ids:
+                    fresh.setdefault(entry["email_id"], []).append(entry)
+                else:
+                    unmatched.append(entry)
+
+        for email in misses:
+            if email.get("id") in fresh:
+                answers[email.get("id")] = fresh[email.get("id")]
+                classification_cache.store(cache, keys[email.get("id")], answers[email.get("id")])
+
+    # The rest of each thread takes its representative's answer
+    for email_id, earlier in members.items():
+        for entry in member_actions(answers.get(email_id), earlier):
+            answers[entry["email_id"]] = [entry]
+
+    # Merge local, cached and fresh action lists in email order
+    clean_response = list(label_actions(
+        [entry for email in email_data for entry in answers.get(email.get("id")) or []] + unmatched, email_data
+    ))
+    if not clean_response and any(email.get("id") not in answers for email in email_data):
+        return None
+    return clean_response
+
+def stream_classify_emails(email_data, general_preferences, specific_preferences, cache, max_concurrency=CLASSIFY_CONCURRENCY, max_retries=MAX_CHUNK_RETRIES, unanswered=None):
+    """Like classify_emails, but yield each action entry as soon as it is known.
+
+    Threads are collapsed as in classify_emails. Pre-classified and cached
+    emails come first. The rest are streamed from
+    Gemini chunk by chunk, concurrently, and emails a stream left unanswered
+    are re-asked. Answered emails are stored in the cache in memory; the
+    caller saves it. If unanswered is a list, the ids of emails still
+    unanswered in the end, with the rest of their threads, are added to it.
+    """
+    # Each email's entries come from one source, in order, so they can be numbered as they pass
+    yield from label_actions(_stream_answers(
+        email_data, general_preferences, specific_preferences, cache, max_concurrency, max_retries, unanswered
+    ), email_data)
+
+def _stream_answers(email_data, general_preferences, specific_preferences, cache, max_concurrency, max_retries, unanswered):
+    local_actions, remaining = preclassify(email_data, general_preferences, specific_preferences)
+    for actions in local_actions.values():
+        yield from actions
+    representatives, members = collapse_threads(remaining)
+    record_collapsed(len(remaining), len(representatives))
+
+    prefs_version = cache["preferences_version"]
+    misses = []
+    for email in representatives:
+        key = classification_cache.cache_key(email, prefs_version, MODEL_NAME)
+        actions = classification_cache.lookup(cache, key)
+        if actions is None:
+            misses.append((email, key))
+        else:
+            yield from actions
+            yield from member_actions(actions, members.get(email.get("id"), []))
+    record_lookups(len(local_actions), len(representatives) - len(misses), len(misses))
+    if not misses:
+        return
+
+    keys = {email.get("id"): key for email, key in misses}
+    chunks = chunk_emails([email for email, _ in misses])
+    console.print(f"[bold green]Streaming {len(misses)} emails in {len(chunks)} chunk(s).[/bold green]")
+    done = object()
+    entries = queue.Queue()
+
+    def stream(chunk):
+        pending = chunk
+        try:
+            for attempt in range(max_retries + 1):
+                if attempt:
+                    metrics.increment("retries_total", api="gemini")
+                    console.print(f"[bold yellow]Re-asking for {len(pending)} unanswered email(s) (attempt {attempt + 1}).[/bold yellow]")
+                pending_ids = {email.get("id") for email in pending}
+                fresh = {}
+                for entry in stream_chunk(pending, general_preferences, specific_preferences, cache["user_id"]):
+                    entries.put(entry)
+                    if entry["email_id"] in pending_ids:
+                        fresh.setdefault(entry["email_id"], []).append(entry)
+                # Unanswered emails stay out of the cache so the next run asks again
+                for email_id, actions in fresh.items():
+                    classification_cache.store(cache, keys[email_id], actions)
+                    for entry in member_actions(actions, members.get(email_id, [])):
+                        entries.put(entry)
+                pending = [email for email in pending if email.get("id") not in fresh]
+                if not pending:
+                    break
+            if pending:
+                console.print(f"[bold red]{len(pending)} email(s) could not be classified.[/bold red]")
+                if unanswered is not None:
+                    for email in pending:
+                        unanswered.append(email.get("id"))
+                        unanswered.extend(member.get("id") for member in members.get(email.get("id"), []))
+        finally:
+            entries.put(done)
+
+    with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as executor:
+        for chunk in chunks:
+            executor.submit(stream, chunk)
+        finished = 0
+        while finished < len(chunks):
+            entry = entries.get()
+            if entry is done:
+                finished += 1
+            else:
+                yield entry
+
+def process_emails_with_preferences(email_data, general_preferences, specific_preferences, max_concurrency=CLASSIFY_CONCURRENCY, user_id=DEFAULT_USER):
+    """Pass a user's email data and preferences to Gemini API for processing."""
+    if not email_data:
+        console.print("[bold red]No email data to process.[/bold red]")
+        return
+
+    prefs_version = classification_cache.preferences_version(general_preferences, specific_preferences)
+    cache = classification_cache.load_cache(prefs_version, user_id)
+    clean_response = classify_emails(email_data, general_preferences, specific_preferences, cache, max_concurrency=max_concurrency)
+    classification_cache.save_cache(cache)
+    if clean_response is None:
+        console.print("[bold red]Failed to clean and parse the response.[/bold red]")
+        return
+
+    write_actions(clean_response, user_id)
+    return clean_response
+
+def write_actions(actions, user_id=DEFAULT_USER, classified_at=None):
+    """Upsert the structured actionable data of each classified email into storage."""
+    actions_by_email = storage.group_actions(actions)
+    storage.save_classifications(user_id, actions_by_email, classified_at)
+    console.print(f"[bold green]Structured actions saved for {len(actions_by_email)} email(s).[/bold green]")
+
+def organize(user_id=DEFAULT_USER):
+    """Main function to process a user's latest emails with their preferences."""
     # Step 1: Read email data and preferences
-    email_data = read_email_data(email_file)
-    # email_data=json.loads(str(email_data))
-    general_preferences = read_user_preferences(general_pref_file)
-    specific_preferences = read_user_preferences(specific_pref_file)
+    email_data = storage.get_latest_emails(user_id)
+    general_preferences = storage.get_preferences(user_id, "general")
+    specific_preferences = storage.get_preferences(user_id, "specific")
 
     # Step 2: Process emails with preferences
-    process_emails_with_preferences(email_data, general_preferences, specific_preferences)
-
+    process_emails_with_preferences(email_data, general_preferences, specific_preferences, user_id=user_id)
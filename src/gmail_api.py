@@ -1,146 +1,372 @@
-import os
-import json
-import time
+import re
 import base64
+import codecs
+from html.parser import HTMLParser
 from datetime import datetime, timedelta
 from fastapi import HTTPException
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-from rich.console import Console
+from src.config import Console
+from src import metrics, rate_limit, storage
+from src.google_auth import NotAuthorizedError, get_service, http_factory
+from src.google_batch import execute_in_batches
+from src.records import EmailRecord
+from src.storage import DEFAULT_USER
 
 # Initialize the console for styled output
 console = Console()
 
-# Scopes for Gmail API
-SCOPES = [
-    "https://www.googleapis.com/auth/gmail.readonly",
-    "https://www.googleapis.com/auth/tasks",
-    "https://www.googleapis.com/auth/calendar",
-]
-
-def get_unread_emails_logic():
-    """Authenticate and return the Google Tasks API service."""
-    creds = None
-    token_file = "auth/token.json"
-    credentials_file = "auth/credentials.json"
-
-    # Check if the token.json file exists
-    if os.path.exists(token_file):
-        try:
-            creds = Credentials.from_authorized_user_file(token_file, SCOPES)
-            console.print("[bold green]Loaded credentials from token.json[/bold green]")
-        except Exception as e:
-            console.print(f"[bold red]Error loading credentials from {token_file}:[/bold red] {e}")
-            creds = None
-
-    # If there are no valid credentials available, let the user log in.
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            try:
-                creds.refresh(Request())
-                console.print("[bold green]Access token refreshed successfully.[/bold green]")
-            except Exception as e:
-                console.print(f"[bold red]Error refreshing access token:[/bold red] {e}")
-                creds = None  # Force re-authentication
-        else:
-            console.print("[bold yellow]No valid credentials available. Starting authentication flow.[/bold yellow]")
-            try:
-                flow = InstalledAppFlow.from_client_secrets_file(
-                    credentials_file, SCOPES
-                )
-                creds = flow.run_local_server(
-                    port=3000, access_type='offline', prompt='consent'
-                )
-                console.print("[bold green]Authentication successful.[/bold green]")
-            except Exception as e:
-                console.print(f"[bold red]Error during authentication:[/bold red] {e}")
-                return None
-
-        # Save the credentials for the next run
-        if creds:
-            with open(token_file, "w") as token:
-                token.write(creds.to_json())
-            console.print(f"[bold green]Credentials saved to {token_file}.[/bold green]")
+# Maximum number of unread emails fetched per call
+MAX_EMAILS = 500
+# messages.list returns at most 500 ids per page
+LIST_PAGE_SIZE = 500
+# Gmail accepts up to 100 calls per batch but recommends at most 50
+BATCH_SIZE = 50
+# Number of batch requests in flight at once
+FETCH_WORKERS = 4
+# Gmail quota units charged per call of each method
+GET_COST = 5
+LIST_COST = 5
+HISTORY_COST = 2
+PROFILE_COST = 1
+# Sync-state key holding the last synced mailbox historyId
+HISTORY_ID_KEY = "gmail_history_id"
+# Labels Gmail puts on unread mail in the Primary category
+UNREAD_PRIMARY_LABELS = {"UNREAD", "CATEGORY_PERSONAL"}
+# Bytes of body text kept per email
+BODY_BYTE_BUDGET = 4096
+# HTML bodies may decode this many times the budget of markup before giving up
+HTML_INPUT_FACTOR = 8
+# Base64 characters decoded per step; a multiple of 4 so every step decodes cleanly
+DECODE_CHUNK_CHARS = 4096
+# Only the parts of a message the parser reads; drops attachment metadata, sizes and filenames
+MESSAGE_FIELDS = (
+    "id,threadId,labelIds,internalDate,"
+    "payload(mimeType,headers(name,value),body/data,"
+    "parts(mimeType,body/data,parts(mimeType,body/data,parts(mimeType,body/data))))"
+)
+
+def get_unread_emails_logic(incremental=False, user_id=DEFAULT_USER, max_results=MAX_EMAILS):
+    """Fetch a user's unread primary emails, store them and return them."""
+    service = get_service("gmail", "v1", user_id)
+    if service is None:
+        raise HTTPException(status_code=401, detail=str(NotAuthorizedError(user_id)))
 
     try:
         # Call the Gmail API
-        service = build("gmail", "v1", credentials=creds)
-
-        # Calculate the Unix timestamp for 2 days ago
-        two_days_ago = datetime.utcnow() - timedelta(days=2)
-        two_days_ago_timestamp = int(two_days_ago.timestamp())
-
-        # Query unread primary emails from the last 2 days
-        query = f"is:unread category:primary after:{two_days_ago_timestamp}"
-        results = service.users().messages().list(userId="me", q=query).execute()
-        messages = results.get("messages", [])
-
-        if not messages:
-            return {"emails": []}
-
-        email_data = []  # List to store email data
-
-        # Fetch details of each unread primary email
-        for message in messages[:10]:  # Limit to first 10 unread primary emails
-            msg = service.users().messages().get(userId="me", id=message["id"]).execute()
-
-            headers = msg["payload"]["headers"]
-            body = ""
-
-            # Extract email subject and sender
-            subject = next(
-                (header["value"] for header in headers if header["name"] == "Subject"),
-                "No Subject",
-            )
-            sender = next(
-                (header["value"] for header in headers if header["name"] == "From"),
-                "Unknown Sender",
-            )
-
-            # Extract email body
-            if "data" in msg["payload"]["body"]:
-                body = msg["payload"]["body"]["data"]
-            elif "parts" in msg["payload"]:
-                body = get_email_body(msg["payload"]["parts"])
-
-            # Decode body from Base64
-            if body:
-                body = base64.urlsafe_b64decode(body).decode("utf-8", errors="ignore")
-
-            # Add email details to the list
-            email_data.append(
-                {
-                    "id": message["id"],
-                    "subject": subject,
-                    "sender": sender,
-                    "body": body.strip(),
-                }
-            )
-
-        # Optionally, save data to a JSON file
-        with open("docs/emails.json", "w") as json_file:
-            json.dump(email_data, json_file, indent=4)
+        with metrics.span("get_unread_emails", incremental=incremental):
+            if incremental:
+                email_data = sync_unread_emails(service, max_results, http_factory(user_id), user_id)
+            else:
+                email_data = fetch_unread_emails(service, max_results, http_factory(user_id), user_id)
+
+        # Upsert this fetch; it becomes the batch the organizer reads
+        storage.upsert_emails(user_id, email_data)
 
         return {"emails": email_data}
 
     except HttpError as error:
         raise HTTPException(status_code=500, detail=f"An error occurred: {error}")
+    except rate_limit.CircuitOpenError as error:
+        raise HTTPException(status_code=503, detail=str(error))
+
+def unread_primary_query():
+    """Gmail search query for unread primary emails from the last 2 days."""
+    # Calculate the Unix timestamp for 2 days ago
+    two_days_ago = datetime.utcnow() - timedelta(days=2)
+    two_days_ago_timestamp = int(two_days_ago.timestamp())
+    return f"is:unread category:primary after:{two_days_ago_timestamp}"
+
+def fetch_unread_emails(service, max_results=MAX_EMAILS, http_factory=None, user_id=DEFAULT_USER):
+    """Fetch and parse unread primary emails from the last 2 days."""
+    message_ids = list_message_ids(service, unread_primary_query(), max_results=max_results, user_id=user_id)
+
+    if not message_ids:
+        return []
+
+    messages = fetch_messages(service, message_ids, http_factory=http_factory, user_id=user_id)
+    return [parse_message(msg) for msg in messages]
+
+def sync_unread_emails(service, max_results=MAX_EMAILS, http_factory=None, user_id=DEFAULT_USER):
+    """Fetch only unread primary emails that arrived since the last sync.
+
+    The first run, and any run whose stored historyId has expired, falls
+    back to a full fetch of the 2-day window.
+    """
+    message_ids, history_id, replay_from = list_new_message_ids(service, max_results, HISTORY_ID_KEY, user_id)
+    failed = []
+    messages = fetch_messages(service, message_ids, http_factory=http_factory, user_id=user_id, failed=failed)
+    email_data = [parse_message(msg) for msg in messages if is_unread_primary(msg)]
+    # Messages that failed to download are replayed by the next sync
+    history_id = history_checkpoint(history_id, replay_from, failed)
+    if history_id is not None:
+        storage.set_sync_state(user_id, HISTORY_ID_KEY, history_id)
+    console.print(f"[bold green]Incremental sync found {len(email_data)} new emails.[/bold green]")
+    return email_data
+
+def list_new_message_ids(service, max_results=MAX_EMAILS, key=HISTORY_ID_KEY, user_id=DEFAULT_USER):
+    """Ids of messages added since the historyId stored under key, with the historyId to store once they are processed.
+
+    Returns (message_ids, history_id, replay_from); replay_from maps each
+    id to the historyId that replays it, for history_checkpoint. Without a
+    stored historyId, or once it has expired, lists the unread primary
+    emails of the 2-day window instead; those ids have no replay point.
+    Messages added since may be read or in other categories; check them
+    with is_unread_primary.
+    """
+    start_history_id = storage.get_sync_state(user_id, key)
+
+    if start_history_id:
+        try:
+            message_ids, history_id, replay_from = list_history_message_ids(service, start_history_id, max_results, user_id)
+        except HttpError as error:
+            # Gmail answers 404 once startHistoryId is too old to replay
+            if error.resp.status != 404:
+                raise
+            console.print("[bold yellow]Stored historyId expired, running a full sync.[/bold yellow]")
+        else:
+            return message_ids, history_id, replay_from
+
+    # Read the profile first so mail arriving during the full fetch is replayed next time
+    metrics.increment("api_calls_total", api="gmail")
+    profile = rate_limit.execute("gmail", service.users().getProfile(userId="me"), user_id, PROFILE_COST)
+    return list_message_ids(service, unread_primary_query(), max_results, user_id), profile["historyId"], {}
+
+def history_checkpoint(history_id, replay_from, missed):
+    """The historyId to store after processing the listed messages, all but the missed ones.
+
+    That is history_id when nothing was missed. Otherwise it is the point
+    the earliest missed message is replayed from, or None, meaning keep the
+    stored one, if a missed message has no replay point.
+    """
+    if not missed:
+        return history_id
+    points = [replay_from.get(message_id) for message_id in missed]
+    if None in points:
+        return None
+    return min(points, key=int)
+
+def is_unread_primary(msg):
+    """Whether a Gmail message resource is unread and in the Primary category."""
+    return UNREAD_PRIMARY_LABELS.issubset(msg.get("labelIds", []))
+
+def list_history_message_ids(service, start_history_id, max_results=MAX_EMAILS, user_id=DEFAULT_USER):
+    """Return ids of messages added since start_history_id, the historyId they bring the mailbox up to, and replay points.
+
+    The replay points map each id to the historyId that lists it again.
+    Stops after the history record that reaches max_results ids, and then
+    returns that record's id rather than the mailbox's latest, so the
+    records left over are replayed by the next sync instead of being lost.
+    """
+    message_ids = []
+    replay_from = {}
+    page_token = None
+    history_id = start_history_id
+    # History lists records after startHistoryId, so a record is replayed from the one before it
+    previous = start_history_id
+    while True:
+        metrics.increment("api_calls_total", api="gmail")
+        request = service.users().history().list(
+            userId="me",
+            startHistoryId=start_history_id,
+            historyTypes=["messageAdded"],
+            pageToken=page_token,
+        )
+        results = rate_limit.execute("gmail", request, user_id, HISTORY_COST)
+        for record in results.get("history", []):
+            for added in record.get("messagesAdded", []):
+                message_id = added["message"]["id"]
+                if message_id not in replay_from:
+                    replay_from[message_id] = previous
+                    message_ids.append(message_id)
+            previous = record["id"]
+            if len(message_ids) >= max_results:
+                # A record is kept whole, so this one may take the list slightly past max_results
+                return message_ids, record["id"], replay_from
+        history_id = results.get("historyId", history_id)
+        page_token = results.get("nextPageToken")
+        if not page_token:
+            break
+    return message_ids, history_id, replay_from
+
+def list_message_ids(service, query, max_results=MAX_EMAILS, user_id=DEFAULT_USER):
+    """List ids of messages matching a query, following nextPageToken across pages.
+
+    Messages of one thread are listed together, at the position of the
+    thread's newest message, so they are fetched and classified together.
+    """
+    message_ids = []
+    threads = {}
+    page_token = None
+    while len(message_ids) < max_results:
+        metrics.increment("api_calls_total", api="gmail")
+        request = service.users().messages().list(
+            userId="me",
+            q=query,
+            pageToken=page_token,
+            maxResults=min(LIST_PAGE_SIZE, max_results - len(message_ids)),
+        )
+        results = rate_limit.execute("gmail", request, user_id, LIST_COST)
+        for message in results.get("messages", []):
+            message_ids.append(message["id"])
+            threads.setdefault(message.get("threadId") or message["id"], []).append(message["id"])
+        page_token = results.get("nextPageToken")
+        if not page_token:
+            break
+    listed = set(message_ids[:max_results])
+    return [message_id for thread in threads.values() for message_id in thread if message_id in listed]
+
+def fetch_messages(service, message_ids, batch_size=BATCH_SIZE, max_workers=FETCH_WORKERS, http_factory=None, user_id=DEFAULT_USER, failed=None):
+    """Fetch full messages through Gmail batch requests.
+
+    Messages that fail to download are reported and skipped; the rest are
+    returned in the order of message_ids. If failed is a list, the ids of
+    skipped messages that still exist (any failure but a 404) are added to it.
+    """
+    requests = [
+        (message_id, service.users().messages().get(userId="me", id=message_id, format="full", fields=MESSAGE_FIELDS))
+        for message_id in message_ids
+    ]
+    messages = []
+    metrics.increment("api_calls_total", len(requests), api="gmail")
+    for result in execute_in_batches(
+        service, requests, batch_size, max_workers, http_factory, api="gmail", user_id=user_id, cost=GET_COST
+    ):
+        if result["ok"]:
+            messages.append(result["response"])
+        else:
+            metrics.increment("api_errors_total", api="gmail")
+            console.print(f"[bold red]Failed to fetch message {result['id']}:[/bold red] {result['error']}")
+            # A deleted message answers 404 and is not worth replaying
+            if failed is not None and result["status"] != 404:
+                failed.append(result["id"])
+    return messages
+
+def parse_message(msg, max_bytes=BODY_BYTE_BUDGET):
+    """Extract id, subject, sender and a size-limited text body from a Gmail message."""
+    headers = msg["payload"]["headers"]
+
+    # Extract email subject and sender
+    subject = next(
+        (header["value"] for header in headers if header["name"] == "Subject"),
+        "No Subject",
+    )
+    sender = next(
+        (header["value"] for header in headers if header["name"] == "From"),
+        "Unknown Sender",
+    )
+    # Bulk-mail signals used by the local pre-classifier
+    list_unsubscribe = any(header["name"].lower() == "list-unsubscribe" for header in headers)
+    precedence = next(
+        (header["value"] for header in headers if header["name"].lower() == "precedence"),
+        "",
+    )
+
+    # Extract email body, preferring plain text over HTML
+    if msg["payload"].get("body", {}).get("data"):
+        mime_type, data = msg["payload"].get("mimeType", "text/plain"), msg["payload"]["body"]["data"]
+    else:
+        mime_type, data = get_email_body(msg["payload"].get("parts", []))
+
+    return EmailRecord(
+        id=msg["id"],
+        thread_id=msg.get("threadId"),
+        internal_date=int(msg.get("internalDate") or 0),
+        subject=subject,
+        sender=sender,
+        body=decode_body(data, mime_type, max_bytes).strip(),
+        list_unsubscribe=list_unsubscribe,
+        precedence=precedence,
+    )
 
 def get_email_body(parts):
-    """Recursively retrieve the plain text body of an email."""
+    """Recursively find the best body part of an email, returning (mime_type, base64 data).
+
+    A text/plain part anywhere in the tree wins over text/html.
+    """
+    html = ("text/html", "")
     for part in parts:
         mime_type = part.get("mimeType", "")
         body = part.get("body", {})
         data = body.get("data", "")
         if mime_type == "text/plain" and data:
-            return data
-        elif mime_type == "text/html" and data:
-            return data
+            return mime_type, data
+        elif mime_type == "text/html" and data and not html[1]:
+            html = (mime_type, data)
         elif "parts" in part:
             result = get_email_body(part["parts"])
-            if result:
+            if result[0] == "text/plain" and result[1]:
                 return result
-    return ""
+            if result[1] and not html[1]:
+                html = result
+    return html
+
+def decode_body(data, mime_type="text/plain", max_bytes=BODY_BYTE_BUDGET):
+    """Decode base64url body data piece by piece, stopping once max_bytes of text are produced.
+
+    HTML is converted to text as it streams in, and at most
+    HTML_INPUT_FACTOR times the budget of raw markup is ever decoded.
+    """
+    if not data:
+        return ""
+    is_html = mime_type == "text/html"
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+    text = _HTMLText() if is_html else None
+    output = []
+    produced = 0
+    input_limit = max_bytes * (HTML_INPUT_FACTOR if is_html else 1)
+    consumed = 0
+
+    for start in range(0, len(data), DECODE_CHUNK_CHARS):
+        piece = data[start:start + DECODE_CHUNK_CHARS]
+        # Gmail may strip padding from the final piece
+        raw = base64.urlsafe_b64decode(piece + "=" * (-len(piece) % 4))
+        raw = raw[:input_limit - consumed]
+        consumed += len(raw)
+        chunk = decoder.decode(raw, final=consumed >= input_limit)
+        if text is not None:
+            text.feed(chunk)
+            chunk = text.drain()
+        output.append(chunk)
+        # HTML text can be non-ASCII, so the budget counts encoded bytes rather than characters
+        produced += len(chunk.encode("utf-8"))
+        if produced >= max_bytes or consumed >= input_limit:
+            break
+
+    if text is not None:
+        text.close()
+        output.append(text.drain())
+    # Cut on a byte boundary, dropping a character the cut would split
+    return "".join(output).encode("utf-8")[:max_bytes].decode("utf-8", errors="ignore")
+
+class _HTMLText(HTMLParser):
+    """Incremental HTML-to-text converter that drops scripts, styles and markup."""
+
+    BLOCK_TAGS = {"p", "div", "br", "li", "tr", "h1", "h2", "h3", "h4", "h5", "h6", "table", "blockquote"}
+    SKIP_TAGS = {"script", "style", "head", "title"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.pieces = []
+        self.skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP_TAGS:
+            self.skipping += 1
+        elif tag in self.BLOCK_TAGS:
+            self.pieces.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP_TAGS:
+            self.skipping = max(0, self.skipping - 1)
+        elif tag in self.BLOCK_TAGS:
+            self.pieces.append("\n")
+
+    def handle_data(self, data):
+        if not self.skipping:
+            self.pieces.append(re.sub(r"[ \t\r\f\v]+", " ", data))
+
+    def drain(self):
+        """Return and forget the text produced so far."""
+        text = re.sub(r"\n\s*\n+", "\n\n", "".join(self.pieces))
+        self.pieces = []
+        return text
@@ -0,0 +1,127 @@
+import os
+import json
+import time
+import hmac
+import base64
+import asyncio
+from src.config import Console
+from src import config, metrics, rate_limit, storage
+from src.google_auth import NotAuthorizedError, get_service
+from src.gmail_api import PROFILE_COST
+from src.storage import DEFAULT_USER
+
+console = Console()
+
+# Sync-state key holding a user's watch: {"email", "topic", "history_id", "expiration"}
+WATCH_KEY = "gmail_watch"
+# Sync-state key holding the historyId up to which pushed mail has been organized
+PUSH_HISTORY_ID_KEY = "push_history_id"
+# Gmail quota units charged per call of users.watch and users.stop
+WATCH_COST = 100
+STOP_COST = 1
+# Labels whose changes are pushed; new mail always lands in the inbox
+WATCH_LABELS = ["INBOX"]
+# Watches lapse after 7 days; Google recommends renewing them daily
+RENEW_BEFORE_SECONDS = 6 * 24 * 60 * 60
+# How often the app looks for watches that are due for renewal
+RENEW_INTERVAL_SECONDS = 60 * 60
+
+def pubsub_topic():
+    """The Pub/Sub topic Gmail publishes to, as projects/<project>/topics/<topic>, from GMAIL_PUBSUB_TOPIC."""
+    config.configure()
+    return os.getenv("GMAIL_PUBSUB_TOPIC")
+
+def verify_token(token):
+    """Whether a push request carries the PUSH_TOKEN set on the subscription's endpoint URL; none passes if it is unset."""
+    config.configure()
+    expected = os.getenv("PUSH_TOKEN")
+    return bool(expected) and hmac.compare_digest((token or "").encode(), expected.encode())
+
+def start_watch(user_id=DEFAULT_USER):
+    """Ask Gmail to publish a user's inbox changes to the Pub/Sub topic, and remember the watch.
+
+    Calling it again renews the watch. The first watch also marks where
+    push processing starts, so only mail arriving from now on is organized
+    by notifications. Raises ValueError if no topic or PUSH_TOKEN is
+    configured, since every notification would then be rejected.
+    """
+    topic = pubsub_topic()
+    if not topic:
+        raise ValueError("GMAIL_PUBSUB_TOPIC is not set.")
+    if not os.getenv("PUSH_TOKEN"):
+        raise ValueError("PUSH_TOKEN is not set.")
+    service = get_service("gmail", "v1", user_id)
+    if service is None:
+        raise NotAuthorizedError(user_id)
+
+    metrics.increment("api_calls_total", 2, api="gmail")
+    profile = rate_limit.execute("gmail", service.users().getProfile(userId="me"), user_id, PROFILE_COST)
+    body = {"topicName": topic, "labelIds": WATCH_LABELS, "labelFilterBehavior": "INCLUDE"}
+    response = rate_limit.execute("gmail", service.users().watch(userId="me", body=body), user_id, WATCH_COST)
+
+    watch = {
+        "email": profile["emailAddress"].lower(),
+        "topic": topic,
+        "history_id": response["historyId"],
+        "expiration": int(response["expiration"]) / 1000,
+    }
+    storage.set_sync_state(user_id, WATCH_KEY, watch)
+    if storage.get_sync_state(user_id, PUSH_HISTORY_ID_KEY) is None:
+        storage.set_sync_state(user_id, PUSH_HISTORY_ID_KEY, response["historyId"])
+    console.print(f"[bold green]Watching {watch['email']} until {time.ctime(watch['expiration'])}.[/bold green]")
+    return watch
+
+def stop_watch(user_id=DEFAULT_USER):
+    """Stop push notifications for a user's mailbox."""
+    service = get_service("gmail", "v1", user_id)
+    if service is None:
+        raise NotAuthorizedError(user_id)
+    metrics.increment("api_calls_total", api="gmail")
+    rate_limit.execute("gmail", service.users().stop(userId="me"), user_id, STOP_COST)
+    storage.delete_sync_state(user_id, WATCH_KEY)
+    storage.delete_sync_state(user_id, PUSH_HISTORY_ID_KEY)
+
+def renew_watches(now=None):
+    """Renew every watch that expires within RENEW_BEFORE_SECONDS; returns the users renewed."""
+    now = time.time() if now is None else now
+    renewed = []
+    for user_id, watch in storage.get_sync_states(WATCH_KEY).items():
+        if watch["expiration"] - now > RENEW_BEFORE_SECONDS:
+            continue
+        try:
+            start_watch(user_id)
+            renewed.append(user_id)
+        except Exception as e:
+            console.print(f"[bold red]Could not renew the Gmail watch of {user_id}:[/bold red] {e}")
+    return renewed
+
+async def keep_watches():
+    """Renew watches in the background for as long as the app runs; idle mailboxes get no notification to renew on."""
+    while True:
+        await asyncio.to_thread(renew_watches)
+        await asyncio.sleep(RENEW_INTERVAL_SECONDS)
+
+def parse_notification(envelope):
+    """The (emailAddress, historyId) of a Pub/Sub push request body; raises ValueError if it is not a Gmail notification."""
+    try:
+        data = json.loads(base64.b64decode(envelope["message"]["data"]))
+        return data["emailAddress"].lower(), int(data["historyId"])
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"Not a Gmail notification: {e}") from e
+
+def notified_user(envelope):
+    """The user whose mailbox has unprocessed changes according to a notification, or None.
+
+    Pub/Sub delivers at least once and out of order, so notifications for
+    unknown mailboxes, and those at or before the historyId already
+    processed, are ignored.
+    """
+    email, history_id = parse_notification(envelope)
+    metrics.increment("push_notifications_total")
+    for user_id, watch in storage.get_sync_states(WATCH_KEY).items():
+        if watch["email"] != email:
+            continue
+        if history_id <= int(storage.get_sync_state(user_id, PUSH_HISTORY_ID_KEY) or 0):
+            return None
+        return user_id
+    return None
@@ -0,0 +1,188 @@
+import os
+import json
+import argparse
+import threading
+from datetime import datetime, timedelta
+from src.config import Console
+from src import storage
+from src.storage import DEFAULT_USER
+
+# Initialize the console for styled output
+console = Console()
+# The Google client libraries are imported inside the functions that use them, keeping app start-up fast
+
+# One token covers every Google API the app talks to
+SCOPES = [
+    "https://www.googleapis.com/auth/gmail.readonly",
+    "https://www.googleapis.com/auth/tasks",
+    "https://www.googleapis.com/auth/calendar",
+]
+CREDENTIALS_FILE = "auth/credentials.json"
+# Discovery documents are kept here so cold starts never fetch them
+DISCOVERY_CACHE_DIR = os.path.join("auth", "discovery_cache")
+DISCOVERY_URL = "https://www.googleapis.com/discovery/v1/apis/{api}/{version}/rest"
+# Access tokens are refreshed this long before they expire
+REFRESH_MARGIN = timedelta(minutes=5)
+
+_credentials = {}
+# One lock per user, so a slow token refresh never holds up another user's requests
+_credentials_locks = {}
+_credentials_locks_lock = threading.Lock()
+_documents = {}
+_documents_lock = threading.Lock()
+# Built services share an httplib2 connection, which is not thread-safe, so each thread gets its own
+_services = threading.local()
+
+class NotAuthorizedError(RuntimeError):
+    """Raised when a user has no usable Google credentials; authorize() fixes it."""
+
+    def __init__(self, user_id=DEFAULT_USER):
+        super().__init__(f"Google account not authorized for {user_id}. Run: python -m src.google_auth --user-id {user_id}")
+
+def get_credentials(user_id=DEFAULT_USER):
+    """Return a user's Google credentials, refreshed before they expire.
+
+    Credentials are read from the user's stored token once; after that they
+    live in memory and are refreshed under the user's lock when they come
+    within REFRESH_MARGIN of expiring. Returns None if the user has no valid
+    credentials; the interactive consent flow only runs from authorize().
+    """
+    with _credentials_lock(user_id):
+        creds = _credentials.get(user_id)
+        if creds is None:
+            creds = _load_credentials(user_id)
+        if creds is not None and _needs_refresh(creds):
+            creds = _refresh_credentials(user_id, creds)
+        if creds is None:
+            # Nothing is cached, so a token saved later by authorize() is picked up on the next call
+            _credentials.pop(user_id, None)
+            console.print(f"[bold yellow]No valid credentials for {user_id}.[/bold yellow]")
+            return None
+        _credentials[user_id] = creds
+        return creds
+
+def authorize(user_id=DEFAULT_USER):
+    """Run the browser consent flow for a user and store the token; returns the credentials or None."""
+    with _credentials_lock(user_id):
+        creds = _run_auth_flow(user_id)
+        if creds is not None:
+            _credentials[user_id] = creds
+        return creds
+
+def get_service(api, version, user_id=DEFAULT_USER):
+    """Return a cached API client for the user and calling thread, or None without credentials."""
+    cache = getattr(_services, "cache", None)
+    if cache is None:
+        cache = _services.cache = {}
+
+    creds = get_credentials(user_id)
+    if creds is None:
+        return None
+    cached = cache.get((user_id, api, version))
+    # A new credentials object (after re-authentication) needs new clients
+    if cached is None or cached[0] is not creds:
+        from googleapiclient.discovery import build_from_document
+        cached = (creds, build_from_document(load_discovery_document(api, version), credentials=creds))
+        cache[(user_id, api, version)] = cached
+    return cached[1]
+
+def http_factory(user_id=DEFAULT_USER):
+    """Return a factory of fresh authorized connections, for callers running batches in parallel."""
+    import httplib2
+    from google_auth_httplib2 import AuthorizedHttp
+
+    creds = get_credentials(user_id)
+    return lambda: AuthorizedHttp(creds, http=httplib2.Http())
+
+def load_discovery_document(api, version):
+    """Load an API's discovery document from memory, the disk cache, the client library or the network."""
+    with _documents_lock:
+        document = _documents.get((api, version))
+        if document is not None:
+            return document
+
+        path = os.path.join(DISCOVERY_CACHE_DIR, f"{api}.{version}.json")
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as json_file:
+                document = json.load(json_file)
+        else:
+            import httplib2
+            from googleapiclient.discovery_cache import get_static_doc
+
+            content = get_static_doc(api, version)
+            if content is None:
+                response, content = httplib2.Http().request(DISCOVERY_URL.format(api=api, version=version))
+                if response.status != 200:
+                    raise RuntimeError(f"Could not fetch the {api} {version} discovery document: HTTP {response.status}")
+            document = json.loads(content)
+            os.makedirs(DISCOVERY_CACHE_DIR, exist_ok=True)
+            with open(path, "w", encoding="utf-8") as json_file:
+                json.dump(document, json_file)
+
+        _documents[(api, version)] = document
+        return document
+
+def _credentials_lock(user_id):
+    with _credentials_locks_lock:
+        return _credentials_locks.setdefault(user_id, threading.Lock())
+
+def _needs_refresh(creds):
+    if not creds.valid:
+        return True
+    # google-auth stores expiry as a naive UTC datetime
+    return creds.expiry is not None and creds.expiry - datetime.utcnow() < REFRESH_MARGIN
+
+def _load_credentials(user_id):
+    token = storage.get_token(user_id)
+    if token is None:
+        return None
+    from google.oauth2.credentials import Credentials
+
+    try:
+        creds = Credentials.from_authorized_user_info(json.loads(token), SCOPES)
+        console.print(f"[bold green]Loaded stored credentials for {user_id}[/bold green]")
+        return creds
+    except Exception as e:
+        console.print(f"[bold red]Error loading stored credentials for {user_id}:[/bold red] {e}")
+        return None
+
+def _refresh_credentials(user_id, creds):
+    if not creds.refresh_token:
+        return None
+    from google.auth.transport.requests import Request
+
+    try:
+        creds.refresh(Request())
+        console.print("[bold green]Access token refreshed successfully.[/bold green]")
+    except Exception as e:
+        console.print(f"[bold red]Error refreshing access token:[/bold red] {e}")
+        return None  # Force re-authentication
+    _save_credentials(user_id, creds)
+    return creds
+
+def _run_auth_flow(user_id):
+    console.print("[bold yellow]No valid credentials available. Starting authentication flow.[/bold yellow]")
+    from google_auth_oauthlib.flow import InstalledAppFlow
+
+    try:
+        flow = InstalledAppFlow.from_client_secrets_file(CREDENTIALS_FILE, SCOPES)
+        creds = flow.run_local_server(port=3000, access_type='offline', prompt='consent')
+        console.print("[bold green]Authentication successful.[/bold green]")
+    except Exception as e:
+        console.print(f"[bold red]Error during authentication:[/bold red] {e}")
+        return None
+    _save_credentials(user_id, creds)
+    return creds
+
+def _save_credentials(user_id, creds):
+    # Save the credentials for the next run
+    storage.save_token(user_id, creds.to_json())
+    console.print(f"[bold green]Credentials saved for {user_id}.[/bold green]")
+
+if __name__ == "__main__":
+    # Usage, from the repository root: python -m src.google_auth --user-id default
+    parser = argparse.ArgumentParser(description="Authorize the app to use a Google account.")
+    parser.add_argument("--user-id", default=DEFAULT_USER, help="user the account belongs to")
+    args = parser.parse_args()
+    if authorize(args.user_id) is None:
+        raise SystemExit(1)
@@ -0,0 +1,91 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from src import metrics, rate_limit
+from src.storage import DEFAULT_USER
+
+# Google batch endpoints accept up to 100 calls, but most APIs recommend at most 50
+BATCH_SIZE = 50
+# Number of batch requests in flight at once
+BATCH_WORKERS = 4
+
+def execute_in_batches(service, requests, batch_size=BATCH_SIZE, max_workers=BATCH_WORKERS, http_factory=None, api=None, user_id=DEFAULT_USER, cost=1):
+    """Execute (request_id, http_request) pairs through the service's batch endpoint.
+
+    Batches run concurrently when http_factory is given, since every worker
+    needs its own HTTP connection. With api given, each batch first waits
+    for cost quota units per call (see rate_limit), and calls that fail with
+    a throttling or transient error are re-sent in a smaller batch after
+    backoff. Returns a result per request, in order, as {"id", "ok",
+    "response", "error", "status"} dicts, status being the HTTP status of a
+    failed call when there is one; one failing call never affects the others.
+    """
+    results = {}
+    errors = {}
+    lock = threading.Lock()
+    local = threading.local()
+
+    def callback(request_id, response, exception):
+        with lock:
+            errors[request_id] = exception
+            results[request_id] = {
+                "id": request_id,
+                "ok": exception is None,
+                "response": response,
+                "error": None if exception is None else str(exception),
+                "status": getattr(getattr(exception, "resp", None), "status", None),
+            }
+
+    def send(chunk):
+        # httplib2 is not thread-safe, so every worker executes on its own connection
+        if http_factory is not None and not hasattr(local, "http"):
+            local.http = http_factory()
+        batch = service.new_batch_http_request(callback=callback)
+        for request_id, request in chunk:
+            batch.add(request, request_id=request_id)
+        try:
+            batch.execute(http=getattr(local, "http", None))
+        except Exception as e:
+            # The whole batch failed in transport, so every call in it failed
+            for request_id, _ in chunk:
+                callback(request_id, None, e)
+
+    def run_batch(chunk):
+        if api is None:
+            send(chunk)
+            return
+        for attempt in range(rate_limit.MAX_RETRIES + 1):
+            try:
+                rate_limit.acquire(api, user_id, cost * len(chunk))
+            except rate_limit.CircuitOpenError as e:
+                for request_id, _ in chunk:
+                    callback(request_id, None, e)
+                return
+            send(chunk)
+            retry = [
+                (request_id, request) for request_id, request in chunk
+                if rate_limit.retryable_status(errors.get(request_id)) is not None
+            ]
+            # One outcome per round trip: throttled if any call was, failed only if every call was
+            failed = [errors[request_id] for request_id, _ in retry]
+            throttled = [error for error in failed if rate_limit.retryable_status(error) == 429]
+            if throttled or len(failed) == len(chunk):
+                rate_limit.record(api, user_id, (throttled or failed)[0])
+            else:
+                rate_limit.record(api, user_id)
+            if not retry or attempt == rate_limit.MAX_RETRIES:
+                return
+            delay = max(rate_limit.retry_delay(error, attempt) for error in failed)
+            metrics.increment("retries_total", len(retry), api=api)
+            time.sleep(delay)
+            chunk = retry
+
+    chunks = [requests[i:i + batch_size] for i in range(0, len(requests), batch_size)]
+    if http_factory is None or max_workers <= 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            run_batch(chunk)
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as executor:
+            list(executor.map(run_batch, chunks))
+
+    return [results[request_id] for request_id, _ in requests]
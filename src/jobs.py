@@ -0,0 +1,159 @@
+import time
+import uuid
+import asyncio
+from collections import OrderedDict
+from src.config import Console
+from src.pipeline import run_organizer
+from src.storage import DEFAULT_USER
+
+console = Console()
+
+# Number of organizer runs executing at once (for different users)
+WORKER_COUNT = 2
+# Finished jobs kept around for status polling; the oldest are forgotten first
+MAX_FINISHED_JOBS = 100
+
+class JobQueue:
+    """In-process queue of organizer runs with a worker pool and per-user locking.
+
+    Submitting a run for a user who already has one waiting returns that job
+    instead of queueing a duplicate, and a per-user lock guarantees two runs
+    for the same mailbox never overlap.
+    """
+
+    def __init__(self, runner=run_organizer, worker_count=WORKER_COUNT):
+        self.runner = runner
+        self.worker_count = worker_count
+        self.jobs = OrderedDict()
+        self.queue = None
+        self.loop = None
+        self.workers = []
+        self.user_locks = {}
+        self.done_events = {}
+
+    def submit(self, user_id=DEFAULT_USER, incremental=False):
+        """Queue an organizer run for a user and return its job record.
+
+        An incremental run only processes mail added since the last one; a
+        burst of push notifications therefore coalesces into one queued run.
+        """
+        self._ensure_workers()
+        for job in self.jobs.values():
+            if job["user_id"] == user_id and job["status"] == "queued" and job["incremental"] == incremental:
+                return job
+
+        job = self._new_job(user_id, incremental)
+        self.queue.put_nowait(job["job_id"])
+        return job
+
+    async def stream(self, user_id=DEFAULT_USER):
+        """Run the organizer for a user right away and yield each action entry as it is classified.
+
+        The run is recorded as a job and still waits for the user's lock.
+        Raises RuntimeError with the job's error if the run fails.
+        """
+        self._ensure_workers()
+        job = self._new_job(user_id)
+        entries = asyncio.Queue()
+        done = object()
+
+        async def run():
+            async with self.user_locks.setdefault(user_id, asyncio.Lock()):
+                await self._run(job, on_action=entries.put_nowait)
+            entries.put_nowait(done)
+
+        # Keep a reference so the run finishes even if the client goes away
+        task = asyncio.create_task(run())
+        while (entry := await entries.get()) is not done:
+            yield entry
+        await task
+        if job["status"] == "failed":
+            raise RuntimeError(job["error"])
+
+    def _new_job(self, user_id, incremental=False):
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "user_id": user_id,
+            "incremental": incremental,
+            "status": "queued",
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "duration": None,
+            "stages": {},
+            "actions": None,
+            "error": None,
+        }
+        self.jobs[job["job_id"]] = job
+        self.done_events[job["job_id"]] = asyncio.Event()
+        self._forget_old_jobs()
+        return job
+
+    def get(self, job_id):
+        """Return a job record, or None if it is unknown or was forgotten."""
+        return self.jobs.get(job_id)
+
+    async def wait(self, job_id):
+        """Wait until a job has finished and return its record."""
+        job = self.jobs[job_id]
+        await self.done_events[job_id].wait()
+        return job
+
+    def _ensure_workers(self):
+        # Workers are bound to the running event loop, so they start on first use
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:
+            self.loop = loop
+            self.user_locks = {}
+            self.queue = asyncio.Queue()
+            self.workers = [asyncio.create_task(self._worker()) for _ in range(self.worker_count)]
+
+    async def _worker(self):
+        while True:
+            job_id = await self.queue.get()
+            job = self.jobs.get(job_id)
+            if job is not None:
+                lock = self.user_locks.setdefault(job["user_id"], asyncio.Lock())
+                async with lock:
+                    await self._run(job, incremental=job["incremental"])
+            self.queue.task_done()
+
+    async def _run(self, job, **runner_options):
+        job["status"] = "running"
+        job["started_at"] = time.time()
+        try:
+            actions = await self.runner(
+                job["user_id"], progress=lambda *args: self._record_stage(job, *args), **runner_options
+            )
+            job["actions"] = len(actions or [])
+            job["status"] = "succeeded"
+        except Exception as e:
+            console.print(f"[bold red]Organizer job {job['job_id']} failed:[/bold red] {e}")
+            job["error"] = str(e)
+            job["status"] = "failed"
+        job["finished_at"] = time.time()
+        job["duration"] = job["finished_at"] - job["started_at"]
+        self.done_events.pop(job["job_id"]).set()
+
+    def _record_stage(self, job, stage, event, count=0):
+        now = time.time()
+        record = job["stages"].setdefault(
+            stage, {"status": "pending", "started_at": None, "finished_at": None, "duration": None, "items": 0}
+        )
+        record["items"] = count
+        if event == "started":
+            record["status"] = "running"
+            record["started_at"] = now
+        elif event == "finished":
+            record["status"] = "finished"
+            record["finished_at"] = now
+            record["duration"] = now - (record["started_at"] or now)
+
+    def _forget_old_jobs(self):
+        finished = [
+            job_id for job_id, job in self.jobs.items() if job["status"] in ("succeeded", "failed")
+        ]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job_id]
+
+job_queue = JobQueue()
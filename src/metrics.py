@@ -0,0 +1,136 @@
+import os
+import sys
+import json
+import time
+import threading
+from functools import wraps
+from contextlib import contextmanager
+from src import config
+
+# Metric names are prefixed so they stay distinct on a shared Prometheus server
+PREFIX = "organize_"
+# Upper bounds, in seconds, of the span duration histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+HELP = {
+    "span_seconds": "Duration of instrumented operations.",
+    "api_calls_total": "Calls made to external APIs.",
+    "api_errors_total": "Failed calls to external APIs.",
+    "retries_total": "Requests re-sent after a failed or incomplete answer.",
+    "circuit_opened_total": "Times an API's circuit breaker opened after repeated failures.",
+    "tokens_total": "Gemini tokens sent and received.",
+    "cache_requests_total": "Cache lookups by result.",
+    "collapsed_emails_total": "Emails classified through their thread's latest message instead of on their own.",
+    "push_notifications_total": "Gmail push notifications received.",
+    "calendar_conflicts_total": "Proposed calendar events held back because they overlap busy time or a preferred event.",
+}
+
+_lock = threading.Lock()
+# Set JSON_LOGS=1 in .env to also write every span and event as one JSON line to stderr; read on first log()
+_json_logs = None
+_counters = {}
+# (name, labels) -> [bucket counts..., sum, count]
+_histograms = {}
+
+def increment(name, amount=1, **labels):
+    """Add to a counter."""
+    if not amount:
+        return
+    key = (name, _label_key(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+def observe(name, value, **labels):
+    """Record one observation in a histogram."""
+    key = (name, _label_key(labels))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [0] * (len(LATENCY_BUCKETS) + 2)
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                histogram[index] += 1
+        histogram[-2] += value
+        histogram[-1] += 1
+
+@contextmanager
+def span(name, **labels):
+    """Time the enclosed block as span_seconds{span=name}, including when it raises."""
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        observe("span_seconds", duration, span=name, **labels)
+        log("span", span=name, duration=round(duration, 6), error=error, **labels)
+
+def timed(name):
+    """Decorator form of span for whole functions."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def log(event, **fields):
+    """Write a structured JSON log line when JSON_LOGS is enabled."""
+    if json_logs():
+        sys.stderr.write(json.dumps({"ts": time.time(), "event": event, **fields}, default=str) + "\n")
+
+def json_logs():
+    """Whether JSON_LOGS is enabled, read once after .env is loaded."""
+    global _json_logs
+    if _json_logs is None:
+        config.configure()
+        _json_logs = os.getenv("JSON_LOGS") == "1"
+    return _json_logs
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted((key, list(values)) for key, values in _histograms.items())
+
+    lines = []
+    described = set()
+    for (name, labels), value in counters:
+        _describe(lines, described, name, "counter")
+        lines.append(f"{PREFIX}{name}{_format_labels(labels)} {value}")
+    for (name, labels), values in histograms:
+        _describe(lines, described, name, "histogram")
+        for bound, count in zip(LATENCY_BUCKETS, values):
+            lines.append(f"{PREFIX}{name}_bucket{_format_labels(labels + (('le', str(bound)),))} {count}")
+        lines.append(f"{PREFIX}{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {values[-1]}")
+        lines.append(f"{PREFIX}{name}_sum{_format_labels(labels)} {values[-2]}")
+        lines.append(f"{PREFIX}{name}_count{_format_labels(labels)} {values[-1]}")
+    return "\n".join(lines) + "\n"
+
+def reset():
+    """Forget every recorded value."""
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+def _describe(lines, described, name, kind):
+    if name not in described:
+        described.add(name)
+        lines.append(f"# HELP {PREFIX}{name} {HELP.get(name, name)}")
+        lines.append(f"# TYPE {PREFIX}{name} {kind}")
+
+def _label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (key, value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for key, value in labels
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
@@ -0,0 +1,255 @@
+import time
+import asyncio
+import threading
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from src.config import Console
+from src import classification_cache, metrics, storage
+from src.gmail_api import (
+    BATCH_SIZE,
+    MAX_EMAILS,
+    fetch_messages,
+    history_checkpoint,
+    is_unread_primary,
+    list_message_ids,
+    list_new_message_ids,
+    parse_message,
+    unread_primary_query,
+)
+from src.gmail_watch import PUSH_HISTORY_ID_KEY
+from src.gemini import (
+    CLASSIFY_CONCURRENCY,
+    MAX_EMAILS_PER_CHUNK,
+    stream_classify_emails,
+    write_actions,
+)
+from src.google_auth import NotAuthorizedError, get_service, http_factory
+from src.google_batch import BATCH_SIZE as WRITE_BATCH_SIZE
+from src.tasks import sync_tasks, authenticate_google_tasks, is_task_entry
+from src.calendars import sync_events, authenticate_google_calendar, is_calendar_entry, reschedule_tasks
+from src.storage import DEFAULT_USER
+
+console = Console()
+
+# Marks the end of a stage's output on its queue
+DONE = object()
+# Bound on items waiting between stages, so a fast stage cannot run far ahead
+QUEUE_SIZE = 100
+# How often a classifier thread waiting on the writers checks whether the run is being cancelled
+STOP_POLL_SECONDS = 0.1
+
+async def finish_in_thread(func, *args, on_cancel=None, **kwargs):
+    """Run func in a worker thread like asyncio.to_thread, but if cancelled, wait for it to finish first.
+
+    A thread cannot be interrupted, so a cancelled run would otherwise end
+    while the call is still writing. on_cancel, if given, is called first
+    to ask the call to stop early.
+    """
+    call = asyncio.ensure_future(asyncio.to_thread(func, *args, **kwargs))
+    try:
+        return await asyncio.shield(call)
+    except asyncio.CancelledError:
+        if on_cancel is not None:
+            on_cancel()
+        await asyncio.wait([call])
+        # The run is already failing or cancelled, so an error the call ended with is not reported again
+        if not call.cancelled():
+            call.exception()
+        raise
+
+def first_error(error):
+    """The first exception inside nested exception groups, so a failed run reports its stage's own error."""
+    while isinstance(error, BaseExceptionGroup):
+        error = error.exceptions[0]
+    return error
+
+async def run_organizer(user_id=DEFAULT_USER, max_results=MAX_EMAILS, progress=None, on_action=None, incremental=False):
+    """Fetch, classify and write actions for a user's unread emails as one overlapping pipeline.
+
+    Gmail batches feed the classifier as soon as they download, and Gemini
+    responses are streamed so each task entry reaches the task writer the
+    moment its JSON object closes; calendar entries are checked for
+    conflicts together once classification ends. Each stage upserts its
+    own rows into storage as it goes. Blocking Google, Gemini and storage
+    calls run in worker threads so the event loop stays free.
+
+    progress, if given, is called as progress(stage, event, count) with
+    event one of "started", "item" or "finished"; on_action, if given, is
+    called with every action entry as it is classified. When incremental,
+    only unread primary mail added since the last incremental run is
+    processed, as push notifications ask for.
+    """
+    report = progress or (lambda stage, event, count=0: None)
+    general_preferences = await asyncio.to_thread(storage.get_preferences, user_id, "general")
+    specific_preferences = await asyncio.to_thread(storage.get_preferences, user_id, "specific")
+    prefs_version = classification_cache.preferences_version(general_preferences, specific_preferences)
+    cache = await asyncio.to_thread(classification_cache.load_cache, prefs_version, user_id)
+    # Rows written by this run share one timestamp, which marks them as the user's latest batch
+    run_at = time.time()
+
+    email_queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+    action_queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+    emails = []
+    actions = []
+    # The historyId to record once this incremental run has processed everything before it, where each
+    # listed message is replayed from, and the messages this run failed to download or classify
+    history_id = None
+    replay_from = {}
+    missed = []
+
+    async def fetch_stage():
+        nonlocal history_id, replay_from
+        report("fetch", "started")
+        try:
+            service = await asyncio.to_thread(get_service, "gmail", "v1", user_id)
+            if service is None:
+                raise NotAuthorizedError(user_id)
+            if incremental:
+                message_ids, history_id, replay_from = await asyncio.to_thread(
+                    list_new_message_ids, service, max_results, PUSH_HISTORY_ID_KEY, user_id
+                )
+            else:
+                message_ids = await asyncio.to_thread(list_message_ids, service, unread_primary_query(), max_results, user_id)
+            connection_factory = await asyncio.to_thread(http_factory, user_id)
+            for start in range(0, len(message_ids), BATCH_SIZE):
+                messages = await asyncio.to_thread(
+                    fetch_messages, service, message_ids[start:start + BATCH_SIZE],
+                    http_factory=connection_factory, user_id=user_id, failed=missed,
+                )
+                batch = [parse_message(msg) for msg in messages if is_unread_primary(msg)]
+                await finish_in_thread(storage.upsert_emails, user_id, batch, run_at)
+                for email in batch:
+                    emails.append(email)
+                    report("fetch", "item", len(emails))
+                    await email_queue.put(email)
+        finally:
+            report("fetch", "finished", len(emails))
+        # Only a finished stage closes its queue; a failing one cancels the others instead
+        await email_queue.put(DONE)
+
+    async def classify_stage():
+        semaphore = asyncio.Semaphore(CLASSIFY_CONCURRENCY)
+        # Set when the run is cancelled, so classifier threads stop waiting on writers that are gone
+        stop = threading.Event()
+
+        async def emit(entry):
+            actions.append(entry)
+            report("classify", "item", len(actions))
+            if on_action is not None:
+                on_action(entry)
+            await action_queue.put(entry)
+
+        def stream(batch, loop):
+            result = []
+            for entry in stream_classify_emails(
+                batch, general_preferences, specific_preferences, cache, max_concurrency=1, unanswered=missed
+            ):
+                result.append(entry)
+                # Hand each entry to the event loop as it arrives, waiting if the writers are behind
+                emitted = asyncio.run_coroutine_threadsafe(emit(entry), loop)
+                while not stop.is_set():
+                    try:
+                        emitted.result(timeout=STOP_POLL_SECONDS)
+                        break
+                    except FutureTimeoutError:
+                        pass
+                if stop.is_set():
+                    emitted.cancel()
+                    break
+            return result
+
+        async def classify(batch):
+            async with semaphore:
+                result = await finish_in_thread(stream, batch, asyncio.get_running_loop(), on_cancel=stop.set)
+                if result:
+                    await finish_in_thread(write_actions, result, user_id, run_at)
+
+        report("classify", "started")
+        try:
+            async with asyncio.TaskGroup() as chunks:
+                batch = []
+                while True:
+                    email = await email_queue.get()
+                    # Dispatch a full chunk once its last thread is complete (a thread's messages arrive
+                    # together), or whatever is left at the end, so threads are collapsed whole
+                    if batch and (email is DONE or (
+                        len(batch) >= MAX_EMAILS_PER_CHUNK and email.get("thread_id") != batch[-1].get("thread_id")
+                    )):
+                        chunks.create_task(classify(batch))
+                        batch = []
+                    if email is DONE:
+                        break
+                    batch.append(email)
+        finally:
+            report("classify", "finished", len(actions))
+        await action_queue.put(DONE)
+
+    async def write_stage():
+        services = await asyncio.gather(
+            asyncio.to_thread(authenticate_google_tasks, user_id),
+            asyncio.to_thread(authenticate_google_calendar, user_id),
+            return_exceptions=True,
+        )
+        # Keep draining the queue even if a service is unavailable, so upstream stages never stall
+        tasks_service, calendar_service = [
+            None if isinstance(service, Exception) else service for service in services
+        ]
+        # A service object shares one HTTP connection, so each service writes one batch at a time
+        locks = {"task": asyncio.Lock(), "calendar": asyncio.Lock()}
+        written = 0
+
+        async def write(func, service, lock, entries):
+            nonlocal written
+            if not entries or service is None:
+                return []
+            async with lock:
+                results = await finish_in_thread(func, service, entries, user_id=user_id)
+            written += sum(result["ok"] for result in results)
+            report("write", "item", written)
+            return results
+
+        report("write", "started")
+        # Events are checked for conflicts all together, so the user's preferred ones win wherever they came from
+        events = []
+        finished = False
+        async with asyncio.TaskGroup() as writes:
+            while not finished:
+                # Wait for one entry, then take whatever else is already waiting as the same batch
+                entries = [await action_queue.get()]
+                while len(entries) < WRITE_BATCH_SIZE and not action_queue.empty():
+                    entries.append(action_queue.get_nowait())
+                if entries[-1] is DONE:
+                    entries.pop()
+                    finished = True
+                writes.create_task(write(
+                    sync_tasks, tasks_service, locks["task"], [entry for entry in entries if is_task_entry(entry)]
+                ))
+                events.extend(entry for entry in entries if is_calendar_entry(entry))
+            results = await write(sync_events, calendar_service, locks["calendar"], events)
+            writes.create_task(write(sync_tasks, tasks_service, locks["task"], reschedule_tasks(results)))
+        report("write", "finished", written)
+
+    async def timed(stage, coroutine):
+        # Stages overlap, so each span runs from the stage's start to its own end
+        with metrics.span("organizer_stage", stage=stage):
+            await coroutine
+
+    # If a stage fails, the others are cancelled and their in-flight calls finish before the run ends
+    with metrics.span("organizer_run"):
+        try:
+            async with asyncio.TaskGroup() as stages:
+                stages.create_task(timed("fetch", fetch_stage()))
+                stages.create_task(timed("classify", classify_stage()))
+                stages.create_task(timed("write", write_stage()))
+        except BaseExceptionGroup as error:
+            raise first_error(error) from error
+    # Mail that could not be downloaded or classified is replayed by the next incremental run
+    history_id = history_checkpoint(history_id, replay_from, missed)
+    if history_id is not None:
+        await asyncio.to_thread(storage.set_sync_state, user_id, PUSH_HISTORY_ID_KEY, history_id)
+    if not emails:
+        console.print("[bold red]No email data to process.[/bold red]")
+        return []
+
+    await asyncio.to_thread(classification_cache.save_cache, cache)
+    console.print(f"[bold green]Organizer processed {len(emails)} emails into {len(actions)} actions.[/bold green]")
+    return actions
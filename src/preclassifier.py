@@ -0,0 +1,138 @@
+import re
+from functools import lru_cache
+from src.preferences_api import topics
+
+# Extra vocabulary per general topic, on top of the words in the topic name itself
+TOPIC_KEYWORDS = {
+    "Project Deadlines": ["deadline", "due", "submission", "submit", "assignment", "milestone", "deliverable"],
+    "Work meetings": ["meeting", "invite", "invitation", "agenda", "standup", "sync", "call", "calendar"],
+    "Learning Opportunities": ["course", "webinar", "workshop", "tutorial", "learn", "certification", "lecture"],
+    "Entertainment": ["movie", "music", "show", "episode", "stream", "concert", "game", "netflix", "spotify"],
+    "Informal Meetings": ["coffee", "lunch", "dinner", "catch up", "hangout", "party"],
+    "Technology Updates": ["release", "update", "version", "launch", "ai", "software", "beta"],
+    "Career opportunities": ["job", "jobs", "hiring", "intern", "internship", "interview", "recruiter", "position", "career"],
+    "Online shopping": ["order", "sale", "discount", "deal", "offer", "cart", "shipped", "delivery", "coupon", "% off"],
+    "Health and Fitness": ["workout", "fitness", "health", "diet", "gym", "yoga", "steps", "doctor"],
+    "Social Media Notifications": ["liked", "commented", "followed", "mentioned", "tagged", "digest", "friend request", "new post", "upvote"],
+}
+# Senders whose mail is known to belong to one topic, matched on the domain suffix
+DOMAIN_TOPICS = {
+    "quora.com": "Social Media Notifications",
+    "facebookmail.com": "Social Media Notifications",
+    "instagram.com": "Social Media Notifications",
+    "twitter.com": "Social Media Notifications",
+    "x.com": "Social Media Notifications",
+    "pinterest.com": "Social Media Notifications",
+    "redditmail.com": "Social Media Notifications",
+    "tiktok.com": "Social Media Notifications",
+    "amazon.com": "Online shopping",
+    "amazon.in": "Online shopping",
+    "flipkart.com": "Online shopping",
+    "myntra.com": "Online shopping",
+    "ebay.com": "Online shopping",
+    "etsy.com": "Online shopping",
+    "ajio.com": "Online shopping",
+    "meesho.com": "Online shopping",
+}
+# Sender mailbox names typical of automated bulk mail
+BULK_SENDER = re.compile(r"(no-?reply|donotreply|digest|newsletter|notifications?|updates|marketing|promo|mailer)", re.I)
+BULK_PRECEDENCE = {"bulk", "list", "junk"}
+# Words that always need the model's judgement, however low-value the sender looks
+URGENT_KEYWORDS = ["deadline", "meeting", "invite", "interview", "rsvp", "urgent", "reply", "schedule", "due", "reminder"]
+# Number of lowest-ranked general topics treated as least preferred, matching the prompt
+LEAST_PREFERRED_COUNT = 2
+# Ranks at or above this mark a specific preference as one of the user's top priorities
+TOP_RANK = 3
+# How much of the body the keyword scorer looks at
+BODY_PREFIX_CHARS = 500
+
+def preclassify(email_data, general_preferences, specific_preferences):
+    """Label obviously low-value emails locally and leave the rest for Gemini.
+
+    Returns (local_actions, remaining) where local_actions maps email id to
+    the action entries decided locally, and remaining lists the emails that
+    still need the model, in their original order.
+    """
+    least_preferred = least_preferred_topics(general_preferences)
+    protected = keyword_pattern(tuple(
+        keyword
+        for name, rank in (specific_preferences or {}).items()
+        if rank <= TOP_RANK
+        for keyword in keywords_for(name)
+    ))
+
+    local_actions = {}
+    remaining = []
+    for email in email_data:
+        if is_low_value(email, least_preferred, protected):
+            local_actions[email.get("id")] = [{
+                "email_id": email.get("id"),
+                "importance": "least important",
+                "subject": email.get("subject", "No Subject"),
+                "action_type": "none",
+                "action_details": {},
+            }]
+        else:
+            remaining.append(email)
+    return local_actions, remaining
+
+def is_low_value(email, least_preferred, protected_pattern):
+    """Whether an email is bulk mail about one of the user's least preferred topics."""
+    if not least_preferred or not is_bulk(email):
+        return False
+
+    subject = (email.get("subject") or "").lower()
+    text = subject + "\n" + (email.get("body") or "")[:BODY_PREFIX_CHARS].lower()
+    if keyword_pattern(tuple(URGENT_KEYWORDS)).search(subject):
+        return False
+    if protected_pattern.search(text):
+        return False
+    return best_topic(email, text) in least_preferred
+
+def is_bulk(email):
+    """Header and sender signals of automated mail."""
+    if email.get("list_unsubscribe"):
+        return True
+    if (email.get("precedence") or "").strip().lower() in BULK_PRECEDENCE:
+        return True
+    mailbox = sender_address(email).split("@")[0]
+    return bool(BULK_SENDER.search(mailbox))
+
+def best_topic(email, text):
+    """The general topic an email most likely belongs to, or None."""
+    domain = sender_address(email).split("@")[-1]
+    for known_domain, topic in DOMAIN_TOPICS.items():
+        if domain == known_domain or domain.endswith("." + known_domain):
+            return topic
+
+    # Score each topic by how many of its distinct keywords appear
+    scores = {
+        topic: len(set(keyword_pattern(tuple(keywords_for(topic))).findall(text)))
+        for topic in topics
+    }
+    topic, score = max(scores.items(), key=lambda item: item[1])
+    return topic if score > 0 else None
+
+def least_preferred_topics(general_preferences):
+    """The user's lowest-ranked general topics."""
+    ranked = sorted((general_preferences or {}).items(), key=lambda item: item[1])
+    return {topic for topic, _ in ranked[-LEAST_PREFERRED_COUNT:]} if ranked else set()
+
+def keywords_for(topic):
+    """Keywords for a topic: the significant words of its name plus any curated vocabulary."""
+    words = [word for word in re.findall(r"[a-z]+", topic.lower()) if len(word) > 3]
+    return words + TOPIC_KEYWORDS.get(topic, [])
+
+def sender_address(email):
+    """The bare, lowercased address from a From header such as 'Name <user@host>'."""
+    sender = email.get("sender") or ""
+    match = re.search(r"<([^>]+)>", sender)
+    return (match.group(1) if match else sender).strip().lower()
+
+@lru_cache(maxsize=256)
+def keyword_pattern(keywords):
+    """One compiled whole-word pattern matching any of the keywords; matches nothing if empty."""
+    if not keywords:
+        return re.compile(r"(?!x)x")
+    alternation = "|".join(re.escape(keyword) for keyword in sorted(set(keywords), key=len, reverse=True))
+    return re.compile(r"(?<!\w)(" + alternation + r")(?!\w)")
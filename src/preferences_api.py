@@ -1,23 +1,12 @@
-import os
-import json
-import google.generativeai as genai
-from fastapi import FastAPI, HTTPException
+from fastapi import HTTPException
 from pydantic import BaseModel
 from typing import List, Dict
+from src import metrics, rate_limit, storage, topic_cache
+from src.config import genai
+from src.storage import DEFAULT_USER
+from src.response_parser import STRING_LIST_SCHEMA, parse_string_list
 
-# Configure the Gemini API with the API key
-from dotenv import load_dotenv
-import os
-
-# Load the .env file
-load_dotenv()
-
-# Access the API key
-api_key = os.getenv("API_KEY")
-
-genai.configure(api_key=api_key)   # Replace with your API key
-
-app = FastAPI()
+MODEL_NAME = "gemini-1.5-flash-8b"
 
 # Initial list of general topics
 topics = [
@@ -42,13 +31,11 @@ class TopPreferencesInput(BaseModel):
 class SpecificPreferencesInput(BaseModel):
     preferences: Dict[str, int]
 
-@app.get("/general-topics")
 def get_general_topics():
     """Retrieve the list of general topics."""
     return {"topics": topics}
 
-@app.post("/general-preferences")
-def submit_general_preferences(input: GeneralPreferencesInput):
+def submit_general_preferences(input: GeneralPreferencesInput, user_id: str = DEFAULT_USER):
     """Submit user rankings for general topics and get top preferences."""
     general_preferences = input.preferences
     # Validate the preferences
@@ -61,29 +48,12 @@ def submit_general_preferences(input: GeneralPreferencesInput):
     # Sort the preferences
     sorted_preferences = sorted(general_preferences.items(), key=lambda x: x[1])
     top_preferences = [topic for topic, rank in sorted_preferences[:5]]
-    # Save the general preferences to a JSON file
-    with open("docs/general_preferences.json", "w", encoding="utf-8") as file:
-        json.dump(general_preferences, file, indent=4)
+    # Replace the user's general preference rows
+    storage.save_preferences(user_id, "general", general_preferences)
     return {"top_preferences": top_preferences}
 
-def clean_response_string(response_text):
-    """Clean and parse the response string from Gemini."""
-    try:
-        response = response_text.strip()
-        start_idx = response.find('[')
-        end_idx = response.rfind(']') + 1
-        json_text = response[start_idx:end_idx]
-        cleaned_data = json.loads(json_text)
-        return cleaned_data
-    except json.JSONDecodeError as e:
-        return None
-    except Exception as e:
-        return None
-
-@app.post("/specific-topics")
-def get_specific_topics(input: TopPreferencesInput):
-    """Fetch specific topics from Gemini based on top preferences."""
-    top_preferences = input.top_preferences
+def generate_specific_topics(top_preferences):
+    """Ask Gemini for detailed inbox categories derived from the ranked top preferences."""
     # Generate the prompt for Gemini
     prompt = (
         f"You are an intelligent assistant. You will be given names of five categories that are very important to the user in his mail inbox. For better understanding of these preferences, prepare a more detailed list of 10 categories that might be present in his inbox. Top preferences:\n\n"
@@ -93,20 +63,40 @@ def get_specific_topics(input: TopPreferencesInput):
 
     prompt += "Provide the suggestions as a JSON array of strings."
 
+    # Send the request to Gemini
+    model = genai().GenerativeModel(
+        model_name=MODEL_NAME,
+        generation_config=genai().GenerationConfig(
+            response_mime_type="application/json",
+            response_schema=STRING_LIST_SCHEMA,
+        ),
+    )
+    metrics.increment("api_calls_total", api="gemini")
+    with metrics.span("gemini_send_message"):
+        chat_session = model.start_chat(history=[])
+        response = rate_limit.call("gemini", lambda: chat_session.send_message(prompt))
+    # Parse the response
+    return parse_string_list(response.text)
+
+def get_specific_topics(input: TopPreferencesInput):
+    """Fetch specific topics from Gemini based on top preferences."""
+    top_preferences = input.top_preferences
+    # Repeat combinations are served from the cache
+    specific_topics = topic_cache.get(top_preferences, MODEL_NAME)
+    metrics.increment("cache_requests_total", cache="specific_topics", result="hit" if specific_topics else "miss")
+    if specific_topics:
+        return {"specific_topics": specific_topics}
+
     try:
-        # Send the request to Gemini
-        model = genai.GenerativeModel(model_name="gemini-1.5-flash-8b")
-        response = model.start_chat(history=[]).send_message(prompt)
-        # Parse the response
-        specific_topics = clean_response_string(response.text)
+        specific_topics = generate_specific_topics(top_preferences)
         if not specific_topics:
             raise HTTPException(status_code=500, detail="Failed to parse response from Gemini.")
+        topic_cache.put(top_preferences, MODEL_NAME, specific_topics)
         return {"specific_topics": specific_topics}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/specific-preferences")
-def submit_specific_preferences(input: SpecificPreferencesInput):
+def submit_specific_preferences(input: SpecificPreferencesInput, user_id: str = DEFAULT_USER):
     """Submit user rankings for specific topics."""
     specific_preferences = input.preferences
     # Validate the preferences
@@ -116,7 +106,6 @@ def submit_specific_preferences(input: SpecificPreferencesInput):
     ranks = list(specific_preferences.values())
     if len(set(ranks)) != len(ranks):
         raise HTTPException(status_code=400, detail="Ranks must be unique.")
-    # Save the specific preferences to a JSON file
-    with open("docs/specific_preferences.json", "w", encoding="utf-8") as file:
-        json.dump(specific_preferences, file, indent=4)
+    # Replace the user's specific preference rows
+    storage.save_preferences(user_id, "specific", specific_preferences)
     return {"message": "Specific preferences saved successfully."}
@@ -0,0 +1,170 @@
+import re
+from datetime import datetime
+from functools import lru_cache
+from src.preclassifier import BULK_PRECEDENCE, BULK_SENDER, URGENT_KEYWORDS
+
+# Bump whenever the prompt wording changes, so cached classifications are not reused across versions
+PROMPT_VERSION = 3
+# Body tokens per email on average; the budget is shared out by need within each request
+BODY_TOKENS_PER_EMAIL = 60
+# Every body keeps at least this much, and none gets more than MAX_BODY_TOKENS
+MIN_BODY_TOKENS = 16
+MAX_BODY_TOKENS = 250
+# No token spans more than this many characters with its whitespace, so nothing past
+# MAX_BODY_TOKENS * SCAN_CHARS_PER_TOKEN can reach the prompt and it is never scanned
+SCAN_CHARS_PER_TOKEN = 8
+# How much of a body is searched for signals of need; requests and dates come early
+NEED_SCAN_CHARS = 500
+# Body lines at least this long that repeat within one request (legal footers, banners) are sent once
+REPEATED_LINE_CHARS = 60
+
+# Gemini's SentencePiece vocabulary covers most short words whole and splits longer ones
+# roughly every four characters; punctuation marks are tokens of their own
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+# Lines quoting an earlier message, and the headers that introduce a quoted or forwarded one
+QUOTED_LINE = re.compile(r"^\s*>")
+QUOTE_HEADER = re.compile(
+    r"^\s*(On .{0,200}wrote:?|-{2,}\s*(Original|Forwarded) Message\s*-{2,}|_{10,}|From:\s.+\s+Sent:\s.+)\s*$",
+    re.I | re.M,
+)
+# Conventional signature separator and the usual mobile sign-offs
+SIGNATURE = re.compile(r"^(--\s*|Sent from my \w+.*|Get Outlook for \w+.*)$", re.I | re.M)
+# Signals that an email asks something of the reader, so its body deserves more of the budget
+REQUEST_PATTERN = re.compile(r"\?|\b(please|could you|can you|let me know|confirm|asap|by (mon|tue|wed|thu|fri|sat|sun|tomorrow|today|eod))", re.I)
+DATE_PATTERN = re.compile(
+    r"\b(\d{1,2}[:.]\d{2}\s*(am|pm)?|\d{1,2}\s*(am|pm)|\d{1,2}[/-]\d{1,2}([/-]\d{2,4})?|"
+    r"(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.? \d{1,2})\b",
+    re.I,
+)
+URGENT_PATTERN = re.compile(r"\b(" + "|".join(map(re.escape, URGENT_KEYWORDS)) + r")\b", re.I)
+
+INSTRUCTIONS = """You are an email assistant. Classify each email below and list the actions it needs.
+Preferences are ranked topics, 1 = most important. The top 3 general topics matter most, the next 5 are normal and the last 2 matter least.
+
+Rules:
+1. importance is one of: most important, important, normal, least important.
+2. Add an entry per actionable task, follow-up or reply; action_type is "task" or "calendar".
+3. An email with a deadline gets two entries: a task, and a calendar event at the deadline.
+4. If a reply is needed, set reply_needed and put a suggested reply_message in the task entry.
+5. A meeting invite that also needs a reply gets a task for the reply and a calendar event for the meeting.
+6. email_id must be copied exactly from the brackets. subject is the email's subject.
+7. Calendar entries set event_date and event_end_date as YYYY-MM-DDTHH:mm:ss±hh:mm (1 hour long if no end is given) and timezone "IST".
+"""
+
+def count_tokens(text):
+    """Approximate Gemini's token count of text without a round trip to the count_tokens API."""
+    return sum(word_tokens(word) for word in TOKEN_PATTERN.findall(text))
+
+def word_tokens(word):
+    return 1 if len(word) <= 6 else 1 + (len(word) - 3) // 4
+
+def truncate_to_tokens(text, max_tokens):
+    """Cut text after the last whole word that fits in max_tokens."""
+    used = 0
+    for match in TOKEN_PATTERN.finditer(text):
+        used += word_tokens(match.group())
+        if used > max_tokens:
+            return text[:match.start()].rstrip() + " …"
+    return text
+
+@lru_cache(maxsize=4096)
+def clean_body(body):
+    """Drop quoted reply chains, forwarded headers and signatures, and squeeze whitespace."""
+    header = QUOTE_HEADER.search(body)
+    if header and header.start() > 0:
+        body = body[:header.start()]
+    signature = SIGNATURE.search(body)
+    if signature and signature.start() > 0:
+        body = body[:signature.start()]
+    lines = (line.strip() for line in body.splitlines() if not QUOTED_LINE.match(line))
+    return re.sub(r"[ \t]+", " ", "\n".join(line for line in lines if line))
+
+def need(email, body):
+    """Relative claim of an email on the body budget."""
+    sender = email.get("sender") or ""
+    if email.get("list_unsubscribe") or (email.get("precedence") or "").lower() in BULK_PRECEDENCE or BULK_SENDER.search(sender):
+        weight = 0.25
+    else:
+        weight = 1.0
+    text = f"{email.get('subject') or ''}\n{body[:NEED_SCAN_CHARS]}"
+    if REQUEST_PATTERN.search(text):
+        weight += 1.0
+    if DATE_PATTERN.search(text) or URGENT_PATTERN.search(text):
+        weight += 1.0
+    return weight
+
+def allocate_body_tokens(sizes, weights, budget):
+    """Share budget out over bodies of the given token sizes, in proportion to their weights.
+
+    Every body gets up to MIN_BODY_TOKENS first; what is left is filled by
+    weight, and whatever a short body cannot use flows on to the others.
+    """
+    limits = [min(size, MAX_BODY_TOKENS) for size in sizes]
+    shares = [min(limit, MIN_BODY_TOKENS) for limit in limits]
+    left = budget - sum(shares)
+    open_ = [index for index, limit in enumerate(limits) if shares[index] < limit]
+    while left > 0 and open_:
+        total = sum(weights[index] for index in open_)
+        given = 0
+        for index in open_:
+            extra = min(limits[index] - shares[index], int(left * weights[index] / total))
+            shares[index] += extra
+            given += extra
+        open_ = [index for index in open_ if shares[index] < limits[index]]
+        if not given:
+            # Rounding left less than one token per body; hand out the remainder in order
+            for index in open_[:left]:
+                shares[index] += 1
+            break
+        left -= given
+    return shares
+
+def email_block(email_data):
+    """The per-request part of the prompt: the current date and the emails, bodies cut to their share of the budget."""
+    bodies = []
+    seen = set()
+    for email in email_data:
+        lines = []
+        for line in clean_body(email.get("body") or "").splitlines():
+            if len(line) >= REPEATED_LINE_CHARS:
+                if line in seen:
+                    continue
+                seen.add(line)
+            lines.append(line)
+        bodies.append("\n".join(lines)[:MAX_BODY_TOKENS * SCAN_CHARS_PER_TOKEN])
+
+    shares = allocate_body_tokens(
+        [count_tokens(body) for body in bodies],
+        [need(email, body) for email, body in zip(email_data, bodies)],
+        BODY_TOKENS_PER_EMAIL * len(email_data),
+    )
+    block = f"Current date: {datetime.now().astimezone().isoformat(timespec='minutes')}\n\nEmails:\n"
+    for email, body, share in zip(email_data, bodies, shares):
+        block += format_email(email, truncate_to_tokens(body, share))
+    return block
+
+def format_email(email, body):
+    """Render one email as a block of the classification prompt."""
+    return (
+        f"[{email.get('id', 'Unknown ID')}] From: {email.get('sender', 'Unknown Sender')} | "
+        f"Subject: {email.get('subject', 'No Subject')}\n{body}\n---\n"
+    )
+
+def email_tokens(email):
+    """Tokens an email adds to a request, counting its body at the average share."""
+    header = format_email(email, "")
+    body = clean_body(email.get("body") or "")[:BODY_TOKENS_PER_EMAIL * SCAN_CHARS_PER_TOKEN]
+    return count_tokens(header) + min(count_tokens(body), BODY_TOKENS_PER_EMAIL)
+
+def preference_line(label, preferences):
+    ranked = sorted((preferences or {}).items(), key=lambda item: item[1])
+    return f"{label}: " + "; ".join(f"{rank}. {topic}" for topic, rank in ranked) + "\n"
+
+def prompt_prefix(general_preferences, specific_preferences):
+    """The part of the prompt shared by every request of one user: instructions and ranked preferences."""
+    return (
+        INSTRUCTIONS
+        + "\nUser preferences\n"
+        + preference_line("General", general_preferences)
+        + preference_line("Specific", specific_preferences)
+    )
@@ -0,0 +1,234 @@
+import time
+import random
+import threading
+from email.utils import parsedate_to_datetime
+from googleapiclient.errors import HttpError
+from src.config import Console
+from src import metrics
+from src.storage import DEFAULT_USER
+
+console = Console()
+
+# Client-side quotas per API, in quota units per second: "rate"/"burst" cover the whole
+# app, "user_rate"/"user_burst" each user (None where the API does not meter users).
+# Gmail charges units per method (see gmail_api); the others count one unit per call.
+API_LIMITS = {
+    "gmail": {"rate": 2000, "burst": 2000, "user_rate": 250, "user_burst": 250},
+    "tasks": {"rate": 50, "burst": 50, "user_rate": 10, "user_burst": 20},
+    "calendar": {"rate": 50, "burst": 50, "user_rate": 10, "user_burst": 20},
+    "gemini": {"rate": 30, "burst": 10, "user_rate": None, "user_burst": None},
+}
+# Attempts after the first for throttled or transient failures
+MAX_RETRIES = 5
+# Exponential backoff: full jitter over BASE_DELAY * 2**attempt, capped at MAX_DELAY seconds
+BASE_DELAY = 0.5
+MAX_DELAY = 32.0
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+# Consecutive server failures that open an API's circuit, and how long it stays open
+FAILURE_THRESHOLD = 5
+RESET_TIMEOUT = 30.0
+# After a throttling error the rate halves; each success wins back this share of the configured rate
+RECOVERY_STEP = 0.05
+MIN_RATE_SHARE = 0.05
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling an API whose circuit breaker is open."""
+
+class TokenBucket:
+    """Thread-safe token bucket whose rate adapts to throttling.
+
+    acquire() reserves tokens immediately and sleeps off any deficit, so
+    concurrent callers queue fairly and never exceed the rate on average.
+    """
+
+    def __init__(self, rate, burst):
+        self.configured_rate = float(rate)
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.available = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        with self.lock:
+            now = time.monotonic()
+            self.available = min(self.burst, self.available + (now - self.updated) * self.rate)
+            self.updated = now
+            self.available -= tokens
+            wait = -self.available / self.rate if self.available < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def throttled(self):
+        with self.lock:
+            self.rate = max(self.configured_rate * MIN_RATE_SHARE, self.rate / 2)
+
+    def succeeded(self):
+        if self.rate < self.configured_rate:
+            with self.lock:
+                self.rate = min(self.configured_rate, self.rate + self.configured_rate * RECOVERY_STEP)
+
+class CircuitBreaker:
+    """Stops calling an API after repeated server failures, then lets one trial call through."""
+
+    def __init__(self, failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.state = "closed"
+        self.opened_at = 0.0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half-open"
+                return True
+            return self.state == "closed"
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.state = "closed"
+
+    def record_throttled(self):
+        """A 429 proves the API is up but busy: a trial call reopens the circuit, otherwise nothing changes."""
+        with self.lock:
+            if self.state == "half-open":
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == "half-open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+_lock = threading.Lock()
+_buckets = {}
+_breakers = {}
+
+def set_limits(limits):
+    """Replace the quotas of the given APIs; a None limit disables client-side limiting for that API."""
+    with _lock:
+        for api, limit in limits.items():
+            API_LIMITS[api] = limit
+            for key in [key for key in _buckets if key[0] == api]:
+                del _buckets[key]
+
+def buckets(api, user_id=DEFAULT_USER):
+    """The app-wide and per-user buckets that apply to one API call."""
+    limit = API_LIMITS.get(api)
+    if not limit:
+        return []
+    with _lock:
+        found = []
+        for key, rate, burst in (
+            ((api, None), limit.get("rate"), limit.get("burst")),
+            ((api, user_id), limit.get("user_rate"), limit.get("user_burst")),
+        ):
+            if rate:
+                if key not in _buckets:
+                    _buckets[key] = TokenBucket(rate, burst or rate)
+                found.append(_buckets[key])
+        return found
+
+def breaker(api):
+    with _lock:
+        if api not in _breakers:
+            _breakers[api] = CircuitBreaker()
+        return _breakers[api]
+
+def acquire(api, user_id=DEFAULT_USER, cost=1):
+    """Wait until the API's quotas allow cost more units; raise CircuitOpenError if its circuit is open."""
+    if not breaker(api).allow():
+        raise CircuitOpenError(f"{api} is failing; not calling it for up to {RESET_TIMEOUT:.0f}s")
+    for bucket in buckets(api, user_id):
+        bucket.acquire(cost)
+
+def record(api, user_id=DEFAULT_USER, error=None):
+    """Feed one call's outcome to the buckets and circuit breaker; returns the error's retryable status or None."""
+    if error is None:
+        breaker(api).record_success()
+        for bucket in buckets(api, user_id):
+            bucket.succeeded()
+        return None
+
+    status = retryable_status(error)
+    if status is None:
+        # The API answered, if only to refuse this request, so a trial call closes the circuit
+        breaker(api).record_success()
+    elif status == 429:
+        breaker(api).record_throttled()
+        # Slow down the narrowest quota that applies
+        for bucket in buckets(api, user_id)[-1:]:
+            bucket.throttled()
+    elif breaker(api).record_failure():
+        metrics.increment("circuit_opened_total", api=api)
+        console.print(f"[bold red]Too many {api} failures; pausing calls for {RESET_TIMEOUT:.0f}s.[/bold red]")
+    return status
+
+def call(api, func, user_id=DEFAULT_USER, cost=1, max_retries=MAX_RETRIES):
+    """Run func() within the API's quotas, retrying throttled and transient failures with backoff."""
+    attempt = 0
+    while True:
+        acquire(api, user_id, cost)
+        try:
+            result = func()
+        except Exception as error:
+            status = record(api, user_id, error)
+            if status is None or attempt >= max_retries:
+                raise
+            delay = retry_delay(error, attempt)
+            metrics.increment("retries_total", api=api)
+            console.print(f"[bold yellow]{api} returned {status}; retrying in {delay:.1f}s.[/bold yellow]")
+            time.sleep(delay)
+            attempt += 1
+            continue
+        record(api, user_id)
+        return result
+
+def execute(api, request, user_id=DEFAULT_USER, cost=1):
+    """Execute a Google API request through call()."""
+    return call(api, request.execute, user_id, cost)
+
+def retryable_status(error):
+    """The HTTP status of a throttling or transient error, or None if retrying will not help."""
+    if error is None:
+        return None
+    if isinstance(error, HttpError):
+        status = error.resp.status
+        # Google reports some rate limits as 403 with a rateLimitExceeded reason
+        if status == 403 and b"ateLimitExceeded" in (error.content or b""):
+            return 429
+    else:
+        # google.api_core errors (raised by Gemini) carry the HTTP status as .code
+        status = getattr(error, "code", None)
+        if not isinstance(status, int):
+            return 503 if isinstance(error, (TimeoutError, ConnectionError)) else None
+    return status if status in RETRYABLE_STATUS else None
+
+def retry_delay(error, attempt):
+    """Seconds to wait before the next attempt: the server's Retry-After if given, else jittered backoff."""
+    retry_after = retry_after_seconds(error)
+    if retry_after is not None:
+        return min(MAX_DELAY, retry_after) + random.uniform(0, BASE_DELAY)
+    return random.uniform(0, min(MAX_DELAY, BASE_DELAY * 2 ** attempt))
+
+def retry_after_seconds(error):
+    resp = getattr(error, "resp", None)
+    value = resp.get("retry-after") if resp is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
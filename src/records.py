@@ -0,0 +1,83 @@
+from collections.abc import Mapping
+
+class Record(Mapping):
+    """A compact, read-only record that reads like the dict it replaces.
+
+    Fields live in __slots__, so a record has no per-instance dict, while
+    get(), [], in, iteration, ** unpacking and JSON encoding (through
+    src.codec) all work as they did on the dict.
+    """
+
+    __slots__ = ()
+    _fields = frozenset()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._fields = frozenset(cls.__slots__)
+
+    def __getitem__(self, key):
+        if key in self._fields:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self._fields else default
+
+    def __contains__(self, key):
+        return key in self._fields
+
+    def __iter__(self):
+        return iter(self.__slots__)
+
+    def __len__(self):
+        return len(self.__slots__)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(f'{name}={getattr(self, name)!r}' for name in self.__slots__)})"
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a record from a decoded JSON object, ignoring keys it has no field for."""
+        try:
+            return cls(**data)
+        except TypeError:
+            return cls(**{key: value for key, value in data.items() if key in cls._fields})
+
+class EmailRecord(Record):
+    """One fetched email, as parse_message and storage produce it."""
+
+    __slots__ = ("id", "thread_id", "internal_date", "subject", "sender", "body", "list_unsubscribe", "precedence")
+
+    def __init__(self, id, thread_id=None, internal_date=0, subject="No Subject", sender="Unknown Sender",
+                 body="", list_unsubscribe=False, precedence=""):
+        self.id = id
+        self.thread_id = thread_id
+        self.internal_date = internal_date
+        self.subject = subject
+        self.sender = sender
+        self.body = body
+        self.list_unsubscribe = list_unsubscribe
+        self.precedence = precedence
+
+class ActionRecord(Record):
+    """One validated action entry for an email; action_details stays a plain dict.
+
+    thread_id is the Gmail thread of the email, and ordinal the entry's
+    position among its thread's entries of the same action type; both are
+    set once classification has placed it (see gemini.label_actions).
+    """
+
+    __slots__ = ("email_id", "importance", "subject", "action_type", "action_details", "thread_id", "ordinal")
+
+    def __init__(self, email_id=None, importance="normal", subject="No Subject", action_type="none", action_details=None,
+                 thread_id=None, ordinal=0):
+        self.email_id = email_id
+        self.importance = importance
+        self.subject = subject
+        self.action_type = action_type
+        self.action_details = action_details if action_details is not None else {}
+        self.thread_id = thread_id
+        self.ordinal = ordinal
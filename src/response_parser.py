@@ -0,0 +1,187 @@
+import re
+import json
+from typing import Optional
+from pydantic import BaseModel, ValidationError, field_validator
+from src import codec
+from src.records import ActionRecord
+
+IMPORTANCE_LEVELS = ["most important", "important", "normal", "least important"]
+ACTION_TYPES = ["task", "calendar", "none"]
+
+class ActionDetails(BaseModel):
+    task: Optional[str] = None
+    reply_needed: Optional[bool] = False
+    reply_message: Optional[str] = None
+    event_date: Optional[str] = None
+    event_end_date: Optional[str] = None
+    timezone: Optional[str] = None
+
+class ActionEntry(BaseModel):
+    email_id: str
+    importance: str
+    subject: str = "No Subject"
+    action_type: str
+    action_details: ActionDetails = ActionDetails()
+
+    @field_validator("importance")
+    @classmethod
+    def check_importance(cls, value):
+        value = value.strip().lower()
+        if value not in IMPORTANCE_LEVELS:
+            raise ValueError(f"importance must be one of {IMPORTANCE_LEVELS}")
+        return value
+
+    @field_validator("action_type")
+    @classmethod
+    def check_action_type(cls, value):
+        # The model sometimes echoes the importance here; such entries carry no action
+        value = value.strip().lower()
+        return value if value in ACTION_TYPES else "none"
+
+# Schemas handed to Gemini's JSON mode so it returns exactly these shapes; they mirror
+# the models above in the OpenAPI subset Gemini accepts (no defaults)
+ACTION_LIST_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "email_id": {"type": "string"},
+            "importance": {"type": "string", "enum": IMPORTANCE_LEVELS},
+            "subject": {"type": "string"},
+            "action_type": {"type": "string", "enum": ACTION_TYPES},
+            "action_details": {
+                "type": "object",
+                "properties": {
+                    "task": {"type": "string", "nullable": True},
+                    "reply_needed": {"type": "boolean"},
+                    "reply_message": {"type": "string", "nullable": True},
+                    "event_date": {"type": "string", "nullable": True},
+                    "event_end_date": {"type": "string", "nullable": True},
+                    "timezone": {"type": "string", "nullable": True},
+                },
+            },
+        },
+        "required": ["email_id", "importance", "action_type", "action_details"],
+    },
+}
+STRING_LIST_SCHEMA = {"type": "array", "items": {"type": "string"}}
+
+def strip_code_fence(text):
+    """Remove a surrounding ```json ... ``` fence, if any."""
+    text = (text or "").strip()
+    match = re.match(r"^```[a-zA-Z]*\s*\n?(.*?)\n?```$", text, re.S)
+    return match.group(1).strip() if match else text
+
+def salvage_json_array(text):
+    """Parse a JSON array, recovering every complete element from a truncated or broken one.
+
+    Returns a list of decoded elements; elements that do not parse are skipped.
+    """
+    text = strip_code_fence(text)
+    start = text.find("[")
+    if start == -1:
+        return []
+    try:
+        data = codec.loads(text[start:text.rfind("]") + 1])
+        if isinstance(data, list):
+            return data
+    except ValueError:
+        pass
+
+    # Walk the array element by element, resynchronising after anything unparsable
+    decoder = json.JSONDecoder()
+    items = []
+    position = start + 1
+    while position < len(text):
+        while position < len(text) and text[position] in " \t\r\n,":
+            position += 1
+        if position >= len(text) or text[position] == "]":
+            break
+        try:
+            item, position = decoder.raw_decode(text, position)
+            items.append(item)
+        except json.JSONDecodeError:
+            next_object = text.find("{", position + 1)
+            if next_object == -1:
+                break
+            position = next_object
+    return items
+
+class JsonArrayStream:
+    """Split a JSON array arriving in pieces into its object elements as each one closes.
+
+    Text before the opening bracket (such as a code fence) is skipped, and
+    elements that turn out not to be valid JSON are dropped.
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.current = []
+        self.in_string = False
+        self.escape = False
+
+    def feed(self, text):
+        """Consume the next piece of text and return the elements it completed."""
+        items = []
+        for char in text:
+            if self.depth == 0:
+                if char == "[":
+                    self.depth = 1
+                continue
+            if self.depth == 1:
+                # Between elements: wait for the next object or the end of the array
+                if char == "{":
+                    self.current = [char]
+                    self.depth = 2
+                elif char == "]":
+                    self.depth = 0
+                continue
+
+            self.current.append(char)
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == "\\":
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in "{[":
+                self.depth += 1
+            elif char in "}]":
+                self.depth -= 1
+                if self.depth == 1:
+                    try:
+                        items.append(codec.loads("".join(self.current)))
+                    except ValueError:
+                        pass
+                    self.current = []
+        return items
+
+def validate_action_entry(item):
+    """Return an action entry as a normalized ActionRecord, or None if it is invalid."""
+    try:
+        return ActionRecord(**ActionEntry.model_validate(item).model_dump())
+    except ValidationError:
+        return None
+
+def parse_action_entries(text):
+    """Validate the action entries in a model response, keeping every valid one.
+
+    Returns (entries, rejected) where entries are ActionRecords and rejected
+    counts the items that failed validation.
+    """
+    entries = []
+    rejected = 0
+    for item in salvage_json_array(text):
+        entry = validate_action_entry(item)
+        if entry is None:
+            rejected += 1
+        else:
+            entries.append(entry)
+    return entries, rejected
+
+def parse_string_list(text):
+    """Return the strings in a model response's JSON array."""
+    return [item.strip() for item in salvage_json_array(text) if isinstance(item, str) and item.strip()]
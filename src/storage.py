@@ -0,0 +1,377 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+from src import codec
+from src.records import ActionRecord, EmailRecord
+
+DATABASE_FILE = os.path.join("docs", "organize.db")
+DEFAULT_USER = "default"
+# Single-user files from before the database; imported once for the default user
+LEGACY_FILES = {
+    "emails": os.path.join("docs", "emails.json"),
+    "general": os.path.join("docs", "general_preferences.json"),
+    "specific": os.path.join("docs", "specific_preferences.json"),
+    "actions": os.path.join("docs", "categorized_emails_and_tasks.json"),
+    "token": os.path.join("auth", "token.json"),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS emails (
+    user_id TEXT NOT NULL,
+    email_id TEXT NOT NULL,
+    thread_id TEXT,
+    internal_date INTEGER,
+    subject TEXT,
+    sender TEXT,
+    body TEXT,
+    list_unsubscribe INTEGER NOT NULL DEFAULT 0,
+    precedence TEXT,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (user_id, email_id)
+);
+CREATE INDEX IF NOT EXISTS emails_by_fetch ON emails (user_id, fetched_at);
+
+CREATE TABLE IF NOT EXISTS preferences (
+    user_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    rank INTEGER NOT NULL,
+    PRIMARY KEY (user_id, kind, topic)
+);
+
+CREATE TABLE IF NOT EXISTS classifications (
+    user_id TEXT NOT NULL,
+    email_id TEXT NOT NULL,
+    actions TEXT NOT NULL,
+    classified_at REAL NOT NULL,
+    PRIMARY KEY (user_id, email_id)
+);
+CREATE INDEX IF NOT EXISTS classifications_by_run ON classifications (user_id, classified_at);
+
+CREATE TABLE IF NOT EXISTS classification_cache (
+    user_id TEXT NOT NULL,
+    cache_key TEXT NOT NULL,
+    actions TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (user_id, cache_key)
+);
+CREATE INDEX IF NOT EXISTS classification_cache_by_age ON classification_cache (user_id, created_at);
+
+CREATE TABLE IF NOT EXISTS synced_items (
+    user_id TEXT NOT NULL,
+    email_id TEXT NOT NULL,
+    action_type TEXT NOT NULL,
+    item_key TEXT NOT NULL,
+    google_id TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (user_id, email_id, action_type, item_key)
+);
+
+CREATE TABLE IF NOT EXISTS sync_state (
+    user_id TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT,
+    PRIMARY KEY (user_id, key)
+);
+
+CREATE TABLE IF NOT EXISTS credentials (
+    user_id TEXT PRIMARY KEY,
+    token TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS topic_suggestions (
+    cache_key TEXT PRIMARY KEY,
+    topics TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS topic_requests (
+    cache_key TEXT PRIMARY KEY,
+    top_preferences TEXT NOT NULL,
+    count INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS topic_requests_by_count ON topic_requests (count);
+"""
+# Columns added after a table was first created, added in place to older databases
+ADDED_COLUMNS = {
+    "emails": {"internal_date": "INTEGER"},
+}
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = set()
+
+@contextmanager
+def transaction():
+    """Yield this thread's connection inside a transaction that commits on success."""
+    connection = _connection()
+    with connection:
+        yield connection
+
+def _connection():
+    # One connection per thread and database file, opened lazily
+    path = DATABASE_FILE
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    connection = connections.get(path)
+    if connection is None:
+        connection = sqlite3.connect(path, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        _ensure_schema(connection, path)
+        connections[path] = connection
+    return connection
+
+def _ensure_schema(connection, path):
+    with _schema_lock:
+        if path in _schema_ready:
+            return
+        is_new = connection.execute("SELECT name FROM sqlite_master WHERE name = 'emails'").fetchone() is None
+        connection.executescript(SCHEMA)
+        for table, columns in ADDED_COLUMNS.items():
+            existing = {row[1] for row in connection.execute(f"PRAGMA table_info({table})")}
+            for column, kind in columns.items():
+                if column not in existing:
+                    connection.execute(f"ALTER TABLE {table} ADD COLUMN {column} {kind}")
+        if is_new:
+            _import_legacy_files(connection)
+        connection.commit()
+        _schema_ready.add(path)
+
+def _import_legacy_files(connection):
+    """Carry the single-user docs/*.json state over to the default user."""
+    def load(path):
+        try:
+            with open(path, "r", encoding="utf-8") as json_file:
+                return json.load(json_file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    now = time.time()
+    emails = load(LEGACY_FILES["emails"]) or []
+    _upsert_emails(connection, DEFAULT_USER, emails, now)
+    for kind in ("general", "specific"):
+        _replace_preferences(connection, DEFAULT_USER, kind, load(LEGACY_FILES[kind]) or {})
+    _upsert_classifications(connection, DEFAULT_USER, group_actions(load(LEGACY_FILES["actions"]) or []), now)
+    if os.path.exists(LEGACY_FILES["token"]):
+        with open(LEGACY_FILES["token"], "r") as token:
+            _save_token(connection, DEFAULT_USER, token.read())
+
+# Emails
+
+def upsert_emails(user_id, emails, fetched_at=None):
+    """Insert or update emails from one fetch; they become the user's latest batch."""
+    with transaction() as connection:
+        _upsert_emails(connection, user_id, emails, fetched_at or time.time())
+
+def _upsert_emails(connection, user_id, emails, fetched_at):
+    connection.executemany(
+        """
+        INSERT INTO emails (user_id, email_id, thread_id, internal_date, subject, sender, body, list_unsubscribe, precedence, fetched_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (user_id, email_id) DO UPDATE SET
+            thread_id = excluded.thread_id,
+            internal_date = excluded.internal_date,
+            subject = excluded.subject,
+            sender = excluded.sender,
+            body = excluded.body,
+            list_unsubscribe = excluded.list_unsubscribe,
+            precedence = excluded.precedence,
+            fetched_at = excluded.fetched_at
+        """,
+        [
+            (
+                user_id,
+                email["id"],
+                email.get("thread_id"),
+                email.get("internal_date"),
+                email.get("subject"),
+                email.get("sender"),
+                email.get("body"),
+                int(bool(email.get("list_unsubscribe"))),
+                email.get("precedence"),
+                fetched_at,
+            )
+            for email in emails
+        ],
+    )
+
+def get_latest_emails(user_id):
+    """The emails stored by the user's most recent fetch."""
+    with transaction() as connection:
+        rows = connection.execute(
+            """
+            SELECT email_id, thread_id, internal_date, subject, sender, body, list_unsubscribe, precedence FROM emails
+            WHERE user_id = ? AND fetched_at = (SELECT MAX(fetched_at) FROM emails WHERE user_id = ?)
+            ORDER BY rowid
+            """,
+            (user_id, user_id),
+        ).fetchall()
+    return [
+        EmailRecord(email_id, thread_id, internal_date, subject, sender, body, bool(list_unsubscribe), precedence)
+        for email_id, thread_id, internal_date, subject, sender, body, list_unsubscribe, precedence in rows
+    ]
+
+# Preferences
+
+def get_preferences(user_id, kind):
+    """A user's {topic: rank} preferences of one kind ("general" or "specific")."""
+    with transaction() as connection:
+        rows = connection.execute(
+            "SELECT topic, rank FROM preferences WHERE user_id = ? AND kind = ? ORDER BY rank",
+            (user_id, kind),
+        ).fetchall()
+    return dict(rows)
+
+def save_preferences(user_id, kind, preferences):
+    """Replace a user's preferences of one kind."""
+    with transaction() as connection:
+        _replace_preferences(connection, user_id, kind, preferences)
+
+def _replace_preferences(connection, user_id, kind, preferences):
+    connection.execute("DELETE FROM preferences WHERE user_id = ? AND kind = ?", (user_id, kind))
+    connection.executemany(
+        "INSERT INTO preferences (user_id, kind, topic, rank) VALUES (?, ?, ?, ?)",
+        [(user_id, kind, topic, rank) for topic, rank in preferences.items()],
+    )
+
+# Classifications
+
+def group_actions(actions):
+    """Group action entries by the email they belong to, keeping their order."""
+    grouped = {}
+    for entry in actions:
+        grouped.setdefault(entry.get("email_id") or "", []).append(entry)
+    return grouped
+
+def save_classifications(user_id, actions_by_email, classified_at=None):
+    """Upsert the action entries of each classified email; one run shares one timestamp."""
+    with transaction() as connection:
+        _upsert_classifications(connection, user_id, actions_by_email, classified_at or time.time())
+
+def _upsert_classifications(connection, user_id, actions_by_email, classified_at):
+    connection.executemany(
+        """
+        INSERT INTO classifications (user_id, email_id, actions, classified_at) VALUES (?, ?, ?, ?)
+        ON CONFLICT (user_id, email_id) DO UPDATE SET
+            actions = excluded.actions,
+            classified_at = excluded.classified_at
+        """,
+        [
+            (user_id, email_id, codec.dumps(actions), classified_at)
+            for email_id, actions in actions_by_email.items()
+        ],
+    )
+
+def get_latest_actions(user_id):
+    """The action entries produced by the user's most recent classification run."""
+    with transaction() as connection:
+        rows = connection.execute(
+            """
+            SELECT actions FROM classifications
+            WHERE user_id = ? AND classified_at = (SELECT MAX(classified_at) FROM classifications WHERE user_id = ?)
+            ORDER BY rowid
+            """,
+            (user_id, user_id),
+        ).fetchall()
+    return [ActionRecord.from_dict(entry) for (actions,) in rows for entry in codec.loads(actions)]
+
+# Sync state
+
+def get_sync_state(user_id, key, default=None):
+    """Read one piece of a user's sync state."""
+    with transaction() as connection:
+        row = connection.execute(
+            "SELECT value FROM sync_state WHERE user_id = ? AND key = ?", (user_id, key)
+        ).fetchone()
+    return default if row is None else codec.loads(row[0])
+
+def get_sync_states(key):
+    """One piece of sync state for every user that has it, as {user_id: value}."""
+    with transaction() as connection:
+        rows = connection.execute("SELECT user_id, value FROM sync_state WHERE key = ?", (key,)).fetchall()
+    return {user_id: codec.loads(value) for user_id, value in rows}
+
+def delete_sync_state(user_id, key):
+    """Forget one piece of a user's sync state."""
+    with transaction() as connection:
+        connection.execute("DELETE FROM sync_state WHERE user_id = ? AND key = ?", (user_id, key))
+
+def set_sync_state(user_id, key, value):
+    """Write one piece of a user's sync state."""
+    with transaction() as connection:
+        connection.execute(
+            """
+            INSERT INTO sync_state (user_id, key, value) VALUES (?, ?, ?)
+            ON CONFLICT (user_id, key) DO UPDATE SET value = excluded.value
+            """,
+            (user_id, key, codec.dumps(value)),
+        )
+
+# Credentials
+
+def get_token(user_id):
+    """A user's stored OAuth token JSON, or None."""
+    with transaction() as connection:
+        row = connection.execute("SELECT token FROM credentials WHERE user_id = ?", (user_id,)).fetchone()
+    return None if row is None else row[0]
+
+def save_token(user_id, token):
+    """Store a user's OAuth token JSON."""
+    with transaction() as connection:
+        _save_token(connection, user_id, token)
+
+def _save_token(connection, user_id, token):
+    connection.execute(
+        """
+        INSERT INTO credentials (user_id, token, updated_at) VALUES (?, ?, ?)
+        ON CONFLICT (user_id) DO UPDATE SET token = excluded.token, updated_at = excluded.updated_at
+        """,
+        (user_id, token, time.time()),
+    )
+
+# Specific-topic suggestions, shared by every user
+
+def get_topic_suggestions(cache_key):
+    """The suggestions stored under a topic cache key and when they were made, as (topics, created_at), or None."""
+    with transaction() as connection:
+        row = connection.execute(
+            "SELECT topics, created_at FROM topic_suggestions WHERE cache_key = ?", (cache_key,)
+        ).fetchone()
+    return None if row is None else (codec.loads(row[0]), row[1])
+
+def save_topic_suggestions(cache_key, topics, created_at=None):
+    """Store the suggestions for a topic cache key, replacing older ones."""
+    with transaction() as connection:
+        connection.execute(
+            """
+            INSERT INTO topic_suggestions (cache_key, topics, created_at) VALUES (?, ?, ?)
+            ON CONFLICT (cache_key) DO UPDATE SET topics = excluded.topics, created_at = excluded.created_at
+            """,
+            (cache_key, codec.dumps(topics), created_at or time.time()),
+        )
+
+def count_topic_request(cache_key, top_preferences):
+    """Count one request for a combination of top preferences."""
+    with transaction() as connection:
+        connection.execute(
+            """
+            INSERT INTO topic_requests (cache_key, top_preferences, count) VALUES (?, ?, 1)
+            ON CONFLICT (cache_key) DO UPDATE SET count = count + 1
+            """,
+            (cache_key, codec.dumps(list(top_preferences))),
+        )
+
+def most_requested_topics(limit):
+    """The top-preference lists requested most often, most popular first."""
+    with transaction() as connection:
+        rows = connection.execute(
+            "SELECT top_preferences FROM topic_requests ORDER BY count DESC LIMIT ?", (limit,)
+        ).fetchall()
+    return [codec.loads(top_preferences) for (top_preferences,) in rows]
@@ -0,0 +1,92 @@
+import re
+import json
+import time
+import hashlib
+from src.storage import DEFAULT_USER, transaction
+
+# Reply and forward markers that replies add to a thread's subject
+REPLY_PREFIX = re.compile(r"^((re|fwd?|aw|sv)\s*:\s*)+")
+
+def normalize(text):
+    """Lowercase and collapse whitespace so cosmetic differences map to the same key."""
+    return re.sub(r"\s+", " ", (text or "").strip().lower())
+
+def source_id(entry):
+    """What an entry's tasks and events belong to: its Gmail thread, or its email if it has none.
+
+    A thread's id is the id of its first message, so a single email is
+    indexed under its own id either way, and its thread's later replies
+    find what it created.
+    """
+    return entry.get("thread_id") or entry.get("email_id") or ""
+
+def item_key(entry):
+    """Identity of an action entry within its thread and action type: its subject, less reply markers, and ordinal.
+
+    Every entry of an email carries the email's subject, so the ordinal
+    tells one email's tasks apart. Neither changes when a new classification
+    rewords the task or moves the event, or a reply becomes the thread's
+    representative, so those become patches.
+    """
+    return f"{REPLY_PREFIX.sub('', normalize(entry.get('subject')))}#{entry.get('ordinal') or 0}"
+
+def content_hash(body):
+    """Fingerprint of the resource body sent to Google."""
+    return hashlib.sha256(json.dumps(body, sort_keys=True).encode("utf-8")).hexdigest()
+
+def plan(entries, bodies, user_id=DEFAULT_USER):
+    """Split a user's entries into inserts, patches and unchanged items using the index.
+
+    Returns a list of (action, google_id) pairs parallel to entries, where
+    action is "insert", "patch", "unchanged" or "duplicate"; an entry with
+    the same identity as an earlier one in entries is a "duplicate" and
+    must not be written. The index's email_id column holds source_id().
+    """
+    plans = []
+    seen = set()
+    with transaction() as connection:
+        for entry, body in zip(entries, bodies):
+            identity = (source_id(entry), entry.get("action_type") or "", item_key(entry))
+            if identity in seen:
+                plans.append(("duplicate", None))
+                continue
+            seen.add(identity)
+            row = connection.execute(
+                "SELECT google_id, content_hash FROM synced_items"
+                " WHERE user_id = ? AND email_id = ? AND action_type = ? AND item_key = ?",
+                (user_id,) + identity,
+            ).fetchone()
+            if row is None:
+                plans.append(("insert", None))
+            elif row[1] == content_hash(body):
+                plans.append(("unchanged", row[0]))
+            else:
+                plans.append(("patch", row[0]))
+    return plans
+
+def record(items, user_id=DEFAULT_USER):
+    """Remember that a user's (entry, body, google_id) items now exist in Google with these bodies."""
+    now = time.time()
+    with transaction() as connection:
+        connection.executemany(
+            """
+            INSERT INTO synced_items (user_id, email_id, action_type, item_key, google_id, content_hash, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (user_id, email_id, action_type, item_key)
+            DO UPDATE SET google_id = excluded.google_id,
+                          content_hash = excluded.content_hash,
+                          updated_at = excluded.updated_at
+            """,
+            [
+                (
+                    user_id,
+                    source_id(entry),
+                    entry.get("action_type") or "",
+                    item_key(entry),
+                    google_id,
+                    content_hash(body),
+                    now,
+                )
+                for entry, body, google_id in items
+            ],
+        )
@@ -1,73 +1,24 @@
-import os
-import json
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
-from rich.console import Console
+from src.config import Console
+from src import metrics, storage, sync_index
+from src.google_auth import get_service
+from src.google_batch import execute_in_batches
+from src.storage import DEFAULT_USER
 
 # Initialize the console for styled output
 console = Console()
 
-# Google Tasks API Scopes
-SCOPES = ['https://www.googleapis.com/auth/tasks','https://www.googleapis.com/auth/calendar']
+TASK_LIST_ID = "@default"  # Use the default task list
 
-def authenticate_google_tasks():
+def authenticate_google_tasks(user_id=DEFAULT_USER):
     """Authenticate and return the Google Tasks API service."""
-    creds = None
-    token_file = "auth/token.json"
-    credentials_file = "auth/credentials.json"
-
-    # Check if the token.json file exists
-    if os.path.exists(token_file):
-        try:
-            creds = Credentials.from_authorized_user_file(token_file, SCOPES)
-            console.print("[bold green]Loaded credentials from token.json[/bold green]")
-        except Exception as e:
-            console.print(f"[bold red]Error loading credentials from {token_file}:[/bold red] {e}")
-            creds = None
-
-    # If there are no valid credentials available, let the user log in.
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            try:
-                creds.refresh(Request())
-                console.print("[bold green]Access token refreshed successfully.[/bold green]")
-            except Exception as e:
-                console.print(f"[bold red]Error refreshing access token:[/bold red] {e}")
-                creds = None  # Force re-authentication
-        else:
-            console.print("[bold yellow]No valid credentials available. Starting authentication flow.[/bold yellow]")
-            try:
-                flow = InstalledAppFlow.from_client_secrets_file(
-                    credentials_file, SCOPES
-                )
-                creds = flow.run_local_server(
-                    port=3000, access_type='offline', prompt='consent'
-                )
-                console.print("[bold green]Authentication successful.[/bold green]")
-            except Exception as e:
-                console.print(f"[bold red]Error during authentication:[/bold red] {e}")
-                return None
-
-        # Save the credentials for the next run
-        if creds:
-            with open(token_file, "w") as token:
-                token.write(creds.to_json())
-            console.print(f"[bold green]Credentials saved to {token_file}.[/bold green]")
-
-    # Build the Google Tasks API service
     try:
-        service = build("tasks", "v1", credentials=creds)
+        return get_service("tasks", "v1", user_id)
     except Exception as e:
         console.print(f"[bold red]Error building Google Tasks service:[/bold red] {e}")
         return None
 
-    return service
-
-def add_task(service, task_data):
-    """Add a single task to Google Tasks."""
-    task_list_id = "@default"  # Use the default task list
+def build_task_body(task_data):
+    """Build the Google Tasks resource for an action entry."""
     action_details = task_data.get("action_details", {})
 
     # Build the task notes
@@ -77,45 +28,97 @@ def add_task(service, task_data):
         task_notes += f"\n\n[Reply Needed]\nSuggested Reply: {reply_message}"
 
     # Create the task body
-    task_body = {
+    return {
         "title": task_data.get("subject", "No Subject"),
         "notes": task_notes
     }
 
-    try:
-        service.tasks().insert(tasklist=task_list_id, body=task_body).execute()
-        console.print(f"[bold green]Task added:[/bold green] {task_body['title']}")
-    except Exception as e:
-        console.print(f"[bold red]Failed to add task:[/bold red] {task_body['title']} - {e}")
+@metrics.timed("sync_tasks")
+def sync_tasks(service, entries, http_factory=None, user_id=DEFAULT_USER):
+    """Create or update tasks for action entries without ever duplicating them.
+
+    The local sync index maps each entry to the task created for it on an
+    earlier run: unchanged entries are skipped, changed ones are patched and
+    only new ones are inserted, all through the Tasks batch endpoint.
+    Returns one {"title", "status", "ok", "id", "error"} result per entry,
+    where status is "inserted", "updated" or "unchanged", or "duplicate"
+    (not ok, nothing written) for a repeat of an earlier entry.
+    """
+    task_bodies = [build_task_body(entry) for entry in entries]
+    plans = sync_index.plan(entries, task_bodies, user_id)
+
+    requests = []
+    for index, (task_body, (action, task_id)) in enumerate(zip(task_bodies, plans)):
+        if action == "insert":
+            requests.append((str(index), service.tasks().insert(tasklist=TASK_LIST_ID, body=task_body)))
+        elif action == "patch":
+            requests.append((str(index), service.tasks().patch(tasklist=TASK_LIST_ID, task=task_id, body=task_body)))
+    metrics.increment("api_calls_total", len(requests), api="tasks")
+    outcomes = {
+        int(result["id"]): result
+        for result in execute_in_batches(service, requests, http_factory=http_factory, api="tasks", user_id=user_id)
+    }
 
-def get_tasks():
-    """Load tasks from JSON and add them to Google Tasks."""
-    # Path to the JSON file
-    json_file = "docs/categorized_emails_and_tasks.json"
+    results = []
+    synced = []
+    for index, (entry, task_body, (action, task_id)) in enumerate(zip(entries, task_bodies, plans)):
+        if action == "duplicate":
+            # Written once for the earlier entry; this one is not a success of its own
+            results.append({
+                "title": task_body["title"],
+                "status": "duplicate",
+                "ok": False,
+                "id": None,
+                "error": "Same task as an earlier entry of this batch.",
+            })
+            continue
+        if action == "unchanged":
+            results.append({"title": task_body["title"], "status": "unchanged", "ok": True, "id": task_id, "error": None})
+            continue
+        outcome = outcomes[index]
+        task_id = (outcome["response"] or {}).get("id", task_id)
+        status = "inserted" if action == "insert" else "updated"
+        results.append({
+            "title": task_body["title"],
+            "status": status,
+            "ok": outcome["ok"],
+            "id": task_id,
+            "error": outcome["error"],
+        })
+        if outcome["ok"]:
+            synced.append((entry, task_body, task_id))
+            console.print(f"[bold green]Task {status}:[/bold green] {task_body['title']}")
+        else:
+            metrics.increment("api_errors_total", api="tasks")
+            console.print(f"[bold red]Failed to add task:[/bold red] {task_body['title']} - {outcome['error']}")
+    sync_index.record(synced, user_id)
+    return results
 
-    # Load the JSON data
-    try:
-        with open(json_file, "r", encoding="utf-8") as file:
-            data = json.load(file)
-        console.print("[bold green]Loaded tasks from JSON file.[/bold green]")
-    except FileNotFoundError:
-        console.print(f"[bold red]Error:[/bold red] The file '{json_file}' was not found.")
-        return
-    except json.JSONDecodeError as e:
-        console.print(f"[bold red]Error parsing JSON file:[/bold red] {e}")
-        return
+def get_tasks(user_id=DEFAULT_USER):
+    """Load a user's latest actions from storage and add them to Google Tasks."""
+    data = storage.get_latest_actions(user_id)
+    console.print(f"[bold green]Loaded {len(data)} actions from storage.[/bold green]")
 
     # Authenticate with Google Tasks API
-    service = authenticate_google_tasks()
+    service = authenticate_google_tasks(user_id)
     if service is None:
         console.print("[bold red]Failed to authenticate with Google Tasks API.[/bold red]")
         return
 
     # Process only tasks with specified importance
-    for entry in data:
-        if entry.get("action_type") == "task":
-            importance = entry.get("importance", "").lower()
-            if importance in ["important", "most important"]:
-                add_task(service, entry)
+    results = sync_tasks(service, [entry for entry in data if is_task_entry(entry)], user_id=user_id)
+    counts = {status: sum(result["ok"] and result["status"] == status for result in results) for status in ("inserted", "updated", "unchanged")}
+    console.print(
+        f"[bold green]Tasks: {counts['inserted']} added, {counts['updated']} updated, {counts['unchanged']} unchanged "
+        f"of {len(results)}.[/bold green]"
+    )
+    return results
+
+def is_task_entry(entry):
+    """Whether an action entry should become a Google Task."""
+    if entry.get("action_type") != "task":
+        return False
+    importance = (entry.get("importance") or "").lower()
+    return importance in ["important", "most important"]
 
 
@@ -0,0 +1,73 @@
+from src.prompt_builder import clean_body
+from src.response_parser import IMPORTANCE_LEVELS
+
+# Earlier messages summarized under a thread's latest one, newest first
+MAX_DIGEST_MESSAGES = 5
+# Characters of each earlier message kept in the digest
+DIGEST_CHARS = 160
+
+def collapse_threads(email_data):
+    """Fold every thread into one representative email before classification.
+
+    A thread is represented by its latest message, with quoted history
+    stripped and a short digest of the earlier messages appended, at the
+    position of the thread's first email. Returns (representatives,
+    members) where members maps a representative's id to the other emails
+    of its thread; single-message threads have no entry.
+    """
+    threads = {}
+    for email in email_data:
+        threads.setdefault(email.get("thread_id") or email.get("id"), []).append(email)
+
+    representatives = []
+    members = {}
+    for thread in threads.values():
+        if len(thread) == 1:
+            representatives.append(thread[0])
+            continue
+        # Gmail lists newest first, so without dates the first message counts as the latest
+        latest = max(thread, key=lambda email: email.get("internal_date") or 0)
+        earlier = sorted(
+            (email for email in thread if email is not latest),
+            key=lambda email: email.get("internal_date") or 0,
+            reverse=True,
+        )
+        representatives.append({**latest, "body": clean_body(latest.get("body") or "") + digest(earlier)})
+        members[latest["id"]] = earlier
+    return representatives, members
+
+def digest(earlier):
+    """One line per earlier message of a thread: who wrote it and how it starts."""
+    lines = []
+    for email in earlier[:MAX_DIGEST_MESSAGES]:
+        text = " ".join(clean_body(email.get("body") or "").split())
+        if len(text) > DIGEST_CHARS:
+            text = text[:DIGEST_CHARS].rsplit(" ", 1)[0] + " …"
+        lines.append(f"- {email.get('sender', 'Unknown Sender')}: {text}")
+    if len(earlier) > MAX_DIGEST_MESSAGES:
+        lines.append(f"- and {len(earlier) - MAX_DIGEST_MESSAGES} earlier message(s)")
+    return f"\n\nEarlier in this thread ({len(earlier)} message(s)):\n" + "\n".join(lines)
+
+def member_actions(actions, earlier):
+    """Map a representative's answer back to the rest of its thread.
+
+    Each earlier message gets one entry of the thread's importance and no
+    action, so the thread's tasks and events are only created once.
+    """
+    if not actions:
+        return []
+    importance = min(
+        (entry.get("importance") for entry in actions if entry.get("importance") in IMPORTANCE_LEVELS),
+        key=IMPORTANCE_LEVELS.index,
+        default="normal",
+    )
+    return [
+        {
+            "email_id": email.get("id"),
+            "importance": importance,
+            "subject": email.get("subject", "No Subject"),
+            "action_type": "none",
+            "action_details": {},
+        }
+        for email in earlier
+    ]
@@ -0,0 +1,91 @@
+import json
+import time
+import argparse
+import threading
+from collections import OrderedDict
+from src import storage
+from src.config import Console
+
+console = Console()
+
+# Suggestions are regenerated after this long
+TTL_SECONDS = 30 * 24 * 60 * 60
+# Entries kept in memory; everything also lives in the database, shared with other workers
+MEMORY_ENTRIES = 128
+# Combinations refreshed by a warm-up run unless told otherwise
+WARM_UP_LIMIT = 20
+
+_memory = OrderedDict()
+_lock = threading.Lock()
+
+def cache_key(top_preferences, model_name):
+    """Normalized key: the ranked, case- and whitespace-insensitive preferences plus the model."""
+    normalized = [" ".join(topic.split()).lower() for topic in top_preferences]
+    return json.dumps([model_name] + normalized)
+
+def get(top_preferences, model_name):
+    """Return cached suggestions for these preferences, or None on a miss or expired entry.
+
+    Every request, hit or miss, is counted in storage, so warm-up ranks
+    combinations by how often they are asked for.
+    """
+    key = cache_key(top_preferences, model_name)
+    storage.count_topic_request(key, top_preferences)
+    with _lock:
+        entry = _memory.get(key)
+    if entry is None:
+        entry = storage.get_topic_suggestions(key)
+    if entry is None or time.time() - entry[1] > TTL_SECONDS:
+        return None
+    with _lock:
+        _remember(key, entry)
+    return entry[0]
+
+def put(top_preferences, model_name, specific_topics):
+    """Store suggestions in memory and in the database."""
+    key = cache_key(top_preferences, model_name)
+    entry = (specific_topics, time.time())
+    storage.save_topic_suggestions(key, specific_topics, entry[1])
+    with _lock:
+        _remember(key, entry)
+
+def most_requested(limit=WARM_UP_LIMIT):
+    """The top-preference lists requested most often, most popular first."""
+    return storage.most_requested_topics(limit)
+
+def warm_up(limit=WARM_UP_LIMIT, refresh_before=TTL_SECONDS / 10):
+    """Precompute suggestions for the most requested combinations and the default ranking.
+
+    Entries that are missing or due to expire within refresh_before seconds
+    are regenerated; returns the number of Gemini calls made.
+    """
+    from src.preferences_api import MODEL_NAME, generate_specific_topics, topics
+
+    combinations = most_requested(limit)
+    if topics[:5] not in combinations:
+        combinations.append(topics[:5])
+
+    generated = 0
+    for top_preferences in combinations:
+        entry = storage.get_topic_suggestions(cache_key(top_preferences, MODEL_NAME))
+        if entry is not None and time.time() - entry[1] < TTL_SECONDS - refresh_before:
+            continue
+        specific_topics = generate_specific_topics(top_preferences)
+        if specific_topics:
+            put(top_preferences, MODEL_NAME, specific_topics)
+            generated += 1
+            console.print(f"[bold green]Warmed:[/bold green] {', '.join(top_preferences)}")
+    return generated
+
+def _remember(key, entry):
+    _memory[key] = entry
+    _memory.move_to_end(key)
+    while len(_memory) > MEMORY_ENTRIES:
+        _memory.popitem(last=False)
+
+if __name__ == "__main__":
+    # Usage, from the repository root: python -m src.topic_cache --limit 20
+    parser = argparse.ArgumentParser(description="Precompute specific-topic suggestions.")
+    parser.add_argument("--limit", type=int, default=WARM_UP_LIMIT, help="number of popular combinations to warm")
+    args = parser.parse_args()
+    console.print(f"[bold green]Generated {warm_up(args.limit)} suggestion list(s).[/bold green]")